@@ -0,0 +1,252 @@
+import contextlib
+import csv
+import itertools
+import json
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from typing import Dict, List, Optional
+
+from assignment import constants, export
+from assignment.config import RoutingConfig
+from assignment.routes import Route
+from assignment.spatial import calculate_route_length
+from assignment.stops import StopTable
+
+logger = logging.getLogger(__name__)
+
+RECORD_FIELDS = [
+    "scenario",
+    "n_deliveries",
+    "n_pickups",
+    "seed",
+    "van_capacity",
+    "depots",
+    "n_chosen_deliveries",
+    "chosen_delivery_ids",
+    "chosen_pickup_x",
+    "chosen_pickup_y",
+    "chosen_pickup_size",
+    "route_length",
+    "load_seconds",
+    "plan_seconds",
+    "total_seconds",
+]
+
+
+def load_scenarios(path: str) -> List[Dict]:
+    """
+    Reads a JSON scenario grid and expands it into single scenarios.
+    The grid has lists of values for n_deliveries, n_pickups, seeds and capacities
+    and a list of depot lists under depots, every combination of them is one scenario.
+    Missing lists use the Route defaults.
+
+    Example:
+        {"n_deliveries": [1000, 10000], "seeds": [1, 2], "depots": [[[0, 0], [500, 500]]]}
+
+    Args:
+        path (str): path to the JSON file
+
+    Returns:
+        List[Dict]: scenarios with n_deliveries, n_pickups, seed, van_capacity and depots
+
+    Raises:
+        ValueError: for depots that are not lists of X and Y pairs, see RoutingConfig.create
+    """
+    with open(path) as grid_file:
+        grid = json.load(grid_file)
+
+    combinations = itertools.product(
+        grid.get("n_deliveries", [1000]),
+        grid.get("n_pickups", [100]),
+        grid.get("seeds", [42]),
+        grid.get("capacities", [constants.VAN_CAPACITY]),
+        [
+            RoutingConfig.create(depots=depots).depots
+            for depots in grid.get("depots", [[constants.DEPOT_LOCATION]])
+        ],
+    )
+    return [
+        {
+            "scenario": i,
+            "n_deliveries": n_deliveries,
+            "n_pickups": n_pickups,
+            "seed": seed,
+            "van_capacity": van_capacity,
+            "depots": depots,
+        }
+        for i, (n_deliveries, n_pickups, seed, van_capacity, depots) in enumerate(
+            combinations
+        )
+    ]
+
+
+def run_scenario(
+    scenario: Dict,
+    delivery_stops: Optional[StopTable] = None,
+    pickup_stops: Optional[StopTable] = None,
+    include_route: bool = False,
+) -> Dict:
+    """
+    Plans one scenario without plotting and summarizes the result
+
+    Args:
+        scenario (Dict): one of the scenarios from load_scenarios,
+        without depots it starts at the default depot
+        delivery_stops (StopTable, optional): already loaded delivery stops
+        of the scenario. Defaults to generating them.
+        pickup_stops (StopTable, optional): already loaded pickup stops of the scenario.
+        Defaults to generating them.
+        include_route (bool, optional): adds the route arrays and metadata
+        for export.RouteStreamWriter.write_arrays under "route". Defaults to False.
+
+    Returns:
+        Dict: result record with the fields in RECORD_FIELDS
+    """
+    start = time.perf_counter()
+    config = RoutingConfig.create(scenario["van_capacity"], scenario.get("depots"))
+    if delivery_stops is None or pickup_stops is None:
+        route = Route(
+            n_deliveries=scenario["n_deliveries"],
+            n_pickups=scenario["n_pickups"],
+            seed=scenario["seed"],
+            config=config,
+        )
+        route.load_all_stops()
+    else:
+        route = Route.from_stops(
+            delivery_stops, pickup_stops, seed=scenario["seed"], config=config
+        )
+    loaded = time.perf_counter()
+    route.plan_route()
+    planned = time.perf_counter()
+
+    pickup = route.chosen_pickup_stop
+    final_route = route.final_route if pickup else route.planned_delivery_route
+
+    record = {
+        **scenario,
+        "n_chosen_deliveries": len(route.chosen_deliveries),
+        "chosen_delivery_ids": route.chosen_deliveries.ids.tolist(),
+        "chosen_pickup_x": pickup.x if pickup else None,
+        "chosen_pickup_y": pickup.y if pickup else None,
+        "chosen_pickup_size": pickup.size if pickup else None,
+        "route_length": calculate_route_length(final_route.locations),
+        "load_seconds": loaded - start,
+        "plan_seconds": planned - loaded,
+        "total_seconds": planned - start,
+    }
+    if include_route:
+        record["route"] = (
+            export.get_route_arrays(route),
+            {"scenario": scenario["scenario"], **export.get_route_metadata(route)},
+        )
+    return record
+
+
+class RecordWriter:
+    """
+    Appends result records to a JSONL or CSV file, picked by the file extension.
+    Every record is flushed right away so finished scenarios survive a crash.
+    CSV files get lists and tuples written as space separated values
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file = open(path, "w", newline="")
+        self._csv_writer: Optional[csv.DictWriter] = None
+        if path.endswith(".csv"):
+            self._csv_writer = csv.DictWriter(self._file, fieldnames=RECORD_FIELDS)
+            self._csv_writer.writeheader()
+
+    def write(self, record: Dict):
+        if self._csv_writer is not None:
+            self._csv_writer.writerow(
+                {
+                    key: (
+                        " ".join(map(str, value))
+                        if isinstance(value, (list, tuple))
+                        else value
+                    )
+                    for key, value in record.items()
+                }
+            )
+        else:
+            self._file.write(json.dumps(record) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self) -> "RecordWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def warm_up_worker():
+    """
+    Plans a tiny route once so the worker has everything imported and initialized
+    before the first real scenario arrives
+    """
+    route = Route(n_deliveries=10, n_pickups=2)
+    route.load_all_stops()
+    route.plan_route()
+
+
+def run_batch(
+    scenarios: List[Dict],
+    output_path: str,
+    max_workers: Optional[int] = None,
+    routes_path: Optional[str] = None,
+) -> int:
+    """
+    Runs the scenarios in a pool of long-lived worker processes and streams a result
+    record to the output file as soon as each scenario completes
+
+    Args:
+        scenarios (List[Dict]): scenarios from load_scenarios
+        output_path (str): .jsonl or .csv file for the result records
+        max_workers (int, optional): number of worker processes. Defaults to the CPU count.
+        routes_path (str, optional): JSONL file the planned routes are streamed to,
+        see export.RouteStreamWriter. Defaults to not writing them.
+
+    Returns:
+        int: number of scenarios that failed
+    """
+    n_failed = 0
+    with contextlib.ExitStack() as stack:
+        writer = stack.enter_context(RecordWriter(output_path))
+        route_writer = (
+            stack.enter_context(export.RouteStreamWriter(routes_path))
+            if routes_path
+            else None
+        )
+        executor = stack.enter_context(
+            ProcessPoolExecutor(max_workers=max_workers, initializer=warm_up_worker)
+        )
+        futures = {
+            executor.submit(
+                run_scenario, scenario, include_route=route_writer is not None
+            ): scenario
+            for scenario in scenarios
+        }
+        for future in as_completed(futures):
+            scenario = futures[future]
+            try:
+                record = future.result()
+            except Exception:
+                logger.exception(f"Scenario {scenario['scenario']} failed")
+                n_failed += 1
+                continue
+
+            route = record.pop("route", None)
+            if route_writer is not None:
+                route_writer.write_arrays(*route)
+            writer.write(record)
+            logger.info(
+                f"Scenario {record['scenario']} done in {record['total_seconds']:.3f}s"
+            )
+
+    return n_failed
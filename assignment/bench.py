@@ -0,0 +1,190 @@
+import json
+import logging
+import math
+import platform
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+import numpy as np
+
+from assignment.routes import Route
+from assignment.utils import generate_stops
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_SIZES = (10**2, 10**3, 10**4, 10**5, 10**6)
+
+# Stages of Route.run in the order they are executed
+ROUTE_STAGES = ("load_all_stops", *Route.PLANNING_STAGES)
+
+# Differences below this many seconds are treated as noise when comparing with a baseline
+MIN_REGRESSION_SECONDS = 1e-3
+
+
+def get_max_coordinate(n_stops: int) -> int:
+    """
+    Smallest default-like plane that can hold n_stops distinct stops
+    """
+    return max(1000, math.isqrt(2 * n_stops) + 2)
+
+
+def time_call(function: Callable, repeats: int) -> float:
+    """
+    Best wall time of a few calls in seconds, the minimum is the least noisy estimate
+    """
+    best = math.inf
+    for _ in range(repeats):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def benchmark_size(
+    n_deliveries: int, n_pickups: int, repeats: int = 3, compact: bool = False
+) -> Dict[str, float]:
+    """
+    Times utils.generate_stops and every stage of Route.run for one instance size.
+    The stages run in their usual order and every stage is repeated on the output
+    of the previous one, the stages only overwrite their own results.
+
+    Args:
+        n_deliveries (int): number of delivery stops
+        n_pickups (int): number of pickup stops
+        repeats (int, optional): number of timed calls per stage. Defaults to 3.
+        compact (bool, optional): plans with compact dtypes, see Route.use_compact_dtypes.
+        Defaults to False.
+
+    Returns:
+        Dict[str, float]: best wall time in seconds per stage
+    """
+    max_coordinate = get_max_coordinate(max(n_deliveries, n_pickups))
+    timings = {
+        "generate_stops": time_call(
+            lambda: generate_stops(n=n_deliveries, max_coordinate=max_coordinate),
+            repeats,
+        )
+    }
+
+    route = Route(
+        n_deliveries=n_deliveries,
+        n_pickups=n_pickups,
+        max_coordinate=max_coordinate,
+        compact=compact,
+    )
+    for stage in ROUTE_STAGES:
+        timings[stage] = time_call(getattr(route, stage), repeats)
+
+    return timings
+
+
+def run_benchmarks(
+    sizes: Sequence[int] = DEFAULT_SIZES, repeats: int = 3, compact: bool = False
+) -> Dict[str, Dict[str, float]]:
+    """
+    Runs benchmark_size over a sweep of sizes, the same size is used for deliveries
+    and pickups. Logging of the routes is muted while timing.
+    compact benchmarks the compact dtype mode.
+
+    Returns:
+        Dict[str, Dict[str, float]]: stage timings by size
+    """
+    route_logger = logging.getLogger("assignment.routes")
+    previous_level = route_logger.level
+    route_logger.setLevel(logging.WARNING)
+    try:
+        results = {}
+        for size in sizes:
+            results[str(size)] = benchmark_size(
+                size, size, repeats=repeats, compact=compact
+            )
+            logger.info(f"Benchmarked n={size}: {format_timings(results[str(size)])}")
+    finally:
+        route_logger.setLevel(previous_level)
+
+    return results
+
+
+def format_timings(timings: Dict[str, float]) -> str:
+    return ", ".join(
+        f"{stage}={seconds * 1000:.2f}ms" for stage, seconds in timings.items()
+    )
+
+
+def format_speedups(
+    results: Dict[str, Dict[str, float]], compact_results: Dict[str, Dict[str, float]]
+) -> List[str]:
+    """
+    Compares the stage timings of the compact dtype mode with the default ones
+
+    Returns:
+        List[str]: one line per size and stage with both timings and the speed-up
+    """
+    lines = []
+    for size, timings in results.items():
+        for stage, seconds in timings.items():
+            compact_seconds = compact_results.get(size, {}).get(stage)
+            if compact_seconds is None:
+                continue
+            lines.append(
+                f"n={size} {stage}: {seconds * 1000:.2f}ms -> {compact_seconds * 1000:.2f}ms"
+                f" ({seconds / max(compact_seconds, 1e-9):.2f}x)"
+            )
+    return lines
+
+
+def save_baseline(results: Dict[str, Dict[str, float]], path: str):
+    """
+    Saves the benchmark results together with the environment they were measured in
+    """
+    baseline = {
+        "environment": {
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "processor": platform.processor(),
+        },
+        "results": results,
+    }
+    with open(path, "w") as baseline_file:
+        json.dump(baseline, baseline_file, indent=2)
+
+
+def load_baseline(path: str) -> Dict[str, Dict[str, float]]:
+    with open(path) as baseline_file:
+        return json.load(baseline_file)["results"]
+
+
+def find_regressions(
+    results: Dict[str, Dict[str, float]],
+    baseline: Dict[str, Dict[str, float]],
+    threshold: float = 0.2,
+    min_seconds: Optional[float] = None,
+) -> List[str]:
+    """
+    Compares the results with a baseline. A stage regressed when it got slower
+    by more than the threshold (0.2 is 20 %) and by more than min_seconds.
+    Sizes or stages missing in either of them are skipped.
+
+    Returns:
+        List[str]: description of every regression, empty if there is none
+    """
+    if min_seconds is None:
+        min_seconds = MIN_REGRESSION_SECONDS
+
+    regressions = []
+    for size, timings in results.items():
+        for stage, seconds in timings.items():
+            baseline_seconds = baseline.get(size, {}).get(stage)
+            if baseline_seconds is None:
+                continue
+            if (
+                seconds > baseline_seconds * (1 + threshold)
+                and seconds - baseline_seconds > min_seconds
+            ):
+                regressions.append(
+                    f"n={size} {stage}: {baseline_seconds * 1000:.2f}ms"
+                    f" -> {seconds * 1000:.2f}ms"
+                )
+
+    return regressions
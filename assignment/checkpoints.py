@@ -0,0 +1,287 @@
+import json
+import logging
+import os
+import zipfile
+from typing import TYPE_CHECKING, Dict, Optional
+
+import numpy as np
+
+from assignment import constants
+from assignment.distance_cache import get_key, write_atomically
+from assignment.result_cache import STOP_TABLE_COLUMNS
+from assignment.stops import StopTable
+
+if TYPE_CHECKING:
+    from assignment.routes import Route
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_FILE_SUFFIX = ".npz"
+
+# Keys of every checkpoint, next to the arrays of its stage
+INPUT_KEY = "input_key"
+OUTPUT_KEY = "output_key"
+
+
+class StageCheckpoints:
+    """
+    Keeps the output of every stage of Route.run as an .npz file in a directory,
+    so a later run can skip the stages before the one it resumes from.
+
+    The checkpoints hold as little as the next stage needs: the loaded stops,
+    the indices of the selected deliveries, the order of the route, its segments
+    and capacities and the final route. Every checkpoint records an input key,
+    a hash of the output key of the previous checkpoint and of the parameters
+    that change its stage, see get_stage_parameters, and an output key,
+    a hash of its arrays. Resuming checks both, so checkpoints of other stops,
+    other parameters or another version of the planning are refused.
+
+    Args:
+        checkpoint_dir (str): directory of the checkpoints, created if missing
+    """
+
+    def __init__(self, checkpoint_dir: str):
+        self.checkpoint_dir = checkpoint_dir
+
+        os.makedirs(checkpoint_dir, exist_ok=True)
+
+    def run(self, route: "Route", resume_from: Optional[str] = None):
+        """
+        Runs the stages of Route.RUN_STAGES on the route and writes the checkpoint
+        of each one. The stages before resume_from are read from their checkpoints
+        instead of running them, measured as the read_checkpoints stage
+
+        Raises:
+            ValueError: for an unknown stage, or a checkpoint that is missing
+            or does not match the inputs of the route
+        """
+        if resume_from is None:
+            resume_from = route.RUN_STAGES[0]
+        if resume_from not in route.RUN_STAGES:
+            raise ValueError(
+                f"Unknown stage {resume_from}, expected one of {route.RUN_STAGES}"
+            )
+
+        first_stage = route.RUN_STAGES.index(resume_from)
+        output_key = ""
+        if first_stage > 0:
+            with route.instrumentation.stage("read_checkpoints"):
+                for stage in route.RUN_STAGES[:first_stage]:
+                    output_key = self.restore(route, stage, output_key)
+            logger.info(f"Resuming from {resume_from} in {self.checkpoint_dir}")
+
+        for stage in route.RUN_STAGES[first_stage:]:
+            # loading stops from files changes the route, so the key is taken before
+            input_key = get_input_key(route, stage, output_key)
+            route.run_stage(stage)
+            with route.instrumentation.stage("write_checkpoint"):
+                output_key = self.save(route, stage, input_key)
+
+    def save(self, route: "Route", stage: str, input_key: str) -> str:
+        """
+        Writes the checkpoint of a stage that just ran
+
+        Args:
+            route (Route): route the stage ran on
+            stage (str): one of Route.RUN_STAGES
+            input_key (str): get_input_key of the stage from before it ran
+
+        Returns:
+            str: output key of the checkpoint
+        """
+        arrays = get_stage_arrays(route, stage)
+        output_key = get_output_key(arrays, input_key)
+
+        write_atomically(
+            self.get_path(route, stage),
+            lambda checkpoint_file: np.savez(
+                checkpoint_file,
+                **arrays,
+                **{INPUT_KEY: np.array(input_key), OUTPUT_KEY: np.array(output_key)},
+            ),
+        )
+        return output_key
+
+    def restore(self, route: "Route", stage: str, previous_key: str) -> str:
+        """
+        Sets the output of a stage on the route from its checkpoint
+
+        Returns:
+            str: output key of the checkpoint
+
+        Raises:
+            ValueError: if the checkpoint is missing or was made with other inputs
+        """
+        path = self.get_path(route, stage)
+        try:
+            with np.load(path) as checkpoint_file:
+                arrays = {name: checkpoint_file[name] for name in checkpoint_file.files}
+        except (FileNotFoundError, ValueError, zipfile.BadZipFile):
+            raise ValueError(f"No readable checkpoint of {stage} at {path}")
+
+        input_key = str(arrays.pop(INPUT_KEY))
+        output_key = str(arrays.pop(OUTPUT_KEY))
+        if input_key != get_input_key(route, stage, previous_key):
+            raise ValueError(
+                f"The checkpoint of {stage} at {path} was made with other inputs"
+            )
+        if output_key != get_output_key(arrays, input_key):
+            raise ValueError(f"The checkpoint of {stage} at {path} is damaged")
+
+        set_stage_arrays(route, stage, arrays)
+        return output_key
+
+    def get_path(self, route: "Route", stage: str) -> str:
+        index = route.RUN_STAGES.index(stage)
+        return os.path.join(
+            self.checkpoint_dir, f"{index:02d}_{stage}{CHECKPOINT_FILE_SUFFIX}"
+        )
+
+
+def get_input_key(route: "Route", stage: str, previous_key: str) -> str:
+    """
+    Hash of the output key of the previous stage and of the parameters of the stage
+    """
+    parameters = {
+        "version": constants.PLANNING_ALGORITHM_VERSION,
+        "stage": stage,
+        "previous": previous_key,
+        "parameters": get_stage_parameters(route, stage),
+    }
+    return get_key([], parameters=json.dumps(parameters, sort_keys=True))
+
+
+def get_output_key(arrays: Dict[str, np.ndarray], input_key: str) -> str:
+    """
+    Hash of the arrays of a checkpoint and of its input key
+    """
+    return get_key([arrays[name] for name in sorted(arrays)], parameters=input_key)
+
+
+def get_stage_parameters(route: "Route", stage: str) -> Dict:
+    """
+    Parameters of the route that change the output of a stage. Stop files are
+    identified by their path, size and modification time, not by their contents
+    """
+    if stage == "load_all_stops":
+        return {
+            "n_deliveries": route.n_deliveries,
+            "n_pickups": route.n_pickups,
+            "seed": route.seed,
+            "max_coordinate": route.max_coordinate,
+            "delivery_stops": _describe_file(route.delivery_stops_path),
+            "pickup_stops": _describe_file(route.pickup_stops_path),
+            "stop_columns": route.stop_columns or {},
+            "compact": route.compact,
+        }
+    if stage in ("choose_most_fitting_stops", "calculate_route_segment_capacities"):
+        return {"van_capacity": route.get_van_capacity()}
+    if stage == "create_route":
+        return {
+            "depots": route.config.to_dict()["depots"],
+            "metric": route.metric.key,
+            "multi_start_time_budget": route.multi_start_time_budget,
+        }
+    if stage == "improve_route":
+        return {
+            "improve_time_budget": route.improve_time_budget,
+            "metric": route.metric.key,
+        }
+    if stage == "add_pickup_stop_to_route":
+        return {"max_pickups": route.max_pickups, "metric": route.metric.key}
+    return {}
+
+
+def get_stage_arrays(route: "Route", stage: str) -> Dict[str, np.ndarray]:
+    """
+    Arrays with the output of a stage of the route
+    """
+    if stage == "load_all_stops":
+        return {
+            **_table_arrays("delivery", route.possible_delivery_stops),
+            **_table_arrays("pickup", route.pickup_stops),
+        }
+    if stage == "choose_most_fitting_stops":
+        return {
+            "chosen_delivery_indices": route.chosen_delivery_indices,
+            "route_capacity_usage": np.array(route.route_capacity_usage),
+        }
+    if stage in ("create_route", "improve_route"):
+        return {
+            "delivery_order": route.delivery_order,
+            "depot_location": np.array(route.depot_location, dtype=np.int64),
+        }
+    if stage == "get_route_segments":
+        return {"route_segments": route.route_segments}
+    if stage == "calculate_route_segment_capacities":
+        return {"segment_capacities": route.segment_capacities}
+    if stage == "add_pickup_stop_to_route":
+        return {
+            **_table_arrays("final_route", route.final_route),
+            **_table_arrays(
+                "chosen_pickups", StopTable.from_stops(route.chosen_pickup_stops)
+            ),
+        }
+    raise ValueError(f"Stage {stage} has no checkpoint")
+
+
+def set_stage_arrays(route: "Route", stage: str, arrays: Dict[str, np.ndarray]):
+    """
+    Sets the arrays from get_stage_arrays back on the route
+    """
+    if stage == "load_all_stops":
+        route.possible_delivery_stops = _array_table("delivery", arrays)
+        route.pickup_stops = _array_table("pickup", arrays)
+        route.n_deliveries = len(route.possible_delivery_stops)
+        route.n_pickups = len(route.pickup_stops)
+    elif stage == "choose_most_fitting_stops":
+        route.chosen_delivery_indices = arrays["chosen_delivery_indices"]
+        route.chosen_deliveries = route.possible_delivery_stops.take(
+            route.chosen_delivery_indices
+        )
+        route.route_capacity_usage = float(arrays["route_capacity_usage"])
+    elif stage in ("create_route", "improve_route"):
+        route.delivery_order = arrays["delivery_order"]
+        route.depot_location = tuple(arrays["depot_location"].tolist())
+        route.planned_delivery_route = StopTable.concatenate(
+            [
+                route.get_depot_stop(),
+                route.chosen_deliveries.take(route.delivery_order),
+                route.get_depot_stop(),
+            ]
+        )
+    elif stage == "get_route_segments":
+        route.route_segments = arrays["route_segments"]
+    elif stage == "calculate_route_segment_capacities":
+        route.segment_capacities = arrays["segment_capacities"]
+    elif stage == "add_pickup_stop_to_route":
+        route.final_route = _array_table("final_route", arrays)
+        route.chosen_pickup_stops = list(_array_table("chosen_pickups", arrays))
+        route.chosen_pickup_stop = (
+            route.chosen_pickup_stops[0] if route.chosen_pickup_stops else None
+        )
+    else:
+        raise ValueError(f"Stage {stage} has no checkpoint")
+
+
+def _table_arrays(prefix: str, table: StopTable) -> Dict[str, np.ndarray]:
+    return {
+        f"{prefix}_{column}": getattr(table, column) for column in STOP_TABLE_COLUMNS
+    }
+
+
+def _array_table(prefix: str, arrays: Dict[str, np.ndarray]) -> StopTable:
+    return StopTable(
+        **{column: arrays[f"{prefix}_{column}"] for column in STOP_TABLE_COLUMNS}
+    )
+
+
+def _describe_file(path: Optional[str]) -> Optional[Dict]:
+    if not path:
+        return None
+    stat = os.stat(path)
+    return {
+        "path": os.path.abspath(path),
+        "size": stat.st_size,
+        "mtime_ns": stat.st_mtime_ns,
+    }
@@ -1,33 +1,61 @@
+import asyncio
 import click
 import logging
 import sys
 
-from assignment import constants
+from assignment import bench as benchmarks
+from assignment import constants, loaders
+from assignment.batch import load_scenarios, run_batch
+from assignment.checkpoints import StageCheckpoints
+from assignment.config import RoutingConfig
+from assignment.distance_cache import DistanceCache
+from assignment.fleet import Fleet
+from assignment.instrumentation import Instrumentation
+from assignment.metrics import METRIC_NAMES, get_metric
+from assignment.result_cache import ResultCache
 from assignment.routes import Route
+from assignment.server import BATCH_WINDOW_SECONDS, serve as serve_requests
+from assignment.utils import GENERATION_BLOCK_SIZE, generate_stops_parallel
 
 
 logger = logging.getLogger(__name__)
 
 
-def _configure_logger() -> None:
+def _configure_logger(stream=sys.stdout) -> None:
     logging.basicConfig(
-        stream=sys.stdout,
+        stream=stream,
         format=constants.LOGGER_FORMAT,
         level=logging.INFO,
+        force=True,
     )
 
 
+def _get_routing_config(van_capacity: float, depots: tuple) -> RoutingConfig:
+    """
+    RoutingConfig of the --van-capacity and --depot options
+    """
+    try:
+        depot_locations = [
+            tuple(int(value) for value in depot.split(",")) for depot in depots
+        ]
+        return RoutingConfig.create(van_capacity, depot_locations or None)
+    except ValueError as error:
+        raise click.BadParameter(
+            f"{error}, depots are given as X,Y", param_hint="--van-capacity/--depot"
+        )
+
+
 @click.group()
 @click.option(
     "--n-deliveries",
     type=int,
-    required=False,
+    default=1000,
     help="Specifies the numebr of delivery events to generate, defaults to 1000",
 )
 @click.option(
     "--n-pickups",
     type=int,
-    required=False,
+    default=100,
     help="Specifies the numebr of pickup events to generate, defaults to 100",
 )
 @click.pass_context
@@ -40,11 +68,457 @@ def cli(ctx, n_deliveries: int = 1000, n_pickups: int = 100) -> None:
 
 
 @cli.command()
+@click.option(
+    "--report",
+    type=click.Path(dir_okay=False, writable=True),
+    required=False,
+    help="Measures every stage and writes the timings, memory and counters as JSON",
+)
+@click.option(
+    "--trace-memory/--no-trace-memory",
+    default=True,
+    help="Measures the peak memory of every stage with tracemalloc when reporting",
+)
+@click.option(
+    "--improve-time-budget",
+    type=float,
+    default=0.0,
+    help="Seconds spent shortening the route with 2-opt and Or-opt moves, defaults to 0",
+)
+@click.option(
+    "--distance-cache-dir",
+    type=click.Path(file_okay=False, writable=True),
+    required=False,
+    help="Directory caching the distances of planned stop sets between runs",
+)
+@click.option(
+    "--max-pickups",
+    type=int,
+    default=1,
+    help="Largest number of pickup stops added to the route, defaults to 1",
+)
+@click.option(
+    "--plot-output",
+    type=click.Path(dir_okay=False, writable=True),
+    required=False,
+    help="Writes the route plot to this .png or .svg file instead of showing it",
+)
+@click.option(
+    "--deliveries-file",
+    type=click.Path(exists=True, dir_okay=False),
+    required=False,
+    help="Reads the delivery stops from a .csv, .npy, .npz or .parquet file",
+)
+@click.option(
+    "--pickups-file",
+    type=click.Path(exists=True, dir_okay=False),
+    required=False,
+    help="Reads the pickup stops from a .csv, .npy, .npz or .parquet file",
+)
+@click.option(
+    "--column",
+    "columns",
+    multiple=True,
+    help="Maps a stop column to the column in the stop files as NAME=COLUMN,"
+    " e.g. size=weight. Can be repeated",
+)
+@click.option(
+    "--route-output",
+    type=click.Path(dir_okay=False, writable=True),
+    required=False,
+    help="Exports the planned route, as JSON lines to a .jsonl file"
+    " and as a memory mappable binary route file otherwise",
+)
+@click.option(
+    "--result-cache-dir",
+    type=click.Path(file_okay=False, writable=True),
+    required=False,
+    help="Directory caching whole planning runs, repeated runs only read the result",
+)
+@click.option(
+    "--result-cache/--no-result-cache",
+    default=True,
+    help="Uses the result cache directory, --no-result-cache bypasses it",
+)
+@click.option(
+    "--clear-result-cache",
+    is_flag=True,
+    default=False,
+    help="Removes every result from the result cache directory before planning",
+)
+@click.option(
+    "--compact",
+    is_flag=True,
+    default=False,
+    help="Keeps the stops in int16/int32 coordinates and float32 sizes to save memory",
+)
+@click.option(
+    "--multi-start-time-budget",
+    type=float,
+    default=0.0,
+    help="Seconds spent building nearest neighbour tours from random starts,"
+    " the shortest is kept. Defaults to 0, a single tour",
+)
+@click.option(
+    "--multi-start-workers",
+    type=int,
+    default=1,
+    help="Number of processes building the multi start tours, defaults to 1",
+)
+@click.option(
+    "--metric",
+    type=click.Choice(METRIC_NAMES),
+    default="squared-euclidean",
+    help="Distances the route is planned with, haversine takes x and y as longitude"
+    " and latitude in microdegrees. Defaults to squared-euclidean",
+)
+@click.option(
+    "--distance-matrix",
+    type=click.Path(exists=True, dir_okay=False),
+    required=False,
+    help="Reads the matrix metric from an .npz file with locations and matrix arrays",
+)
+@click.option(
+    "--van-capacity",
+    type=float,
+    required=False,
+    help=f"Capacity of the van, defaults to {constants.VAN_CAPACITY}",
+)
+@click.option(
+    "--depot",
+    "depots",
+    multiple=True,
+    help="Depot location as X,Y, can be repeated for several depots. Defaults to"
+    f" {constants.DEPOT_LOCATION[0]},{constants.DEPOT_LOCATION[1]}",
+)
+@click.option(
+    "--checkpoint-dir",
+    type=click.Path(file_okay=False, writable=True),
+    required=False,
+    help="Writes the output of every stage as an .npz checkpoint to this directory,"
+    " the result cache is not used",
+)
+@click.option(
+    "--resume-from",
+    type=click.Choice(Route.RUN_STAGES),
+    required=False,
+    help="Reads the stages before this one from the checkpoints of --checkpoint-dir",
+)
+@click.option(
+    "--plot/--no-plot",
+    default=True,
+    help="Shows the planned route in a window, defaults to showing it",
+)
 @click.pass_context
-def run_assignment(ctx):
-    route = Route(n_deliveries=ctx.obj["n_deliveries"], n_pickups=ctx.obj["n_pickups"])
+def run_assignment(
+    ctx,
+    report: str,
+    trace_memory: bool,
+    improve_time_budget: float,
+    distance_cache_dir: str,
+    max_pickups: int,
+    plot_output: str,
+    deliveries_file: str,
+    pickups_file: str,
+    columns: tuple,
+    route_output: str,
+    result_cache_dir: str,
+    result_cache: bool,
+    clear_result_cache: bool,
+    compact: bool,
+    multi_start_time_budget: float,
+    multi_start_workers: int,
+    metric: str,
+    distance_matrix: str,
+    van_capacity: float,
+    depots: tuple,
+    checkpoint_dir: str,
+    resume_from: str,
+    plot: bool,
+):
+    stop_columns = {}
+    for column in columns:
+        name, separator, file_column = column.partition("=")
+        if not separator or name not in (*loaders.STOP_COLUMNS, loaders.ID_COLUMN):
+            raise click.BadParameter(
+                f"{column} is not NAME=COLUMN with a NAME of x, y, size or id",
+                param_hint="--column",
+            )
+        stop_columns[name] = file_column
 
-    route.run()
+    if metric == "matrix" and not distance_matrix:
+        raise click.BadParameter(
+            "the matrix metric needs a --distance-matrix", param_hint="--metric"
+        )
+
+    if resume_from and not checkpoint_dir:
+        raise click.BadParameter(
+            "resuming needs a --checkpoint-dir", param_hint="--resume-from"
+        )
+
+    cache = ResultCache(result_cache_dir) if result_cache_dir else None
+    if cache is not None and clear_result_cache:
+        cache.clear()
+
+    instrumentation = Instrumentation(trace_memory=trace_memory) if report else None
+    route = Route(
+        n_deliveries=ctx.obj["n_deliveries"],
+        n_pickups=ctx.obj["n_pickups"],
+        instrumentation=instrumentation,
+        improve_time_budget=improve_time_budget,
+        distance_cache=(
+            DistanceCache(distance_cache_dir) if distance_cache_dir else None
+        ),
+        max_pickups=max_pickups,
+        delivery_stops_path=deliveries_file,
+        pickup_stops_path=pickups_file,
+        stop_columns=stop_columns,
+        result_cache=cache if result_cache else None,
+        compact=compact,
+        multi_start_time_budget=multi_start_time_budget,
+        multi_start_workers=multi_start_workers,
+        metric=get_metric(metric, matrix_path=distance_matrix),
+        config=_get_routing_config(van_capacity, depots),
+        checkpoints=StageCheckpoints(checkpoint_dir) if checkpoint_dir else None,
+    )
+
+    try:
+        route.run(
+            plot_output=plot_output,
+            show_plot=plot,
+            route_output=route_output,
+            resume_from=resume_from,
+        )
+    except ValueError as error:
+        if not resume_from:
+            raise
+        raise click.BadParameter(str(error), param_hint="--resume-from")
+
+    if instrumentation is not None:
+        instrumentation.write_json(report)
+
+
+@cli.command()
+@click.option(
+    "--n-vans",
+    type=click.IntRange(min=1),
+    default=4,
+    help="Number of vans, defaults to 4",
+)
+@click.option(
+    "--max-workers",
+    type=int,
+    required=False,
+    help="Number of processes planning the vans, defaults to the number of CPUs",
+)
+@click.option(
+    "--van-capacity",
+    type=float,
+    required=False,
+    help=f"Capacity of the van, defaults to {constants.VAN_CAPACITY}",
+)
+@click.option(
+    "--depot",
+    "depots",
+    multiple=True,
+    help="Depot location as X,Y, can be repeated for several depots. Defaults to"
+    f" {constants.DEPOT_LOCATION[0]},{constants.DEPOT_LOCATION[1]}",
+)
+@click.pass_context
+def run_fleet(ctx, n_vans: int, max_workers: int, van_capacity: float, depots: tuple):
+    fleet = Fleet(
+        n_deliveries=ctx.obj["n_deliveries"],
+        n_pickups=ctx.obj["n_pickups"],
+        n_vans=n_vans,
+        max_workers=max_workers,
+        config=_get_routing_config(van_capacity, depots),
+    )
+
+    fleet.run()
+
+
+@cli.command(name="run-batch")
+@click.option(
+    "--scenarios",
+    type=click.Path(exists=True, dir_okay=False),
+    required=True,
+    help="JSON scenario grid with lists of n_deliveries, n_pickups, seeds and capacities",
+)
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    required=True,
+    help="File for the result records, .csv for CSV, JSON lines otherwise",
+)
+@click.option(
+    "--max-workers",
+    type=int,
+    required=False,
+    help="Number of worker processes, defaults to the number of CPUs",
+)
+@click.option(
+    "--routes-output",
+    type=click.Path(dir_okay=False, writable=True),
+    required=False,
+    help="JSONL file the planned routes are streamed to, one route per line",
+)
+def run_batch_scenarios(
+    scenarios: str, output: str, max_workers: int, routes_output: str
+):
+    scenario_list = load_scenarios(scenarios)
+    logger.info(f"Running {len(scenario_list)} scenarios")
+
+    n_failed = run_batch(
+        scenario_list,
+        output_path=output,
+        max_workers=max_workers,
+        routes_path=routes_output,
+    )
+    if n_failed:
+        raise click.ClickException(f"{n_failed} scenarios failed")
+
+
+@cli.command(name="generate-stops")
+@click.option(
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    required=True,
+    help="Writes the stops as an n x 3 [x, y, size] .npy file",
+)
+@click.option("--n-stops", type=int, default=1000, help="Number of stops")
+@click.option("--max-coordinate", type=int, default=1000, help="Size of the plane")
+@click.option("--seed", type=int, default=42, help="Seed of the stops")
+@click.option(
+    "--max-workers",
+    type=int,
+    default=1,
+    help="Number of processes, the stops are the same for any number",
+)
+@click.option(
+    "--block-size",
+    type=int,
+    default=GENERATION_BLOCK_SIZE,
+    help="Stops per block of one random stream, changing it changes the stops",
+)
+def generate_stop_file(
+    output: str,
+    n_stops: int,
+    max_coordinate: int,
+    seed: int,
+    max_workers: int,
+    block_size: int,
+):
+    if not output.endswith(".npy"):
+        raise click.BadParameter("the stops are written to .npy files")
+    generate_stops_parallel(
+        n=n_stops,
+        max_coordinate=max_coordinate,
+        seed=seed,
+        max_workers=max_workers,
+        block_size=block_size,
+        output_path=output,
+    )
+    logger.info(f"Wrote {n_stops} stops to {output}")
+
+
+@cli.command()
+@click.option(
+    "--size",
+    "sizes",
+    type=int,
+    multiple=True,
+    help="Number of deliveries and pickups to benchmark, can be repeated."
+    " Defaults to 10^2 up to 10^6",
+)
+@click.option("--repeats", type=int, default=3, help="Timed calls per stage")
+@click.option(
+    "--save-baseline",
+    type=click.Path(dir_okay=False, writable=True),
+    required=False,
+    help="Saves the results as a JSON baseline",
+)
+@click.option(
+    "--compare-baseline",
+    type=click.Path(exists=True, dir_okay=False),
+    required=False,
+    help="Fails if any stage got slower than in this baseline",
+)
+@click.option(
+    "--threshold",
+    type=float,
+    default=0.2,
+    help="Allowed slowdown against the baseline, 0.2 is 20 %",
+)
+@click.option(
+    "--compact",
+    is_flag=True,
+    default=False,
+    help="Also benchmarks the compact dtype mode and logs its speed-up per stage",
+)
+def bench(
+    sizes: tuple,
+    repeats: int,
+    save_baseline: str,
+    compare_baseline: str,
+    threshold: float,
+    compact: bool,
+):
+    results = benchmarks.run_benchmarks(
+        sizes=sizes or benchmarks.DEFAULT_SIZES, repeats=repeats
+    )
+    if compact:
+        compact_results = benchmarks.run_benchmarks(
+            sizes=sizes or benchmarks.DEFAULT_SIZES, repeats=repeats, compact=True
+        )
+        for line in benchmarks.format_speedups(results, compact_results):
+            logger.info(f"Compact {line}")
+
+    if save_baseline:
+        benchmarks.save_baseline(results, save_baseline)
+
+    if compare_baseline:
+        regressions = benchmarks.find_regressions(
+            results, benchmarks.load_baseline(compare_baseline), threshold=threshold
+        )
+        for regression in regressions:
+            logger.error(f"Regression {regression}")
+        if regressions:
+            raise click.ClickException(f"{len(regressions)} stages regressed")
+
+
+@cli.command()
+@click.option(
+    "--socket",
+    "socket_path",
+    type=click.Path(dir_okay=False),
+    required=False,
+    help="Unix domain socket to listen on, defaults to reading stdin",
+)
+@click.option(
+    "--max-workers",
+    type=int,
+    required=False,
+    help="Number of planning processes, defaults to the number of CPUs",
+)
+@click.option(
+    "--batch-window",
+    type=float,
+    default=BATCH_WINDOW_SECONDS,
+    help="Seconds to wait for more requests to plan together",
+)
+def serve(socket_path: str, max_workers: int, batch_window: float):
+    # stdout carries the responses
+    _configure_logger(stream=sys.stderr)
+    try:
+        asyncio.run(
+            serve_requests(
+                socket_path=socket_path,
+                max_workers=max_workers,
+                batch_window=batch_window,
+            )
+        )
+    except KeyboardInterrupt:
+        logger.info("Stopped serving")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,94 @@
+import math
+import numbers
+from typing import Dict, Iterable, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from assignment import constants
+
+
+class RoutingConfig(NamedTuple):
+    """
+    Van and depots a Route is planned for. Every stage reads them from the config
+    of its route instead of assignment.constants, and the config cannot change,
+    so routes with different configs can be planned side by side in one process.
+
+    Build configs from outside values with create, the only constructor that
+    checks them. Calling the class directly is meant for the defaults and values
+    that are known to be valid
+    """
+
+    # capacity of the van
+    van_capacity: float = constants.VAN_CAPACITY
+    # X and Y coordinates of the depots, a route starts and ends at one of them,
+    # see Route.choose_depot
+    depots: Tuple[Tuple[int, int], ...] = (constants.DEPOT_LOCATION,)
+
+    @classmethod
+    def create(
+        cls,
+        van_capacity: Optional[float] = None,
+        depots: Optional[Iterable[Tuple[int, int]]] = None,
+    ) -> "RoutingConfig":
+        """
+        Checked config, missing values get the defaults of constants
+
+        Raises:
+            ValueError: for a negative capacity, no depots or depots
+            that are not pairs of integers
+        """
+        default = cls()
+        van_capacity = default.van_capacity if van_capacity is None else van_capacity
+        if van_capacity < 0:
+            raise ValueError(f"The van capacity cannot be negative, got {van_capacity}")
+
+        depots = default.depots if depots is None else tuple(depots)
+        if not depots:
+            raise ValueError("A routing config needs at least one depot")
+        checked_depots = []
+        for depot in depots:
+            if not _is_integer_pair(depot):
+                raise ValueError(f"Depot {depot} is not a pair of integer coordinates")
+            checked_depots.append((int(depot[0]), int(depot[1])))
+
+        return cls(van_capacity=float(van_capacity), depots=tuple(checked_depots))
+
+    @property
+    def depot_location(self) -> Tuple[int, int]:
+        """
+        The first depot, routes with a single depot start there
+        """
+        return self.depots[0]
+
+    def get_depot_locations(self) -> np.ndarray:
+        """
+        n x 2 coordinates of the depots
+        """
+        return np.array(self.depots, dtype=np.int64).reshape(-1, 2)
+
+    def to_dict(self) -> Dict:
+        """
+        JSON serializable config, for cache keys and exported metadata
+        """
+        return {
+            "van_capacity": self.van_capacity,
+            "depots": [list(depot) for depot in self.depots],
+        }
+
+
+def _is_integer_pair(value) -> bool:
+    """
+    Whether the value is a pair of integral numbers, booleans are not numbers here
+    """
+    try:
+        if len(value) != 2:
+            return False
+    except TypeError:
+        return False
+    return all(
+        isinstance(coordinate, numbers.Real)
+        and not isinstance(coordinate, (bool, np.bool_))
+        and math.isfinite(coordinate)
+        and int(coordinate) == coordinate
+        for coordinate in value
+    )
@@ -3,3 +3,21 @@ VAN_CAPACITY = 50
 DEPOT_LOCATION = (0, 0)
 
 LOGGER_FORMAT = "%(asctime)s | %(name)s:%(funcName)s:%(lineno)d - %(message)s"
+
+# Upper bound on the temporary memory used by one tile of the pickup to segment
+# distance kernel, small tiles stay in the CPU cache
+SEGMENT_KERNEL_MAX_BYTES = 2 * 2**20
+
+# Routes with up to this many stops get their distances as a dense matrix
+# from the distance cache, larger ones only as k nearest neighbour lists
+DENSE_DISTANCE_MAX_STOPS = 2000
+
+# Size limit of the distance cache directory, least recently used files are evicted
+DISTANCE_CACHE_MAX_BYTES = 512 * 2**20
+
+# Part of the result cache and checkpoint keys, bump it whenever a change alters
+# planned routes or what a result holds, so results of the old planning are not used anymore
+PLANNING_ALGORITHM_VERSION = 2
+
+# Size limit of the result cache directory, least recently used results are evicted
+RESULT_CACHE_MAX_BYTES = 256 * 2**20
@@ -0,0 +1,222 @@
+import contextlib
+import hashlib
+import logging
+import os
+import tempfile
+from typing import IO, Callable, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from assignment import constants
+from assignment.spatial import (
+    k_nearest_neighbours,
+    nearest_segments,
+    squared_distance_matrix,
+)
+
+logger = logging.getLogger(__name__)
+
+CACHE_FILE_SUFFIX = ".npy"
+
+
+class DistanceCache:
+    """
+    Keeps distance results of stop sets as .npy files in a directory, so planning
+    the same stops again does not recompute them.
+
+    Every entry is keyed by a hash of the arrays it was computed from. Hits are opened
+    with np.load(mmap_mode="r"), they are read from the page cache and never copied.
+    Files are written atomically, so several processes can share the directory.
+    Once the directory grows over max_bytes, the least recently used files are removed.
+
+    Args:
+        cache_dir (str): directory of the cache files, created if missing
+        max_bytes (int, optional): size limit of the directory.
+        Defaults to constants.DISTANCE_CACHE_MAX_BYTES.
+        dense_max_stops (int, optional): largest stop set stored as a dense matrix.
+        Defaults to constants.DENSE_DISTANCE_MAX_STOPS.
+    """
+
+    def __init__(
+        self,
+        cache_dir: str,
+        max_bytes: Optional[int] = None,
+        dense_max_stops: Optional[int] = None,
+    ):
+        self.cache_dir = cache_dir
+        self.max_bytes = (
+            constants.DISTANCE_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        )
+        self.dense_max_stops = (
+            constants.DENSE_DISTANCE_MAX_STOPS
+            if dense_max_stops is None
+            else dense_max_stops
+        )
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def use_dense(self, n_stops: int) -> bool:
+        return n_stops <= self.dense_max_stops
+
+    def squared_distances(self, locations: np.ndarray) -> np.ndarray:
+        """
+        n x n squared distance matrix of the locations, see spatial.squared_distance_matrix
+        """
+        return self.get_or_compute(
+            "dense", [locations], lambda: squared_distance_matrix(locations)
+        )
+
+    def nearest_neighbours(self, locations: np.ndarray, k: int) -> np.ndarray:
+        """
+        k nearest neighbours of every location, see spatial.k_nearest_neighbours
+        """
+        return self.get_or_compute(
+            f"knn{k}", [locations], lambda: k_nearest_neighbours(locations, k)
+        )
+
+    def nearest_segments(
+        self, locations: np.ndarray, segments: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Distance to and index of the closest segment of every location,
+        see spatial.nearest_segments
+        """
+
+        def compute() -> np.ndarray:
+            min_distances, segment_indices = nearest_segments(
+                locations, segments, max_tile_bytes=constants.SEGMENT_KERNEL_MAX_BYTES
+            )
+            return np.column_stack([min_distances, segment_indices])
+
+        # indices are stored next to the distances, float64 holds them exactly
+        result = self.get_or_compute("segments", [locations, segments], compute)
+        return result[:, 0], result[:, 1].astype(np.int64)
+
+    def get_or_compute(
+        self, name: str, arrays: List[np.ndarray], compute: Callable[[], np.ndarray]
+    ) -> np.ndarray:
+        """
+        Loads the result named name for the arrays from the cache,
+        or computes it with compute and stores it
+
+        Returns:
+            np.ndarray: the result, read only and memory mapped when it came from the cache
+        """
+        path = self.get_path(name, arrays)
+        try:
+            result = np.load(path, mmap_mode="r")
+        except (FileNotFoundError, ValueError):
+            # missing, evicted by another process or not a complete file
+            self.misses += 1
+            result = compute()
+            self.store(path, result)
+            return result
+
+        self.hits += 1
+        touch(path)
+        return result
+
+    def get_path(self, name: str, arrays: List[np.ndarray]) -> str:
+        return os.path.join(
+            self.cache_dir, f"{name}-{get_key(arrays)}{CACHE_FILE_SUFFIX}"
+        )
+
+    def store(self, path: str, result: np.ndarray):
+        """
+        Writes the result to a temporary file and renames it, then evicts old files.
+        Empty results and results larger than the whole cache are not stored
+        """
+        if result.size == 0:
+            return
+        if result.nbytes > self.max_bytes:
+            logger.info(
+                f"Not caching {os.path.basename(path)}, it is larger than the cache"
+            )
+            return
+
+        write_atomically(path, lambda cache_file: np.save(cache_file, result))
+        self.evict(keep=path)
+
+    def evict(self, keep: Optional[str] = None):
+        """
+        Removes the least recently used files until the cache fits into max_bytes
+        """
+        evict_least_recently_used(
+            self.cache_dir, CACHE_FILE_SUFFIX, self.max_bytes, keep=keep
+        )
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"distance_cache_hits": self.hits, "distance_cache_misses": self.misses}
+
+
+def write_atomically(path: str, write: Callable[[IO[bytes]], None]):
+    """
+    Writes a file with write into a temporary file next to it and renames it,
+    readers in other processes only ever see the complete file
+    """
+    file_descriptor, temporary_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), suffix=".tmp"
+    )
+    try:
+        with os.fdopen(file_descriptor, "wb") as cache_file:
+            write(cache_file)
+        os.replace(temporary_path, path)
+    except BaseException:
+        os.unlink(temporary_path)
+        raise
+
+
+def touch(path: str):
+    """
+    Marks a cache file as used for evict_least_recently_used. A file that another
+    process evicted since it was read is left alone
+    """
+    with contextlib.suppress(FileNotFoundError):
+        os.utime(path)
+
+
+def evict_least_recently_used(
+    cache_dir: str, suffix: str, max_bytes: int, keep: Optional[str] = None
+):
+    """
+    Removes the files with the suffix that were used least recently, by their
+    modification time, until they fit into max_bytes. The file keep stays
+    """
+    entries = []
+    for file_name in os.listdir(cache_dir):
+        if not file_name.endswith(suffix):
+            continue
+        path = os.path.join(cache_dir, file_name)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            continue
+        entries.append((stat.st_mtime, path, stat.st_size))
+
+    total_bytes = sum(size for _, _, size in entries)
+    for _, path, size in sorted(entries):
+        if total_bytes <= max_bytes:
+            break
+        if path == keep:
+            continue
+        try:
+            os.unlink(path)
+        except FileNotFoundError:
+            pass
+        total_bytes -= size
+        logger.info(f"Evicted {os.path.basename(path)} from {cache_dir}")
+
+
+def get_key(arrays: List[np.ndarray], parameters: str = "") -> str:
+    """
+    Hash of the dtypes, shapes and contents of the arrays and of the parameters
+    """
+    digest = hashlib.blake2b(digest_size=16)
+    digest.update(parameters.encode())
+    for array in arrays:
+        array = np.ascontiguousarray(array)
+        digest.update(f"{array.dtype.str}{array.shape}".encode())
+        digest.update(array.data)
+    return digest.hexdigest()
@@ -0,0 +1,254 @@
+import json
+import struct
+from typing import IO, TYPE_CHECKING, Dict, NamedTuple, Optional
+
+import numpy as np
+
+from assignment.stops import StopKind, StopTable
+
+if TYPE_CHECKING:
+    from assignment.routes import Route
+
+ROUTE_FILE_MAGIC = b"ROUTEBIN"
+ROUTE_FILE_VERSION = 1
+
+# magic, format version and length of the JSON header
+PREAMBLE = struct.Struct("<8sII")
+
+# Every array starts at a multiple of this many bytes
+ARRAY_ALIGNMENT = 64
+
+# Arrays of a route file in the order they are stored, with their dtypes
+ROUTE_ARRAYS = {
+    "ids": np.dtype("<i8"),
+    "locations": np.dtype("<i8"),
+    "sizes": np.dtype("<f8"),
+    "kinds": np.dtype("i1"),
+    "loads": np.dtype("<f8"),
+}
+
+
+class RouteFile(NamedTuple):
+    """
+    Route read back by read_route, the arrays are memory mapped from the file
+    """
+
+    # metadata of the route, see get_route_metadata
+    metadata: Dict
+    # id of every stop in the visiting order, depots have id -1
+    ids: np.ndarray
+    # n x 2 coordinates of the stops
+    locations: np.ndarray
+    sizes: np.ndarray
+    # StopKind of every stop
+    kinds: np.ndarray
+    # load of the van on every leg between two stops
+    loads: np.ndarray
+
+    def to_stop_table(self) -> StopTable:
+        return StopTable(
+            locations=self.locations,
+            sizes=self.sizes,
+            kinds=self.kinds,
+            ids=self.ids,
+        )
+
+
+def calculate_load_profile(route: StopTable, start_load: float) -> np.ndarray:
+    """
+    Load of the van on every leg of the route, deliveries are unloaded
+    and pickups loaded at their stop
+
+    Args:
+        route (StopTable): stops in the visiting order
+        start_load (float): load when leaving the first stop
+
+    Returns:
+        np.ndarray: len(route) - 1 loads, the first one for the leg from the first stop
+    """
+    if len(route) < 2:
+        return np.zeros(0, dtype=np.float64)
+
+    kinds = route.kinds[1:-1]
+    sizes = route.sizes[1:-1]
+    changes = np.where(
+        kinds == StopKind.PICKUP, sizes, np.where(kinds == StopKind.DELIVERY, -sizes, 0)
+    )
+    return start_load + np.concatenate([[0.0], np.cumsum(changes)])
+
+
+def get_route_arrays(route: "Route") -> Dict[str, np.ndarray]:
+    """
+    Columns of the planned route of a Route in the ROUTE_ARRAYS dtypes
+    """
+    stops = route.get_result_route()
+    return {
+        "ids": stops.ids,
+        "locations": stops.locations,
+        "sizes": stops.sizes,
+        "kinds": stops.kinds,
+        "loads": calculate_load_profile(stops, route.route_capacity_usage),
+    }
+
+
+def get_route_metadata(route: "Route") -> Dict:
+    """
+    Planning inputs and summary of the planned route of a Route
+    """
+    stops = route.get_result_route()
+    return {
+        "n_deliveries": route.n_deliveries,
+        "n_pickups": route.n_pickups,
+        "seed": route.seed,
+        "van_capacity": route.get_van_capacity(),
+        "depot_location": list(route.depot_location),
+        "max_pickups": route.max_pickups,
+        "n_stops": len(stops),
+        "chosen_pickup_ids": [stop.stop_id for stop in route.chosen_pickup_stops],
+        "metric": route.metric.name,
+        "route_length": route.metric.route_length(stops.locations),
+    }
+
+
+def write_route(route: "Route", path: str, metadata: Optional[Dict] = None):
+    """
+    Writes the planned route of a Route to a binary route file, see write_route_arrays
+    """
+    write_route_arrays(
+        path, get_route_arrays(route), {**get_route_metadata(route), **(metadata or {})}
+    )
+
+
+def write_route_arrays(path: str, arrays: Dict[str, np.ndarray], metadata: Dict):
+    """
+    Writes route arrays into a binary file that read_route maps back without parsing.
+
+    The file starts with the magic bytes, the format version and the length of
+    a JSON header. The header holds the metadata and the dtype, shape and offset
+    of every array. The arrays follow as raw little endian bytes, every one starting
+    at a multiple of ARRAY_ALIGNMENT bytes.
+
+    Args:
+        path (str): file to write
+        arrays (Dict[str, np.ndarray]): one array per name in ROUTE_ARRAYS
+        metadata (Dict): JSON serializable metadata stored in the header
+    """
+    arrays = {
+        name: np.ascontiguousarray(arrays[name], dtype=dtype)
+        for name, dtype in ROUTE_ARRAYS.items()
+    }
+
+    # the offsets depend on the header length and the other way around,
+    # a header that grows across an alignment boundary only needs a second pass
+    data_start = 0
+    while True:
+        array_headers = {}
+        offset = data_start
+        for name, array in arrays.items():
+            array_headers[name] = {
+                "dtype": array.dtype.str,
+                "shape": list(array.shape),
+                "offset": offset,
+            }
+            offset = _align(offset + array.nbytes)
+
+        header = json.dumps({"metadata": metadata, "arrays": array_headers}).encode()
+        header_end = PREAMBLE.size + len(header)
+        if _align(header_end) == data_start:
+            break
+        data_start = _align(header_end)
+
+    with open(path, "wb") as route_file:
+        route_file.write(
+            PREAMBLE.pack(ROUTE_FILE_MAGIC, ROUTE_FILE_VERSION, len(header))
+        )
+        route_file.write(header)
+        for name, array in arrays.items():
+            _pad_to(route_file, array_headers[name]["offset"])
+            route_file.write(array.tobytes())
+        _pad_to(route_file, offset)
+
+
+def read_route(path: str) -> RouteFile:
+    """
+    Memory maps a route file written by write_route
+
+    Raises:
+        ValueError: if the file is not a route file or has an unknown version
+    """
+    with open(path, "rb") as route_file:
+        preamble = route_file.read(PREAMBLE.size)
+        if len(preamble) < PREAMBLE.size:
+            raise ValueError(f"{path} is not a route file")
+        magic, version, header_length = PREAMBLE.unpack(preamble)
+        if magic != ROUTE_FILE_MAGIC:
+            raise ValueError(f"{path} is not a route file")
+        if version != ROUTE_FILE_VERSION:
+            raise ValueError(f"{path} has route file version {version}")
+        header = json.loads(route_file.read(header_length))
+
+    arrays = {}
+    for name, array_header in header["arrays"].items():
+        dtype = np.dtype(array_header["dtype"])
+        shape = tuple(array_header["shape"])
+        if np.prod(shape) == 0:
+            # empty files and empty arrays cannot be mapped
+            arrays[name] = np.zeros(shape, dtype=dtype)
+        else:
+            arrays[name] = np.memmap(
+                path, dtype=dtype, mode="r", offset=array_header["offset"], shape=shape
+            )
+
+    return RouteFile(metadata=header["metadata"], **arrays)
+
+
+class RouteStreamWriter:
+    """
+    Appends planned routes to a JSONL file, one route per line with the metadata
+    and the arrays as lists of x, y, sizes, kinds, ids and loads.
+    Every route is flushed right away, like batch.RecordWriter
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._file: IO[str] = open(path, "w")
+
+    def write(self, route: "Route", metadata: Optional[Dict] = None):
+        self.write_arrays(
+            get_route_arrays(route), {**get_route_metadata(route), **(metadata or {})}
+        )
+
+    def write_arrays(self, arrays: Dict[str, np.ndarray], metadata: Dict):
+        """
+        Writes one route given as its arrays, see write_route_arrays
+        """
+        locations = np.asarray(arrays["locations"])
+        line = {
+            **metadata,
+            "x": locations[:, 0].tolist(),
+            "y": locations[:, 1].tolist(),
+            **{
+                name: np.asarray(arrays[name]).tolist()
+                for name in ROUTE_ARRAYS
+                if name != "locations"
+            },
+        }
+        self._file.write(json.dumps(line) + "\n")
+        self._file.flush()
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self) -> "RouteStreamWriter":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def _align(offset: int) -> int:
+    return -(-offset // ARRAY_ALIGNMENT) * ARRAY_ALIGNMENT
+
+
+def _pad_to(output: IO[bytes], offset: int):
+    output.write(b"\0" * (offset - output.tell()))
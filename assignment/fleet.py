@@ -0,0 +1,273 @@
+import logging
+import math
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from assignment.config import RoutingConfig
+from assignment.parallel import SharedArrayDescriptor, SharedArrays, attach_arrays
+from assignment.routes import Route
+from assignment.selection import select_smallest_fitting
+from assignment.stops import StopKind, StopTable
+from assignment.utils import generate_stops
+
+logger = logging.getLogger(__name__)
+
+
+class VanPlan:
+    """
+    Planned route of one van of the fleet
+    """
+
+    def __init__(
+        self,
+        van_index: int,
+        final_route: StopTable,
+        segment_capacities: np.ndarray,
+        chosen_pickup_id: int,
+        depot_location: Tuple[int, int],
+    ):
+        self.van_index = van_index
+        self.depot_location = depot_location
+        self.final_route = final_route
+        self.segment_capacities = segment_capacities
+        self.chosen_pickup_id = chosen_pickup_id
+
+
+class Fleet:
+    """
+    Plans routes for several vans of the same RoutingConfig.
+
+    All deliveries are split across the vans with a sweep: the smallest deliveries that fit
+    into the total fleet capacity are ordered by their angle around the first depot and
+    every van takes the next stops until it is full. Pickups go to the van whose sector
+    they are in. Every van is then planned as a Route in a separate process, the stops are
+    shared with the workers through shared memory. With several depots every van starts
+    from the depot closest to its deliveries, see Route.choose_depot.
+
+    Raises:
+        ValueError: for fewer than one van
+    """
+
+    def __init__(
+        self,
+        n_deliveries: int,
+        n_pickups: int,
+        n_vans: int,
+        max_workers: Optional[int] = None,
+        config: Optional[RoutingConfig] = None,
+    ):
+        if n_vans < 1:
+            raise ValueError(f"A fleet needs at least one van, got {n_vans}")
+        self.n_deliveries = n_deliveries
+        self.n_pickups = n_pickups
+        self.n_vans = n_vans
+        self.max_workers = max_workers
+        self.config = config or RoutingConfig()
+
+        self.delivery_stops = StopTable.empty()
+        self.pickup_stops = StopTable.empty()
+
+        self.van_deliveries: List[np.ndarray] = []
+        self.van_pickups: List[np.ndarray] = []
+
+        self.van_plans: List[VanPlan] = []
+
+    def run(self):
+        self.load_all_stops()
+        self.assign_stops_to_vans()
+        self.plan_van_routes()
+
+    def load_all_stops(self):
+        """
+        Generates delivery and pickup stops the same way Route does
+        """
+        self.delivery_stops = StopTable.from_array(
+            generate_stops(n=self.n_deliveries), kind=StopKind.DELIVERY
+        )
+        self.pickup_stops = StopTable.from_array(
+            generate_stops(n=self.n_pickups), kind=StopKind.PICKUP
+        )
+
+    def assign_stops_to_vans(self):
+        """
+        Splits the deliveries and pickups between the vans with a sweep around the first depot.
+        Saves the stop indices of every van in self.van_deliveries and self.van_pickups
+        """
+        sizes = self.delivery_stops.sizes
+        van_capacity = self.config.van_capacity
+        fleet_capacity = van_capacity * self.n_vans
+        candidates = select_smallest_fitting(sizes, fleet_capacity).indices
+
+        angles = self.get_angles_around_depot(self.delivery_stops.locations[candidates])
+        sweep_order = candidates[np.argsort(angles, kind="stable")]
+
+        van_deliveries: List[List[int]] = [[] for _ in range(self.n_vans)]
+        van_loads = [0.0] * self.n_vans
+        van_index = 0
+        n_dropped = 0
+        for stop_index, stop_size in zip(
+            sweep_order.tolist(), sizes[sweep_order].tolist()
+        ):
+            while (
+                van_loads[van_index] + stop_size > van_capacity
+                and van_index < self.n_vans - 1
+            ):
+                van_index += 1
+            if van_loads[van_index] + stop_size > van_capacity:
+                n_dropped += 1
+                continue
+            van_loads[van_index] += stop_size
+            van_deliveries[van_index].append(stop_index)
+
+        self.van_deliveries = [
+            np.array(stops, dtype=np.int64) for stops in van_deliveries
+        ]
+
+        # Every van owns the sector from its first stop to the first stop of the next van,
+        # the last sector wraps around. Vans are filled in order, so the used ones come first
+        first_stops = [stops[0] for stops in self.van_deliveries if len(stops) > 0]
+        sector_starts = self.get_angles_around_depot(
+            self.delivery_stops.locations[first_stops]
+        )
+        pickup_angles = self.get_angles_around_depot(self.pickup_stops.locations)
+        pickup_vans = np.searchsorted(sector_starts, pickup_angles, side="right") - 1
+        pickup_vans %= max(len(first_stops), 1)
+        self.van_pickups = [
+            np.flatnonzero(pickup_vans == van) for van in range(self.n_vans)
+        ]
+
+        logger.info(
+            f"Assigned {sum(map(len, self.van_deliveries))} deliveries to {self.n_vans} vans,"
+            f" {n_dropped} did not fit"
+        )
+
+    def get_angles_around_depot(self, locations: np.ndarray) -> np.ndarray:
+        """
+        Angle of every location around the first depot in radians, in the range [0, 2 pi)
+        """
+        depot_x, depot_y = self.config.depot_location
+        x_diffs = locations[:, 0] - depot_x
+        y_diffs = locations[:, 1] - depot_y
+        return np.arctan2(y_diffs, x_diffs) % (2 * math.pi)
+
+    def plan_van_routes(self):
+        """
+        Plans the route of every van in a process pool and saves them in self.van_plans
+        """
+        arrays = {
+            "delivery_locations": self.delivery_stops.locations,
+            "delivery_sizes": self.delivery_stops.sizes,
+            "pickup_locations": self.pickup_stops.locations,
+            "pickup_sizes": self.pickup_stops.sizes,
+        }
+        with SharedArrays(arrays) as shared_arrays:
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [
+                    executor.submit(
+                        plan_van_route,
+                        van_index,
+                        shared_arrays.descriptors,
+                        self.van_deliveries[van_index],
+                        self.van_pickups[van_index],
+                        self.config,
+                    )
+                    for van_index in range(self.n_vans)
+                ]
+                results = [future.result() for future in futures]
+
+        self.van_plans = [
+            self.get_van_plan(van_index, result)
+            for van_index, result in enumerate(results)
+        ]
+
+    def get_van_plan(self, van_index: int, result: Dict[str, np.ndarray]) -> VanPlan:
+        """
+        Rebuilds the route of a van from the stop ids and kinds returned by the worker
+        """
+        route_ids = result["route_ids"]
+        route_kinds = result["route_kinds"]
+
+        locations = np.zeros((len(route_ids), 2), dtype=np.int64)
+        sizes = np.zeros(len(route_ids), dtype=np.float64)
+        depot_location = tuple(result["depot_location"].tolist())
+        locations[route_kinds == StopKind.DEPOT] = depot_location
+        for kind, stops in (
+            (StopKind.DELIVERY, self.delivery_stops),
+            (StopKind.PICKUP, self.pickup_stops),
+        ):
+            is_kind = route_kinds == kind
+            locations[is_kind] = stops.locations[route_ids[is_kind]]
+            sizes[is_kind] = stops.sizes[route_ids[is_kind]]
+
+        logger.info(f"Van {van_index} visits {len(route_ids) - 2} stops")
+
+        return VanPlan(
+            van_index=van_index,
+            final_route=StopTable(locations, sizes, route_kinds, route_ids),
+            segment_capacities=result["segment_capacities"],
+            chosen_pickup_id=int(result["chosen_pickup_id"]),
+            depot_location=depot_location,
+        )
+
+
+def plan_van_route(
+    van_index: int,
+    descriptors: Dict[str, SharedArrayDescriptor],
+    delivery_indices: np.ndarray,
+    pickup_indices: np.ndarray,
+    config: Optional[RoutingConfig] = None,
+) -> Dict[str, np.ndarray]:
+    """
+    Plans the route of one van in a worker process
+
+    Args:
+        van_index (int): index of the van, only used for logging
+        descriptors (Dict[str, SharedArrayDescriptor]): shared stop arrays of the fleet
+        delivery_indices (np.ndarray): deliveries assigned to the van
+        pickup_indices (np.ndarray): pickups the van can choose from
+        config (RoutingConfig, optional): van and depots of the fleet
+
+    Returns:
+        Dict[str, np.ndarray]: ids and kinds of the stops on the route,
+        the segment capacities, the id of the chosen pickup (-1 if none)
+        and the depot the route starts from
+    """
+    arrays, blocks = attach_arrays(descriptors)
+    try:
+        delivery_stops = StopTable(
+            locations=arrays["delivery_locations"][delivery_indices],
+            sizes=arrays["delivery_sizes"][delivery_indices],
+            kinds=np.full(len(delivery_indices), StopKind.DELIVERY, dtype=np.int8),
+            ids=delivery_indices,
+        )
+        pickup_stops = StopTable(
+            locations=arrays["pickup_locations"][pickup_indices],
+            sizes=arrays["pickup_sizes"][pickup_indices],
+            kinds=np.full(len(pickup_indices), StopKind.PICKUP, dtype=np.int8),
+            ids=pickup_indices,
+        )
+    finally:
+        del arrays
+        for block in blocks:
+            block.close()
+
+    route = Route.from_stops(delivery_stops, pickup_stops, config=config)
+    route.plan_route()
+    logger.info(f"Planned van {van_index}")
+
+    final_route = (
+        route.final_route if len(route.final_route) else route.planned_delivery_route
+    )
+    chosen_pickup_id = (
+        route.chosen_pickup_stop.stop_id if route.chosen_pickup_stop else -1
+    )
+
+    return {
+        "route_ids": final_route.ids,
+        "route_kinds": final_route.kinds,
+        "segment_capacities": route.segment_capacities,
+        "chosen_pickup_id": np.int64(chosen_pickup_id),
+        "depot_location": np.array(route.depot_location, dtype=np.int64),
+    }
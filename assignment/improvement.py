@@ -0,0 +1,329 @@
+import logging
+import math
+import time
+from collections import deque
+from typing import Dict, List, Optional
+
+import numpy as np
+
+from assignment.spatial import k_nearest_neighbours
+
+logger = logging.getLogger(__name__)
+
+# Length of the candidate lists, only moves towards these neighbours are evaluated
+N_NEIGHBOURS = 8
+
+# Longest chain of stops an Or-opt move relocates
+MAX_SEGMENT_LENGTH = 3
+
+# Moves have to shorten the route by more than this to be applied
+MIN_GAIN = 1e-9
+
+
+class TourImprover:
+    """
+    Improves a closed tour with 2-opt and Or-opt moves.
+
+    Only moves that connect a stop to one of its k nearest neighbours are evaluated
+    and every move is evaluated in O(1) from the distances of the edges it changes.
+    Stops whose neighbourhood did not change since their last unsuccessful search
+    are skipped (don't-look bits). Every applied move shortens the tour, so the current
+    tour is always the best one found.
+
+    The first stop of the tour (the depot) stays at position 0, reversals and relocations
+    only shift the positions 1..n, so the depot never has to move.
+
+    Args:
+        locations (np.ndarray): (n + 1) x 2 coordinates in the current tour order,
+        the depot first and without the closing depot
+        neighbours (np.ndarray, optional): precomputed k nearest neighbours of every stop.
+        Defaults to computing N_NEIGHBOURS of them.
+        distances (np.ndarray, optional): symmetric (n + 1) x (n + 1) distances between
+        the stops, used instead of euclidean distances, e.g. from a DistanceMetric
+        deadline (float, optional): time.perf_counter time improve stops at. Building
+        the neighbour lists counts against it, without neighbours by then the tour is kept
+    """
+
+    def __init__(
+        self,
+        locations: np.ndarray,
+        neighbours: Optional[np.ndarray] = None,
+        distances: Optional[np.ndarray] = None,
+        deadline: Optional[float] = None,
+    ):
+        self.n_nodes = len(locations)
+        self.deadline = deadline
+        # tour[position] is the node at the position, pos[node] is its position
+        self.tour = np.arange(self.n_nodes, dtype=np.int64)
+        self.pos = np.arange(self.n_nodes, dtype=np.int64)
+
+        self.n_moves = 0
+        self.n_candidates = 0
+
+        if neighbours is None and distances is not None:
+            neighbours = matrix_nearest_neighbours(distances, N_NEIGHBOURS)
+        elif neighbours is None:
+            neighbours = k_nearest_neighbours(
+                locations, N_NEIGHBOURS, deadline=deadline
+            )
+        self.neighbours: List[List[int]] = []
+        if neighbours is None or self.is_past_deadline():
+            logger.info("No time left to improve the route after finding neighbours")
+            return
+        self.neighbours = neighbours.tolist()
+
+        self.xs: List[float] = np.asarray(locations[:, 0], dtype=np.float64).tolist()
+        self.ys: List[float] = np.asarray(locations[:, 1], dtype=np.float64).tolist()
+
+        self.distances: Optional[List[List[float]]] = None
+        if distances is not None:
+            self.distances = np.asarray(distances, dtype=np.float64).tolist()
+            self.distance = self.matrix_distance
+
+    def distance(self, a: int, b: int) -> float:
+        return math.hypot(self.xs[a] - self.xs[b], self.ys[a] - self.ys[b])
+
+    def matrix_distance(self, a: int, b: int) -> float:
+        return self.distances[a][b]
+
+    def succ(self, node: int) -> int:
+        position = int(self.pos[node]) + 1
+        return int(self.tour[position if position < self.n_nodes else 0])
+
+    def pred(self, node: int) -> int:
+        return int(self.tour[int(self.pos[node]) - 1])
+
+    def is_past_deadline(self) -> bool:
+        return self.deadline is not None and time.perf_counter() >= self.deadline
+
+    def improve(self, time_budget: Optional[float] = None) -> np.ndarray:
+        """
+        Applies improving moves until there are none left or the time budget runs out
+
+        Args:
+            time_budget (float, optional): wall clock budget in seconds from now.
+            Defaults to the deadline of the improver, no limit without one.
+
+        Returns:
+            np.ndarray: the improved order of the stops, starting with the depot
+        """
+        deadline = math.inf if self.deadline is None else self.deadline
+        if time_budget is not None:
+            deadline = time.perf_counter() + time_budget
+        if self.n_nodes < 4 or not self.neighbours:
+            return self.tour.copy()
+
+        queue = deque(range(self.n_nodes))
+        in_queue = [True] * self.n_nodes
+        while queue and time.perf_counter() < deadline:
+            node = queue.popleft()
+            in_queue[node] = False
+
+            touched = self.try_two_opt(node) or self.try_or_opt(node)
+            if touched:
+                self.n_moves += 1
+                for touched_node in touched:
+                    if not in_queue[touched_node]:
+                        in_queue[touched_node] = True
+                        queue.append(touched_node)
+
+        return self.tour.copy()
+
+    def try_two_opt(self, a: int) -> Optional[List[int]]:
+        """
+        Tries to replace the edges (a, b) and (c, d) by (a, c) and (b, d), where b and d
+        follow (or both precede) a and c. Applies the first improving move.
+
+        Returns:
+            Optional[List[int]]: the stops whose edges changed, None without a move
+        """
+        for direction in (self.succ, self.pred):
+            b = direction(a)
+            distance_ab = self.distance(a, b)
+            for c in self.neighbours[a]:
+                distance_ac = self.distance(a, c)
+                if distance_ac >= distance_ab:
+                    break
+                d = direction(c)
+                if c == b or d == a:
+                    continue
+
+                self.n_candidates += 1
+                delta = (
+                    distance_ac
+                    + self.distance(b, d)
+                    - distance_ab
+                    - self.distance(c, d)
+                )
+                if delta < -MIN_GAIN:
+                    if direction == self.succ:
+                        self.apply_two_opt(a, b, c, d)
+                    else:
+                        self.apply_two_opt(b, a, d, c)
+                    return [a, b, c, d]
+        return None
+
+    def apply_two_opt(self, p1: int, s1: int, p2: int, s2: int):
+        """
+        Replaces the edges (p1, s1) and (p2, s2) by (p1, p2) and (s1, s2), where s1 and s2
+        follow p1 and p2, by reversing whichever side of the tour does not hold the depot
+        """
+        start = int(self.pos[s1])
+        end = int(self.pos[p2])
+        if 1 <= start <= end:
+            self.reverse(start, end)
+        else:
+            self.reverse(int(self.pos[s2]), int(self.pos[p1]))
+
+    def reverse(self, start: int, end: int):
+        """
+        Reverses the tour between the positions, both included
+        """
+        stop = end + 1
+        self.tour[start:stop] = self.tour[start:stop][::-1].copy()
+        self.pos[self.tour[start:stop]] = np.arange(start, stop)
+
+    def try_or_opt(self, a: int) -> Optional[List[int]]:
+        """
+        Tries to move the chain of up to MAX_SEGMENT_LENGTH stops starting at a
+        between two other consecutive stops, in either orientation.
+        Applies the first improving move.
+
+        Returns:
+            Optional[List[int]]: the stops whose edges changed, None without a move
+        """
+        start = int(self.pos[a])
+        if start == 0:
+            return None
+
+        for length in range(1, MAX_SEGMENT_LENGTH + 1):
+            stop = start + length
+            if stop > self.n_nodes:
+                break
+            segment = self.tour[start:stop].tolist()
+            first = segment[0]
+            last = segment[-1]
+            before = int(self.tour[start - 1])
+            after = int(self.tour[stop]) if stop < self.n_nodes else 0
+            if before == after:
+                break
+
+            removal_gain = (
+                self.distance(before, first)
+                + self.distance(last, after)
+                - self.distance(before, after)
+            )
+            if removal_gain <= MIN_GAIN:
+                continue
+
+            for end_node in (first, last):
+                other_end = last if end_node == first else first
+                for c in self.neighbours[end_node]:
+                    if self.distance(end_node, c) >= removal_gain:
+                        break
+                    if c in segment:
+                        continue
+
+                    # insert either between c and its successor or its predecessor and c,
+                    # always with end_node next to c
+                    for u, v in ((c, self.succ(c)), (self.pred(c), c)):
+                        if u in segment or v in segment:
+                            continue
+                        head, tail = (
+                            (end_node, other_end) if u == c else (other_end, end_node)
+                        )
+
+                        self.n_candidates += 1
+                        delta = (
+                            self.distance(u, head)
+                            + self.distance(tail, v)
+                            - self.distance(u, v)
+                            - removal_gain
+                        )
+                        if delta < -MIN_GAIN:
+                            self.move_segment(start, length, u, reverse=head != first)
+                            return [before, after, u, v, first, last]
+        return None
+
+    def move_segment(self, start: int, length: int, u: int, reverse: bool):
+        """
+        Moves the stops at positions start..start + length - 1 right after the stop u.
+        Only the positions between the old and the new place are shifted
+        """
+        tour = self.tour
+        segment_end = start + length
+        segment = tour[start:segment_end].copy()
+        if reverse:
+            segment = segment[::-1]
+
+        target = int(self.pos[u])
+        if target < start:
+            changed = slice(target + 1, segment_end)
+            shifted = tour[target + 1 : start]
+            tour[changed] = np.concatenate([segment, shifted])
+        else:
+            changed = slice(start, target + 1)
+            shifted = tour[segment_end : target + 1]
+            tour[changed] = np.concatenate([shifted, segment])
+
+        self.pos[tour[changed]] = np.arange(changed.start, changed.stop)
+
+
+def matrix_nearest_neighbours(distances: np.ndarray, k: int) -> np.ndarray:
+    """
+    The k closest other stops of every stop in a distance matrix,
+    closest first, ties by the lower index
+
+    Returns:
+        np.ndarray: n x min(k, n - 1) indices of the neighbours
+    """
+    n_stops = len(distances)
+    k = max(min(k, n_stops - 1), 0)
+    others = np.array(distances, dtype=np.float64)
+    np.fill_diagonal(others, np.inf)
+    return np.argsort(others, axis=1, kind="stable")[:, :k]
+
+
+def improve_route(
+    locations: np.ndarray,
+    time_budget: float,
+    neighbours: Optional[np.ndarray] = None,
+    counters: Optional[Dict[str, int]] = None,
+    distances: Optional[np.ndarray] = None,
+    deadline: Optional[float] = None,
+) -> np.ndarray:
+    """
+    Shortens a route that starts and ends in the depot with 2-opt and Or-opt moves,
+    see TourImprover. The time budget starts when it is called and covers finding
+    the neighbours of the stops
+
+    Args:
+        locations (np.ndarray): (n + 1) x 2 coordinates of the route, the depot first
+        and without the closing depot
+        time_budget (float): wall clock budget in seconds
+        neighbours (np.ndarray, optional): precomputed k nearest neighbours of the stops
+        counters (Dict[str, int], optional): gets the number of applied moves
+        and evaluated candidate moves added
+        distances (np.ndarray, optional): distances between the stops used instead
+        of euclidean distances, see TourImprover
+        deadline (float, optional): time.perf_counter time to stop at, for callers
+        that spent part of the budget already. Defaults to time_budget from now
+
+    Returns:
+        np.ndarray: new order of the locations, starting with the depot
+    """
+    if deadline is None:
+        deadline = time.perf_counter() + time_budget
+    improver = TourImprover(
+        locations, neighbours=neighbours, distances=distances, deadline=deadline
+    )
+    order = improver.improve()
+
+    if counters is not None:
+        counters["moves_applied"] = counters.get("moves_applied", 0) + improver.n_moves
+        counters["candidates_examined"] = (
+            counters.get("candidates_examined", 0) + improver.n_candidates
+        )
+    logger.info(f"Applied {improver.n_moves} improving moves")
+
+    return order
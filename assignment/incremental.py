@@ -0,0 +1,344 @@
+import heapq
+import logging
+from typing import TYPE_CHECKING, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from assignment import constants
+from assignment.segment_tree import MinSegmentTree
+from assignment.metrics import SQUARED_EUCLIDEAN, DistanceMetric
+from assignment.stops import StopKind, StopTable
+
+if TYPE_CHECKING:
+    from assignment.routes import Route
+
+logger = logging.getLogger(__name__)
+
+
+class Insertion(NamedTuple):
+    """
+    Place on the route where a pickup would be inserted
+    """
+
+    # index of the segment of the current route the pickup splits
+    segment_index: int
+    # distance between the pickup and that segment, squared for the default metric
+    distance: float
+
+
+class IncrementalRoute:
+    """
+    Planned delivery route that takes pickup stops one at a time.
+
+    The free capacity of the van is tracked per segment of the planned delivery route
+    in a MinSegmentTree. A pickup inserted into a segment lowers the free capacity of
+    the rest of the route, which is one range addition. Within one planned segment the
+    free capacity only goes down, so the capacity after its last inserted pickup
+    is the one kept in the tree.
+
+    A pickup fits into a segment when it fits into that segment and into all the
+    following ones. The segments after the last one without enough capacity are
+    exactly those, they are found by walking down the tree once. Only their distances
+    to the pickup are computed.
+
+    Unlike Route.add_pickup_stop_to_route, the pickup is inserted between
+    the two stops of the segment it is closest to.
+
+    Args:
+        planned_route (StopTable): delivery route starting and ending in the depot
+        segment_capacities (np.ndarray): free capacity of the van on every segment
+        of the planned route, see Route.calculate_route_segment_capacities
+        metric (DistanceMetric, optional): distances of the pickups to the segments.
+        Defaults to metrics.SQUARED_EUCLIDEAN.
+    """
+
+    def __init__(
+        self,
+        planned_route: StopTable,
+        segment_capacities: np.ndarray,
+        metric: Optional[DistanceMetric] = None,
+    ):
+        if len(segment_capacities) != len(planned_route) - 1:
+            raise ValueError(
+                f"Expected {len(planned_route) - 1} segment capacities,"
+                f" got {len(segment_capacities)}"
+            )
+
+        self.metric = metric or SQUARED_EUCLIDEAN
+        self.route = planned_route.copy()
+        locations = self.route.locations
+        self.segments = np.concatenate([locations[:-1], locations[1:]], axis=1)
+
+        # planned segment every segment of the current route belongs to
+        self.planned_segment_indices = np.arange(len(self.segments), dtype=np.int64)
+        # ids stay the same while a segment exists, split segments get new ones
+        self.segment_ids = np.arange(len(self.segments), dtype=np.int64)
+        self.next_segment_id = len(self.segments)
+        self.capacity_tree = MinSegmentTree(np.asarray(segment_capacities).tolist())
+        self.start_capacity = (
+            float(segment_capacities[0]) if len(segment_capacities) else 0.0
+        )
+
+        self.n_distance_evaluations = 0
+
+    @classmethod
+    def from_route(cls, route: "Route") -> "IncrementalRoute":
+        """
+        Starts from the planned delivery route of a Route
+        that already calculated its segment capacities
+        """
+        return cls(
+            route.planned_delivery_route, route.segment_capacities, metric=route.metric
+        )
+
+    def __len__(self) -> int:
+        return len(self.route)
+
+    def find_first_feasible_segment(self, size: float) -> int:
+        """
+        Index of the first planned segment a pickup of the size fits into,
+        the pickup also fits into all the segments after it.
+        Equal to the number of planned segments if it fits nowhere
+        """
+        return self.capacity_tree.find_last_below(size) + 1
+
+    def find_best_insertion(
+        self, location: np.ndarray, size: float
+    ) -> Optional[Insertion]:
+        """
+        Finds the closest segment of the current route a pickup fits into.
+        When two segments are equally close the later one is chosen,
+        the same as in Route.calculate_pickup_stop_distances_to_nearest_segment
+
+        Args:
+            location (np.ndarray): X and Y coordinates of the pickup
+            size (float): size of the pickup
+
+        Returns:
+            Optional[Insertion]: where to insert the pickup, None if it does not fit
+        """
+        first_planned_segment = self.find_first_feasible_segment(size)
+        if first_planned_segment >= len(self.capacity_tree):
+            return None
+
+        first_segment = int(
+            np.searchsorted(self.planned_segment_indices, first_planned_segment)
+        )
+        distances, segment_indices = self.metric.nearest_segments(
+            np.asarray(location, dtype=np.int64).reshape(1, 2),
+            self.segments[first_segment:],
+            max_tile_bytes=constants.SEGMENT_KERNEL_MAX_BYTES,
+        )
+        self.n_distance_evaluations += len(self.segments) - first_segment
+
+        return Insertion(
+            segment_index=first_segment + int(segment_indices[0]),
+            distance=float(distances[0]),
+        )
+
+    def get_ranks(self, distances: np.ndarray) -> List[float]:
+        """
+        Keys the pickups are ranked on by their distances to the route. The default
+        metric ranks on distances truncated to integers, the same as
+        Route.add_pickup_stop_to_route, so both choose the same first pickup
+        """
+        if self.metric.key == SQUARED_EUCLIDEAN.key:
+            return np.trunc(distances).tolist()
+        return np.asarray(distances, dtype=float).tolist()
+
+    def add_pickup(self, pickup: StopTable) -> Optional[Insertion]:
+        """
+        Inserts a pickup at its best feasible place and updates the capacities
+
+        Args:
+            pickup (StopTable): table holding the one pickup stop
+
+        Returns:
+            Optional[Insertion]: where the pickup was inserted, None if it did not fit
+        """
+        size = float(pickup.sizes[0])
+        insertion = self.find_best_insertion(pickup.locations[0], size)
+        if insertion is None:
+            logger.info(f"Pickup {pickup.ids[0]} does not fit into the route")
+            return None
+
+        self.insert_pickup(insertion.segment_index, pickup)
+        return insertion
+
+    def insert_pickup(self, segment_index: int, pickup: StopTable):
+        """
+        Inserts the pickup between the stops of a segment of the current route,
+        the caller has to make sure it fits
+        """
+        planned_segment = int(self.planned_segment_indices[segment_index])
+        self.capacity_tree.add(
+            planned_segment, len(self.capacity_tree), -float(pickup.sizes[0])
+        )
+
+        start_xy = self.segments[segment_index, :2]
+        end_xy = self.segments[segment_index, 2:]
+        pickup_xy = pickup.locations[0]
+        self.segments = np.concatenate(
+            [
+                self.segments[:segment_index],
+                [
+                    np.concatenate([start_xy, pickup_xy]),
+                    np.concatenate([pickup_xy, end_xy]),
+                ],
+                self.segments[segment_index + 1 :],
+            ]
+        )
+        self.planned_segment_indices = np.insert(
+            self.planned_segment_indices, segment_index + 1, planned_segment
+        )
+        self.segment_ids = np.concatenate(
+            [
+                self.segment_ids[:segment_index],
+                [self.next_segment_id, self.next_segment_id + 1],
+                self.segment_ids[segment_index + 1 :],
+            ]
+        )
+        self.next_segment_id += 2
+        self.route = self.route.insert(segment_index + 1, pickup)
+
+    def add_pickups(
+        self,
+        pickups: StopTable,
+        max_pickups: int,
+        counters: Optional[Dict[str, int]] = None,
+    ) -> List[Tuple[int, Insertion]]:
+        """
+        Inserts up to max_pickups of the pickups, always the one that can be inserted
+        closest to the route next. Equally close pickups go smaller first, then lower index,
+        distances are compared as ranked by get_ranks.
+
+        Candidate insertions are kept in a heap. The key of every candidate is at most
+        the distance of its pickup to any segment it fits into, so a candidate popped
+        from the heap that is still valid is the best insertion of all the pickups.
+        A candidate becomes invalid when its segment was split by another pickup or the
+        pickup does not fit anymore, then only that pickup is matched against the route
+        again. After every insertion the remaining pickups are only compared with
+        the two new segments.
+
+        Args:
+            pickups (StopTable): pickups to choose from
+            max_pickups (int): largest number of pickups to insert
+            counters (Dict[str, int], optional): gets the number of examined candidates
+            and distance evaluations added
+
+        Returns:
+            List[Tuple[int, Insertion]]: index of every inserted pickup and where it was
+            inserted, in the order of insertion
+        """
+        n_pickups = len(pickups)
+        if n_pickups == 0 or max_pickups <= 0:
+            return []
+
+        sizes = pickups.sizes.tolist()
+        n_candidates = 0
+        distance_evaluations_before = self.n_distance_evaluations
+
+        # the closest segment ignoring capacities is a lower bound for every pickup
+        distances, segment_indices = self.metric.nearest_segments(
+            pickups.locations,
+            self.segments,
+            max_tile_bytes=constants.SEGMENT_KERNEL_MAX_BYTES,
+        )
+        self.n_distance_evaluations += n_pickups * len(self.segments)
+        best_keys = distances.copy()
+        heap = [
+            (rank, sizes[index], index, distance, segment_id)
+            for index, (rank, distance, segment_id) in enumerate(
+                zip(
+                    self.get_ranks(distances),
+                    distances.tolist(),
+                    self.segment_ids[segment_indices].tolist(),
+                )
+            )
+        ]
+        heapq.heapify(heap)
+
+        is_inserted = np.zeros(n_pickups, dtype=bool)
+        insertions: List[Tuple[int, Insertion]] = []
+        while heap and len(insertions) < max_pickups:
+            _, size, index, distance, segment_id = heapq.heappop(heap)
+            if is_inserted[index]:
+                continue
+            n_candidates += 1
+
+            segment_index = self.get_segment_index(segment_id)
+            if segment_index is None or int(
+                self.planned_segment_indices[segment_index]
+            ) < self.find_first_feasible_segment(size):
+                insertion = self.find_best_insertion(pickups.locations[index], size)
+                if insertion is not None:
+                    best_keys[index] = insertion.distance
+                    new_segment_id = int(self.segment_ids[insertion.segment_index])
+                    (rank,) = self.get_ranks(np.array([insertion.distance]))
+                    heapq.heappush(
+                        heap, (rank, size, index, insertion.distance, new_segment_id)
+                    )
+                continue
+
+            self.insert_pickup(segment_index, pickups.take([index]))
+            is_inserted[index] = True
+            insertions.append((index, Insertion(segment_index, distance)))
+
+            # only the two segments replacing the split one can be closer than before
+            remaining = np.flatnonzero(~is_inserted)
+            new_distances, new_segments = self.metric.nearest_segments(
+                pickups.locations[remaining],
+                self.segments[segment_index : segment_index + 2],
+                max_tile_bytes=constants.SEGMENT_KERNEL_MAX_BYTES,
+            )
+            self.n_distance_evaluations += 2 * len(remaining)
+            closer = new_distances < best_keys[remaining]
+            improved = remaining[closer]
+            best_keys[improved] = new_distances[closer]
+            new_segment_ids = self.segment_ids[segment_index + new_segments[closer]]
+            for other_index, rank, new_distance, new_segment_id in zip(
+                improved.tolist(),
+                self.get_ranks(new_distances[closer]),
+                new_distances[closer].tolist(),
+                new_segment_ids.tolist(),
+            ):
+                heapq.heappush(
+                    heap,
+                    (
+                        rank,
+                        sizes[other_index],
+                        other_index,
+                        new_distance,
+                        new_segment_id,
+                    ),
+                )
+
+        if counters is not None:
+            counters["candidates_examined"] = (
+                counters.get("candidates_examined", 0) + n_candidates
+            )
+            counters["distance_evaluations"] = (
+                counters.get("distance_evaluations", 0)
+                + self.n_distance_evaluations
+                - distance_evaluations_before
+            )
+        logger.info(f"Inserted {len(insertions)} of {n_pickups} pickups")
+
+        return insertions
+
+    def get_segment_index(self, segment_id: int) -> Optional[int]:
+        """
+        Index of the segment with the id in the current route, None if it was split
+        """
+        matches = np.flatnonzero(self.segment_ids == segment_id)
+        return int(matches[0]) if len(matches) else None
+
+    @property
+    def segment_capacities(self) -> np.ndarray:
+        """
+        Free capacity of the van on every segment of the current route
+        """
+        sizes = self.route.sizes[1:-1]
+        kinds = self.route.kinds[1:-1]
+        changes = np.where(kinds == StopKind.PICKUP, -sizes, sizes)
+        return np.cumsum(np.concatenate([[self.start_capacity], changes]))
@@ -0,0 +1,147 @@
+import json
+import logging
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Callable, Dict, Iterator, List, Optional
+
+logger = logging.getLogger(__name__)
+
+
+class StageReport:
+    """
+    Measurements of one pipeline stage
+    """
+
+    def __init__(self, name: str):
+        self.name = name
+        self.wall_seconds = 0.0
+        self.cpu_seconds = 0.0
+        self.peak_memory_bytes: Optional[int] = None
+        self.counters: Dict[str, int] = {}
+
+    def to_dict(self) -> Dict:
+        return {
+            "name": self.name,
+            "wall_seconds": self.wall_seconds,
+            "cpu_seconds": self.cpu_seconds,
+            "peak_memory_bytes": self.peak_memory_bytes,
+            "counters": dict(self.counters),
+        }
+
+
+class RunReport:
+    """
+    Measurements of all the stages of one run, in the order they ran
+    """
+
+    def __init__(self):
+        self.stages: List[StageReport] = []
+
+    def get_stage(self, name: str) -> Optional[StageReport]:
+        for stage in self.stages:
+            if stage.name == name:
+                return stage
+        return None
+
+    def to_dict(self) -> Dict:
+        return {
+            "wall_seconds": sum(stage.wall_seconds for stage in self.stages),
+            "cpu_seconds": sum(stage.cpu_seconds for stage in self.stages),
+            "stages": [stage.to_dict() for stage in self.stages],
+        }
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_dict(), indent=2)
+
+
+class Instrumentation:
+    """
+    Collects wall time, CPU time, peak traced memory and counters per stage.
+
+    Stages are measured with the `stage` context manager, counters are added with
+    `count` and belong to the stage that is currently running.
+    The callback, if given, gets every StageReport as soon as the stage finishes.
+
+    Args:
+        trace_memory (bool, optional): measure the peak memory allocated in every stage
+        with tracemalloc. It slows down allocation heavy code. Defaults to True.
+        callback (Callable[[StageReport], None], optional): called after every stage.
+    """
+
+    enabled = True
+
+    def __init__(
+        self,
+        trace_memory: bool = True,
+        callback: Optional[Callable[[StageReport], None]] = None,
+    ):
+        self.trace_memory = trace_memory
+        self.callback = callback
+        self.report = RunReport()
+        self._current_stage: Optional[StageReport] = None
+
+    @contextmanager
+    def stage(self, name: str) -> Iterator[StageReport]:
+        stage_report = StageReport(name)
+        parent_stage = self._current_stage
+        self._current_stage = stage_report
+
+        started_tracing = False
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+                started_tracing = True
+            tracemalloc.reset_peak()
+            memory_at_start = tracemalloc.get_traced_memory()[0]
+
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield stage_report
+        finally:
+            stage_report.wall_seconds = time.perf_counter() - wall_start
+            stage_report.cpu_seconds = time.process_time() - cpu_start
+            if self.trace_memory:
+                peak_memory = tracemalloc.get_traced_memory()[1]
+                stage_report.peak_memory_bytes = max(peak_memory - memory_at_start, 0)
+                if started_tracing:
+                    tracemalloc.stop()
+
+            self._current_stage = parent_stage
+            self.report.stages.append(stage_report)
+            logger.info(
+                f"Stage {name} took {stage_report.wall_seconds * 1000:.2f}ms"
+                f" ({stage_report.cpu_seconds * 1000:.2f}ms CPU)"
+            )
+            if self.callback is not None:
+                self.callback(stage_report)
+
+    def count(self, name: str, value: int = 1):
+        """
+        Adds the value to a counter of the running stage
+        """
+        if self._current_stage is not None:
+            counters = self._current_stage.counters
+            counters[name] = counters.get(name, 0) + int(value)
+
+    def write_json(self, path: str):
+        with open(path, "w") as report_file:
+            report_file.write(self.report.to_json())
+
+
+class NullInstrumentation:
+    """
+    Instrumentation that measures nothing, used when instrumentation is disabled
+    """
+
+    enabled = False
+
+    def stage(self, name: str) -> nullcontext:
+        return nullcontext()
+
+    def count(self, name: str, value: int = 1):
+        pass
+
+
+NULL_INSTRUMENTATION = NullInstrumentation()
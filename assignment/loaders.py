@@ -0,0 +1,291 @@
+import itertools
+import logging
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+from assignment.stops import StopKind, StopTable
+
+try:
+    import pyarrow.parquet as parquet
+except ImportError:  # pragma: no cover - depends on the environment
+    parquet = None
+
+logger = logging.getLogger(__name__)
+
+# Rows validated and converted at once
+LOADER_CHUNK_SIZE = 1_000_000
+
+STOP_COLUMNS = ("x", "y", "size")
+
+# Optional column with the stop ids, the row numbers are used without it
+ID_COLUMN = "id"
+
+# (ids, locations, sizes) of one chunk of rows
+StopChunk = Tuple[Optional[np.ndarray], np.ndarray, np.ndarray]
+
+
+def load_stops(
+    path: str,
+    kind: StopKind,
+    columns: Optional[Dict[str, str]] = None,
+    chunk_size: int = LOADER_CHUNK_SIZE,
+) -> StopTable:
+    """
+    Reads stops from a .csv, .npy, .npz or .parquet file.
+
+    The file has x, y and size columns and optionally an id column, columns maps
+    these names to the names used in the file. CSV files need a header row.
+    .npy files hold either an n x 3 [x, y, size] array like utils.generate_stops
+    returns or a structured array with named fields, they are memory mapped.
+    .npz files hold one array per column. Parquet files need pyarrow.
+
+    The rows are converted and validated chunk by chunk. Files that know their number
+    of rows (.npy and .parquet) are converted straight into the columns of the table,
+    the others keep their converted chunks until the table is built.
+
+    Args:
+        path (str): file to read
+        kind (StopKind): kind of all the stops in the file
+        columns (Dict[str, str], optional): file column of x, y, size and id.
+        Defaults to the same names.
+        chunk_size (int, optional): rows converted at once. Defaults to LOADER_CHUNK_SIZE.
+
+    Raises:
+        ValueError: if the file has an unknown format, misses a column, has coordinates
+        that are not integers, negative or missing sizes or two stops at one location
+
+    Returns:
+        StopTable: the stops in the file order
+    """
+    chunks = iter_stop_chunks(path, columns=columns, chunk_size=chunk_size)
+    n_rows = count_rows(path)
+    if n_rows is None:
+        chunks = list(chunks)
+        n_rows = sum(len(sizes) for _, _, sizes in chunks)
+
+    stops = StopTable(
+        locations=np.empty((n_rows, 2), dtype=np.int64),
+        sizes=np.empty(n_rows, dtype=np.float64),
+        kinds=np.full(n_rows, kind, dtype=np.int8),
+        ids=np.empty(n_rows, dtype=np.int64),
+    )
+    start = 0
+    for ids, locations, sizes in chunks:
+        stop = start + len(sizes)
+        stops.locations[start:stop] = locations
+        stops.sizes[start:stop] = sizes
+        stops.ids[start:stop] = np.arange(start, stop) if ids is None else ids
+        start = stop
+
+    check_distinct_locations(stops.locations, path)
+
+    logger.info(f"Loaded {n_rows} stops from {path}")
+    return stops
+
+
+def count_rows(path: str) -> Optional[int]:
+    """
+    Number of rows of a .npy or .parquet file from its header, None for other files
+    """
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".npy":
+        return len(np.load(path, mmap_mode="r"))
+    if extension == ".parquet" and parquet is not None:
+        return parquet.ParquetFile(path).metadata.num_rows
+    return None
+
+
+def iter_stop_chunks(
+    path: str,
+    columns: Optional[Dict[str, str]] = None,
+    chunk_size: int = LOADER_CHUNK_SIZE,
+) -> Iterator[StopChunk]:
+    """
+    Reads a stop file chunk by chunk, see load_stops.
+    Every chunk is converted and validated on its own
+
+    Yields:
+        StopChunk: ids (None without an id column), int64 locations and float64 sizes
+    """
+    column_names = {name: name for name in (*STOP_COLUMNS, ID_COLUMN)}
+    column_names.update(columns or {})
+
+    extension = os.path.splitext(path)[1].lower()
+    if extension == ".csv":
+        raw_chunks = _iter_csv_columns(path, column_names, chunk_size)
+    elif extension == ".npy":
+        raw_chunks = _iter_npy_columns(path, column_names, chunk_size)
+    elif extension == ".npz":
+        raw_chunks = _iter_npz_columns(path, column_names, chunk_size)
+    elif extension == ".parquet":
+        raw_chunks = _iter_parquet_columns(path, column_names, chunk_size)
+    else:
+        raise ValueError(f"Cannot read stops from {extension} files")
+
+    first_row = 0
+    for raw_columns in raw_chunks:
+        yield convert_stop_chunk(raw_columns, first_row, path)
+        first_row += len(raw_columns["size"])
+
+
+def convert_stop_chunk(
+    raw_columns: Dict[str, np.ndarray], first_row: int, path: str
+) -> StopChunk:
+    """
+    Coerces the columns of one chunk to the StopTable dtypes and validates them
+
+    Args:
+        raw_columns (Dict[str, np.ndarray]): x, y, size and optionally id column
+        first_row (int): row number of the first row of the chunk, for error messages
+        path (str): file the chunk comes from, for error messages
+    """
+    sizes = np.asarray(raw_columns["size"], dtype=np.float64)
+    invalid_sizes = ~(sizes >= 0)
+    if invalid_sizes.any():
+        row = first_row + int(np.argmax(invalid_sizes))
+        raise ValueError(
+            f"{path} has {int(invalid_sizes.sum())} negative or missing sizes,"
+            f" the first in row {row}"
+        )
+
+    locations = np.empty((len(sizes), 2), dtype=np.int64)
+    for column_index, name in enumerate(("x", "y")):
+        locations[:, column_index] = _to_integers(
+            raw_columns[name], name, first_row, path
+        )
+
+    ids = None
+    if ID_COLUMN in raw_columns:
+        ids = _to_integers(raw_columns[ID_COLUMN], ID_COLUMN, first_row, path)
+
+    return ids, locations, sizes
+
+
+def check_distinct_locations(locations: np.ndarray, path: str):
+    """
+    Raises a ValueError if two stops share a location
+    """
+    order = np.lexsort((locations[:, 1], locations[:, 0]))
+    sorted_locations = locations[order]
+    is_repeated = (sorted_locations[1:] == sorted_locations[:-1]).all(axis=1)
+    if is_repeated.any():
+        first = int(np.argmax(is_repeated))
+        x, y = sorted_locations[first]
+        rows = sorted(order[first : first + 2].tolist())
+        raise ValueError(
+            f"{path} has {int(is_repeated.sum())} stops at repeated locations,"
+            f" e.g. rows {rows[0]} and {rows[1]} at ({x}, {y})"
+        )
+
+
+def _to_integers(
+    values: np.ndarray, name: str, first_row: int, path: str
+) -> np.ndarray:
+    values = np.asarray(values)
+    if np.issubdtype(values.dtype, np.integer):
+        return values.astype(np.int64, copy=False)
+
+    values = values.astype(np.float64, copy=False)
+    not_integer = ~np.isfinite(values) | (values != np.round(values))
+    if not_integer.any():
+        row = first_row + int(np.argmax(not_integer))
+        raise ValueError(f"{path} has a {name} that is not an integer in row {row}")
+    return values.astype(np.int64)
+
+
+def _select_columns(
+    available: List[str], column_names: Dict[str, str], path: str
+) -> Dict[str, str]:
+    """
+    File column of every stop column, the id column only if the file has it
+    """
+    missing = [
+        column_names[name]
+        for name in STOP_COLUMNS
+        if column_names[name] not in available
+    ]
+    if missing:
+        raise ValueError(f"{path} has no column {', '.join(missing)}")
+
+    return {
+        name: file_column
+        for name, file_column in column_names.items()
+        if name in STOP_COLUMNS or file_column in available
+    }
+
+
+def _iter_csv_columns(
+    path: str, column_names: Dict[str, str], chunk_size: int
+) -> Iterator[Dict[str, np.ndarray]]:
+    with open(path) as csv_file:
+        header = [column.strip() for column in csv_file.readline().split(",")]
+        selected = _select_columns(header, column_names, path)
+        use_columns = [header.index(file_column) for file_column in selected.values()]
+
+        first_row = 0
+        while True:
+            lines = list(itertools.islice(csv_file, chunk_size))
+            if not lines:
+                break
+            try:
+                values = np.loadtxt(
+                    lines, delimiter=",", usecols=use_columns, ndmin=2, dtype=np.float64
+                )
+            except ValueError as error:
+                raise ValueError(
+                    f"{path} has a value that is not a number after row {first_row}: {error}"
+                ) from error
+            first_row += len(lines)
+            yield {name: values[:, i] for i, name in enumerate(selected)}
+
+
+def _iter_npy_columns(
+    path: str, column_names: Dict[str, str], chunk_size: int
+) -> Iterator[Dict[str, np.ndarray]]:
+    array = np.load(path, mmap_mode="r")
+    if array.dtype.names is None:
+        if array.ndim != 2 or array.shape[1] != len(STOP_COLUMNS):
+            raise ValueError(f"{path} has to hold an n x 3 [x, y, size] array")
+        for start in range(0, len(array), chunk_size):
+            chunk = array[start : start + chunk_size]
+            yield {name: chunk[:, i] for i, name in enumerate(STOP_COLUMNS)}
+        return
+
+    selected = _select_columns(list(array.dtype.names), column_names, path)
+    for start in range(0, len(array), chunk_size):
+        chunk = array[start : start + chunk_size]
+        yield {name: chunk[file_column] for name, file_column in selected.items()}
+
+
+def _iter_npz_columns(
+    path: str, column_names: Dict[str, str], chunk_size: int
+) -> Iterator[Dict[str, np.ndarray]]:
+    # members of an archive cannot be memory mapped, every column is read once
+    with np.load(path) as archive:
+        selected = _select_columns(list(archive.files), column_names, path)
+        arrays = {name: archive[file_column] for name, file_column in selected.items()}
+
+    n_rows = len(arrays["size"])
+    for start in range(0, n_rows, chunk_size):
+        yield {
+            name: array[start : start + chunk_size] for name, array in arrays.items()
+        }
+
+
+def _iter_parquet_columns(
+    path: str, column_names: Dict[str, str], chunk_size: int
+) -> Iterator[Dict[str, np.ndarray]]:
+    if parquet is None:
+        raise ValueError("Reading parquet files needs pyarrow, pip install pyarrow")
+
+    parquet_file = parquet.ParquetFile(path, memory_map=True)
+    selected = _select_columns(parquet_file.schema_arrow.names, column_names, path)
+    for batch in parquet_file.iter_batches(
+        batch_size=chunk_size, columns=list(selected.values())
+    ):
+        yield {
+            name: batch.column(file_column).to_numpy(zero_copy_only=False)
+            for name, file_column in selected.items()
+        }
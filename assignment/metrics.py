@@ -0,0 +1,377 @@
+import logging
+import math
+from typing import Dict, Optional, Tuple
+
+import numpy as np
+
+from assignment import constants
+from assignment.distance_cache import get_key
+from assignment.spatial import (
+    calculate_route_length,
+    nearest_neighbour_order,
+    nearest_segments,
+)
+
+logger = logging.getLogger(__name__)
+
+EARTH_RADIUS_METRES = 6_371_000.0
+
+# Haversine coordinates are integer microdegrees, x is the longitude and y the latitude
+HAVERSINE_DEGREES_PER_UNIT = 1e-6
+
+# Bytes of float64 temporaries the generic segment kernel keeps per (stop, segment) pair
+_SEGMENT_BYTES_PER_PAIR = 4 * 8
+
+
+class DistanceMetric:
+    """
+    Distance backend of the planning. Every backend computes distances between
+    many locations at once, the planning never asks for a single pair.
+
+    A backend implements many_to_many and paired, the rest is built on them:
+    the distance of a stop to a segment is the detour of visiting the stop
+    on the way, d(start, stop) + d(stop, end) - d(start, end), and the nearest
+    neighbour tour looks up the distances from the current stop to all the others.
+    """
+
+    name = ""
+    # d(a, b) == d(b, a), tour improvements rely on it
+    symmetric = True
+
+    @property
+    def key(self) -> str:
+        """
+        Identifies the metric and its data, part of cache keys
+        """
+        return self.name
+
+    def many_to_many(self, origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+        """
+        n x m distances from n origins to m destinations, both n x 2 coordinates
+        """
+        raise NotImplementedError
+
+    def paired(self, origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+        """
+        Distance from every origin to the destination in the same row
+        """
+        raise NotImplementedError
+
+    def one_to_many(self, origin: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+        """
+        Distances from one origin to m destinations
+        """
+        return self.many_to_many(np.asarray(origin).reshape(1, 2), destinations)[0]
+
+    def leg_lengths(self, origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+        """
+        Length of the leg from every origin to the destination in the same row,
+        in the units of route_length
+        """
+        return self.paired(origins, destinations)
+
+    def route_length(self, locations: np.ndarray) -> float:
+        """
+        Length of a route going through the locations in order
+        """
+        locations = np.asarray(locations)
+        return float(self.leg_lengths(locations[:-1], locations[1:]).sum())
+
+    def segment_distances(self, points: np.ndarray, segments: np.ndarray) -> np.ndarray:
+        """
+        n x m detours of visiting every point on every segment
+
+        Args:
+            points (np.ndarray): n x 2 coordinates
+            segments (np.ndarray): m x 4 segments as (start x, start y, end x, end y)
+        """
+        detours = self.many_to_many(segments[:, :2], points).T
+        detours += self.many_to_many(points, segments[:, 2:])
+        detours -= self.paired(segments[:, :2], segments[:, 2:])
+        return detours
+
+    def nearest_segments(
+        self,
+        points: np.ndarray,
+        segments: np.ndarray,
+        max_tile_bytes: int = constants.SEGMENT_KERNEL_MAX_BYTES,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Distance to and index of the closest segment of every point, computed
+        for tiles of points. When several segments are equally close,
+        the one with the highest index wins, like in spatial.nearest_segments
+        """
+        n_points = len(points)
+        n_segments = len(segments)
+        min_distances = np.full(n_points, np.inf)
+        closest_segments = np.zeros(n_points, dtype=np.int64)
+        if n_points == 0 or n_segments == 0:
+            return min_distances, closest_segments
+
+        segments = np.asarray(segments)
+        tile = max(1, max_tile_bytes // (_SEGMENT_BYTES_PER_PAIR * n_segments))
+        for start in range(0, n_points, tile):
+            distances = self.segment_distances(points[start : start + tile], segments)
+            # argmin on the reversed columns gives the last index of the minimum
+            last_min = n_segments - 1 - np.argmin(distances[:, ::-1], axis=1)
+            min_distances[start : start + tile] = distances[
+                np.arange(len(last_min)), last_min
+            ]
+            closest_segments[start : start + tile] = last_min
+
+        return min_distances, closest_segments
+
+    def nearest_neighbour_order(
+        self,
+        locations: np.ndarray,
+        start_location: Tuple[int, int],
+        counters: Optional[Dict[str, int]] = None,
+    ) -> np.ndarray:
+        """
+        Orders the stops by always going to the closest stop not visited yet,
+        ties go to the lower index. Every step is one one_to_many call
+        """
+        n_stops = len(locations)
+        order = np.zeros(n_stops, dtype=np.int64)
+        visited = np.zeros(n_stops, dtype=bool)
+        current = np.asarray(start_location)
+        for step in range(n_stops):
+            distances = np.where(visited, np.inf, self.one_to_many(current, locations))
+            index = int(np.argmin(distances))
+            order[step] = index
+            visited[index] = True
+            current = locations[index]
+
+        if counters is not None:
+            counters["distance_evaluations"] = (
+                counters.get("distance_evaluations", 0) + n_stops * n_stops
+            )
+        return order
+
+
+class SquaredEuclideanMetric(DistanceMetric):
+    """
+    Squared euclidean distances on integer coordinates, the default.
+    Closest stops are found with the grid index and the distance to a segment
+    is the squared distance to its closest point, route lengths are euclidean
+    """
+
+    name = "squared-euclidean"
+
+    def many_to_many(self, origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+        origins = np.asarray(origins, dtype=np.float64)
+        destinations = np.asarray(destinations, dtype=np.float64)
+        distances = origins[:, 0, None] - destinations[None, :, 0]
+        distances *= distances
+        y_diffs = origins[:, 1, None] - destinations[None, :, 1]
+        y_diffs *= y_diffs
+        distances += y_diffs
+        return distances
+
+    def paired(self, origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+        diffs = np.asarray(origins, dtype=np.float64) - destinations
+        return (diffs**2).sum(axis=1)
+
+    def leg_lengths(self, origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+        return np.sqrt(self.paired(origins, destinations))
+
+    def route_length(self, locations: np.ndarray) -> float:
+        return calculate_route_length(locations)
+
+    def nearest_segments(
+        self,
+        points: np.ndarray,
+        segments: np.ndarray,
+        max_tile_bytes: int = constants.SEGMENT_KERNEL_MAX_BYTES,
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        return nearest_segments(points, segments, max_tile_bytes=max_tile_bytes)
+
+    def nearest_neighbour_order(
+        self,
+        locations: np.ndarray,
+        start_location: Tuple[int, int],
+        counters: Optional[Dict[str, int]] = None,
+    ) -> np.ndarray:
+        return nearest_neighbour_order(locations, start_location, counters)
+
+
+class ManhattanMetric(DistanceMetric):
+    """
+    Sum of the absolute coordinate differences, for grid-like street networks
+    """
+
+    name = "manhattan"
+
+    def many_to_many(self, origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+        origins = np.asarray(origins, dtype=np.float64)
+        destinations = np.asarray(destinations, dtype=np.float64)
+        distances = np.abs(origins[:, 0, None] - destinations[None, :, 0])
+        distances += np.abs(origins[:, 1, None] - destinations[None, :, 1])
+        return distances
+
+    def paired(self, origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+        diffs = np.asarray(origins, dtype=np.float64) - destinations
+        return np.abs(diffs).sum(axis=1)
+
+
+class HaversineMetric(DistanceMetric):
+    """
+    Great circle distances in metres. The coordinates are integer longitudes (x)
+    and latitudes (y) in units of degrees_per_unit, microdegrees by default
+
+    Args:
+        degrees_per_unit (float, optional): degrees of one coordinate unit.
+        Defaults to HAVERSINE_DEGREES_PER_UNIT.
+    """
+
+    name = "haversine"
+
+    def __init__(self, degrees_per_unit: float = HAVERSINE_DEGREES_PER_UNIT):
+        self.radians_per_unit = math.radians(degrees_per_unit)
+
+    @property
+    def key(self) -> str:
+        return f"{self.name}-{self.radians_per_unit!r}"
+
+    def many_to_many(self, origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+        origins = np.asarray(origins, dtype=np.float64) * self.radians_per_unit
+        destinations = (
+            np.asarray(destinations, dtype=np.float64) * self.radians_per_unit
+        )
+        return self._haversine(
+            origins[:, 0, None],
+            origins[:, 1, None],
+            destinations[None, :, 0],
+            destinations[None, :, 1],
+        )
+
+    def paired(self, origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+        origins = np.asarray(origins, dtype=np.float64) * self.radians_per_unit
+        destinations = (
+            np.asarray(destinations, dtype=np.float64) * self.radians_per_unit
+        )
+        return self._haversine(
+            origins[:, 0], origins[:, 1], destinations[:, 0], destinations[:, 1]
+        )
+
+    @staticmethod
+    def _haversine(
+        lon1: np.ndarray, lat1: np.ndarray, lon2: np.ndarray, lat2: np.ndarray
+    ) -> np.ndarray:
+        half_chord = (
+            np.sin((lat2 - lat1) / 2) ** 2
+            + np.cos(lat1) * np.cos(lat2) * np.sin((lon2 - lon1) / 2) ** 2
+        )
+        return 2 * EARTH_RADIUS_METRES * np.arcsin(np.sqrt(np.minimum(half_chord, 1)))
+
+
+class MatrixMetric(DistanceMetric):
+    """
+    Distances looked up in a precomputed matrix, e.g. travel times. Row i and column i
+    belong to locations[i], the depot and every stop have to be among the locations.
+    The matrix does not have to be symmetric
+
+    Args:
+        locations (np.ndarray): n x 2 integer coordinates of the matrix rows
+        matrix (np.ndarray): n x n distances, from the row location to the column location
+    """
+
+    name = "matrix"
+
+    def __init__(self, locations: np.ndarray, matrix: np.ndarray):
+        locations = np.asarray(locations, dtype=np.int64)
+        if matrix.shape != (len(locations), len(locations)):
+            raise ValueError(
+                f"A matrix of {len(locations)} locations has to be"
+                f" {len(locations)} x {len(locations)}, not {matrix.shape}"
+            )
+        self.locations = locations
+        self.matrix = matrix
+        self.symmetric = bool(np.array_equal(matrix, matrix.T))
+
+        self._low = locations.min(axis=0) if len(locations) else np.zeros(2, np.int64)
+        self._height = int(np.ptp(locations[:, 1])) + 1 if len(locations) else 1
+        location_keys = self._location_keys(locations)
+        self._key_order = np.argsort(location_keys, kind="stable")
+        self._sorted_keys = location_keys[self._key_order]
+        if (self._sorted_keys[1:] == self._sorted_keys[:-1]).any():
+            raise ValueError("The locations of a distance matrix have to be distinct")
+        self._metric_key: Optional[str] = None
+
+    @classmethod
+    def from_file(cls, path: str) -> "MatrixMetric":
+        """
+        Reads an .npz file with a "locations" and a "matrix" array
+        """
+        with np.load(path) as matrix_file:
+            return cls(matrix_file["locations"], matrix_file["matrix"])
+
+    @property
+    def key(self) -> str:
+        if self._metric_key is None:
+            self._metric_key = f"{self.name}-{get_key([self.locations, self.matrix])}"
+        return self._metric_key
+
+    def get_rows(self, locations: np.ndarray) -> np.ndarray:
+        """
+        Matrix row of every location
+
+        Raises:
+            ValueError: if a location is not in the matrix
+        """
+        locations = np.asarray(locations, dtype=np.int64).reshape(-1, 2)
+        keys = self._location_keys(locations)
+        positions = np.searchsorted(self._sorted_keys, keys)
+        positions = np.minimum(positions, len(self._sorted_keys) - 1)
+        rows = self._key_order[positions]
+        missing = (self.locations[rows] != locations).any(axis=1)
+        if missing.any():
+            x, y = locations[int(np.argmax(missing))]
+            raise ValueError(f"Location ({x}, {y}) is not in the distance matrix")
+        return rows
+
+    def many_to_many(self, origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+        return np.asarray(
+            self.matrix[np.ix_(self.get_rows(origins), self.get_rows(destinations))],
+            dtype=np.float64,
+        )
+
+    def paired(self, origins: np.ndarray, destinations: np.ndarray) -> np.ndarray:
+        return np.asarray(
+            self.matrix[self.get_rows(origins), self.get_rows(destinations)],
+            dtype=np.float64,
+        )
+
+    def _location_keys(self, locations: np.ndarray) -> np.ndarray:
+        """
+        One int64 per location, outside the matrix area keys may repeat
+        but get_rows compares the coordinates anyway
+        """
+        shifted = locations - self._low
+        return shifted[:, 0] * self._height + shifted[:, 1]
+
+
+SQUARED_EUCLIDEAN = SquaredEuclideanMetric()
+
+METRIC_NAMES = ("squared-euclidean", "manhattan", "haversine", "matrix")
+
+
+def get_metric(name: str, matrix_path: Optional[str] = None) -> DistanceMetric:
+    """
+    Metric backend by its name in METRIC_NAMES, the matrix metric reads
+    its matrix from matrix_path, see MatrixMetric.from_file
+
+    Raises:
+        ValueError: for unknown names or a matrix metric without a matrix
+    """
+    if name == "squared-euclidean":
+        return SQUARED_EUCLIDEAN
+    if name == "manhattan":
+        return ManhattanMetric()
+    if name == "haversine":
+        return HaversineMetric()
+    if name == "matrix":
+        if not matrix_path:
+            raise ValueError("The matrix metric needs a distance matrix file")
+        return MatrixMetric.from_file(matrix_path)
+    raise ValueError(f"Unknown metric {name}, expected one of {METRIC_NAMES}")
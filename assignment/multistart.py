@@ -0,0 +1,204 @@
+import logging
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ProcessPoolExecutor, wait
+from typing import Dict, Optional, Set, Tuple
+
+import numpy as np
+
+from assignment.metrics import SQUARED_EUCLIDEAN, DistanceMetric
+
+logger = logging.getLogger(__name__)
+
+# Largest number of tours built, more starts hardly ever find a shorter one
+MAX_STARTS = 256
+
+# Randomized tours start with one of this many stops closest to the start location
+FIRST_STOP_CANDIDATES = 8
+
+# Stops, start location and metric of the tours a worker process builds,
+# set once per worker by init_tour_worker
+_worker_tours: Dict = {}
+
+
+def randomized_nearest_neighbour_order(
+    locations: np.ndarray,
+    start_location: Tuple[int, int],
+    seed: int,
+    start_index: int,
+    metric: DistanceMetric = SQUARED_EUCLIDEAN,
+) -> np.ndarray:
+    """
+    Nearest neighbour tour with a random first stop among the FIRST_STOP_CANDIDATES
+    closest ones and random tie-breaks. The stops are shuffled before building the tour,
+    so equally close stops are taken in a random order instead of the lowest index first.
+    The same seed and start index always give the same tour
+
+    Returns:
+        np.ndarray: indices of the stops in the visiting order
+    """
+    n_stops = len(locations)
+    if n_stops == 0:
+        return np.zeros(0, dtype=np.int64)
+
+    random_generator = np.random.default_rng([seed, start_index])
+    permutation = random_generator.permutation(n_stops)
+    shuffled = np.asarray(locations, dtype=np.int64)[permutation]
+
+    distances = metric.one_to_many(np.asarray(start_location), shuffled)
+    n_candidates = min(FIRST_STOP_CANDIDATES, n_stops)
+    candidates = np.sort(np.argpartition(distances, n_candidates - 1)[:n_candidates])
+    first_stop = int(random_generator.choice(candidates))
+
+    rest = np.delete(np.arange(n_stops), first_stop)
+    rest_order = metric.nearest_neighbour_order(
+        shuffled[rest], tuple(shuffled[first_stop])
+    )
+    order = np.concatenate([[first_stop], rest[rest_order]])
+    return permutation[order]
+
+
+def init_tour_worker(
+    locations: np.ndarray, start_location: Tuple[int, int], metric: DistanceMetric
+):
+    """
+    Keeps the stops of the tours in the worker process, so every task only
+    sends its seed and start index, see build_worker_tour
+    """
+    _worker_tours.update(
+        locations=locations, start_location=start_location, metric=metric
+    )
+
+
+def build_worker_tour(seed: int, start_index: int) -> np.ndarray:
+    """
+    randomized_nearest_neighbour_order of the stops given to init_tour_worker
+    """
+    return randomized_nearest_neighbour_order(
+        _worker_tours["locations"],
+        _worker_tours["start_location"],
+        seed,
+        start_index,
+        _worker_tours["metric"],
+    )
+
+
+def get_tour_length(
+    locations: np.ndarray,
+    start_location: Tuple[int, int],
+    order: np.ndarray,
+    metric: DistanceMetric = SQUARED_EUCLIDEAN,
+) -> float:
+    """
+    Length of the tour from the start location through the stops in order and back
+    """
+    return metric.route_length(
+        np.concatenate([[start_location], locations[order], [start_location]])
+    )
+
+
+def multi_start_nearest_neighbour_order(
+    locations: np.ndarray,
+    start_location: Tuple[int, int],
+    time_budget: float,
+    max_workers: int = 1,
+    seed: int = 0,
+    counters: Optional[Dict[str, int]] = None,
+    metric: DistanceMetric = SQUARED_EUCLIDEAN,
+) -> np.ndarray:
+    """
+    Builds nearest neighbour tours from several starts and keeps the shortest one.
+
+    The first tour is the plain nearest neighbour order of the metric, so the result
+    is never longer than it. The other tours come from
+    randomized_nearest_neighbour_order with the start index as part of the seed.
+    New tours are started until the time budget is used up or MAX_STARTS were built.
+    The tours already running when the budget runs out are still finished.
+
+    The tours are built in max_workers processes, the grid search is pure Python
+    and would not run in parallel in threads. The stops and the metric are sent
+    to every process once, see init_tour_worker. Equally long tours go to the lower
+    start index, so with a budget large enough for MAX_STARTS tours the result
+    does not depend on the number of workers.
+
+    Args:
+        locations (np.ndarray): n x 2 coordinates of the stops
+        start_location (Tuple[int, int]): X and Y coordinates of the starting point
+        time_budget (float): wall clock budget in seconds
+        max_workers (int, optional): number of processes, 1 builds the tours
+        in this process. Defaults to 1.
+        seed (int, optional): seed of the random starts. Defaults to 0.
+        counters (Dict[str, int], optional): gets the number of built tours added
+        under "construction_starts"
+        metric (DistanceMetric, optional): distances the tours are built and compared
+        with. Defaults to metrics.SQUARED_EUCLIDEAN.
+
+    Returns:
+        np.ndarray: indices of the stops in the visiting order of the shortest tour
+    """
+    deadline = time.perf_counter() + time_budget
+    best_order = metric.nearest_neighbour_order(locations, start_location)
+    best = (get_tour_length(locations, start_location, best_order, metric), 0)
+    n_starts = 1
+
+    def keep_if_shorter(order: np.ndarray, start_index: int):
+        nonlocal best, best_order
+        candidate = (
+            get_tour_length(locations, start_location, order, metric),
+            start_index,
+        )
+        if candidate < best:
+            best = candidate
+            best_order = order
+
+    if len(locations) > 1 and max_workers <= 1:
+        while n_starts < MAX_STARTS and time.perf_counter() < deadline:
+            order = randomized_nearest_neighbour_order(
+                locations, start_location, seed, n_starts, metric
+            )
+            keep_if_shorter(order, n_starts)
+            n_starts += 1
+    elif len(locations) > 1:
+        with ProcessPoolExecutor(
+            max_workers=max_workers,
+            initializer=init_tour_worker,
+            initargs=(locations, start_location, metric),
+        ) as executor:
+            running: Set[Future] = set()
+            start_indices: Dict[Future, int] = {}
+            while True:
+                while (
+                    len(running) < 2 * max_workers
+                    and n_starts < MAX_STARTS
+                    and time.perf_counter() < deadline
+                ):
+                    future = executor.submit(build_worker_tour, seed, n_starts)
+                    running.add(future)
+                    start_indices[future] = n_starts
+                    n_starts += 1
+                if not running:
+                    break
+
+                done, running = wait(
+                    running,
+                    timeout=max(deadline - time.perf_counter(), 0),
+                    return_when=FIRST_COMPLETED,
+                )
+                for future in done:
+                    keep_if_shorter(future.result(), start_indices.pop(future))
+                if time.perf_counter() >= deadline:
+                    # queued tours are dropped, running ones are waited for
+                    for future in running:
+                        if future.cancel():
+                            n_starts -= 1
+                    for future in wait(running).done:
+                        if not future.cancelled():
+                            keep_if_shorter(future.result(), start_indices[future])
+                    break
+
+    if counters is not None:
+        counters["construction_starts"] = (
+            counters.get("construction_starts", 0) + n_starts
+        )
+    logger.info(f"Kept the tour of start {best[1]} out of {n_starts} starts")
+
+    return best_order
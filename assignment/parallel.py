@@ -0,0 +1,63 @@
+from multiprocessing import shared_memory
+from typing import Dict, Tuple
+
+import numpy as np
+
+# (shared memory block name, shape, dtype string)
+SharedArrayDescriptor = Tuple[str, Tuple[int, ...], str]
+
+
+class SharedArrays:
+    """
+    Owns shared memory copies of numpy arrays so worker processes can read them
+    without pickling. Pass `descriptors` to the workers and open them with attach_arrays.
+    Use it as a context manager, the memory is released on exit.
+    """
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        self._blocks = []
+        self.descriptors: Dict[str, SharedArrayDescriptor] = {}
+
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            shared = np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)
+            shared[...] = array
+
+            self._blocks.append(block)
+            self.descriptors[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        for block in self._blocks:
+            block.close()
+            block.unlink()
+        self._blocks = []
+
+    def __enter__(self) -> "SharedArrays":
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+def attach_arrays(
+    descriptors: Dict[str, SharedArrayDescriptor],
+) -> Tuple[Dict[str, np.ndarray], list]:
+    """
+    Opens arrays shared by SharedArrays in a worker process
+
+    Args:
+        descriptors (Dict[str, SharedArrayDescriptor]): SharedArrays.descriptors
+
+    Returns:
+        Tuple[Dict[str, np.ndarray], list]: the arrays by name and the shared memory blocks,
+        the blocks have to be closed once the arrays are not used anymore
+    """
+    arrays = {}
+    blocks = []
+    for name, (block_name, shape, dtype) in descriptors.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        arrays[name] = np.ndarray(shape, dtype=np.dtype(dtype), buffer=block.buf)
+        blocks.append(block)
+
+    return arrays, blocks
@@ -1,37 +1,112 @@
-import matplotlib.pyplot as plt
-
-
-def plot_route(route, extra_stops_to_plot=[]):
-    plt.figure(figsize=(20, 14))
-
-    if len(extra_stops_to_plot) > 0:
-        for stop in extra_stops_to_plot:
-            x, y = stop.get_location()
-            plt.scatter(x, y, s=30, c="gray")
-
-    prev_x = None
-    prev_y = None
-    for stop in route:
-        x, y = stop.get_location()
-        if stop.is_depot:
-            color = "green"
-        elif stop.is_pickup:
-            color = "red"
-        else:
-            color = "blue"
-        plt.scatter(x, y, s=30, c=color)
-        if prev_x is not None:
-            # plt.plot([prev_x, x], [prev_y, y], color="black")
-            plt.arrow(
-                prev_x,
-                prev_y,
-                x - prev_x,
-                y - prev_y,
-                color="black",
-                length_includes_head=True,
-                head_width=5,
-            )
-        prev_x = x
-        prev_y = y
+from typing import Iterable, Optional, Union
 
+import numpy as np
+from matplotlib.axes import Axes
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.figure import Figure
+
+from assignment.stops import RouteStop, StopKind, StopTable
+
+# Longer routes only get every n-th delivery drawn, so they render in seconds
+PLOT_MAX_STOPS = 20_000
+
+FIGURE_SIZE = (20, 14)
+
+STOP_COLORS = {
+    StopKind.DEPOT: "green",
+    StopKind.PICKUP: "red",
+    StopKind.DELIVERY: "blue",
+}
+
+
+def plot_route(
+    route, extra_stops_to_plot=[], max_stops: Optional[int] = PLOT_MAX_STOPS
+):
+    """
+    Shows the route in an interactive window, blocks until it is closed
+    """
+    import matplotlib.pyplot as plt
+
+    figure = plt.figure(figsize=FIGURE_SIZE)
+    draw_route(figure.gca(), route, extra_stops_to_plot, max_stops=max_stops)
     plt.show()
+
+
+def save_route_plot(
+    route: Union[StopTable, Iterable[RouteStop]],
+    path: str,
+    extra_stops_to_plot: Union[StopTable, Iterable[RouteStop]] = (),
+    max_stops: Optional[int] = PLOT_MAX_STOPS,
+):
+    """
+    Renders the route into an image file without a display and without pyplot,
+    the format follows the extension of the path, e.g. .png or .svg
+    """
+    figure = Figure(figsize=FIGURE_SIZE)
+    FigureCanvasAgg(figure)
+    draw_route(figure.add_subplot(), route, extra_stops_to_plot, max_stops=max_stops)
+    figure.savefig(path)
+
+
+def draw_route(
+    axes: Axes,
+    route: Union[StopTable, Iterable[RouteStop]],
+    extra_stops_to_plot: Union[StopTable, Iterable[RouteStop]] = (),
+    max_stops: Optional[int] = PLOT_MAX_STOPS,
+):
+    """
+    Draws the stops with one scatter per kind of stop and the legs between them
+    as one set of arrows. Extra stops are drawn in gray underneath.
+
+    Args:
+        axes (Axes): axes to draw on
+        route (Union[StopTable, Iterable[RouteStop]]): stops in the visiting order
+        extra_stops_to_plot (Union[StopTable, Iterable[RouteStop]], optional):
+        other stops to show. Defaults to none.
+        max_stops (int, optional): routes with more stops are drawn decimated,
+        see decimate_route. None draws every stop. Defaults to PLOT_MAX_STOPS.
+    """
+    route = _as_stop_table(route)
+    extra_stops = _as_stop_table(extra_stops_to_plot)
+    if max_stops is not None and len(route) > max_stops:
+        route = decimate_route(route, max_stops)
+
+    if len(extra_stops):
+        axes.scatter(extra_stops.x, extra_stops.y, s=30, c="gray")
+
+    for kind, color in STOP_COLORS.items():
+        is_kind = route.kinds == kind
+        if is_kind.any():
+            axes.scatter(route.x[is_kind], route.y[is_kind], s=30, c=color)
+
+    if len(route) > 1:
+        starts = route.locations[:-1]
+        moves = route.locations[1:] - starts
+        axes.quiver(
+            starts[:, 0],
+            starts[:, 1],
+            moves[:, 0],
+            moves[:, 1],
+            angles="xy",
+            scale_units="xy",
+            scale=1,
+            width=0.001,
+            color="black",
+        )
+
+
+def decimate_route(route: StopTable, max_stops: int) -> StopTable:
+    """
+    Keeps every n-th delivery of the route so about max_stops stops are left,
+    the depots and pickups are always kept
+    """
+    step = int(np.ceil(len(route) / max_stops))
+    keep = route.kinds != StopKind.DELIVERY
+    keep[::step] = True
+    return route.take(np.flatnonzero(keep))
+
+
+def _as_stop_table(stops: Union[StopTable, Iterable[RouteStop]]) -> StopTable:
+    if isinstance(stops, StopTable):
+        return stops
+    return StopTable.from_stops(stops)
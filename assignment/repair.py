@@ -0,0 +1,250 @@
+import logging
+from typing import TYPE_CHECKING, List, NamedTuple, Optional
+
+import numpy as np
+
+from assignment.metrics import DistanceMetric
+from assignment.stops import StopKind, StopTable
+
+if TYPE_CHECKING:
+    from assignment.routes import Route
+
+logger = logging.getLogger(__name__)
+
+
+class Splice(NamedTuple):
+    """
+    Change of a planned route by one repair
+    """
+
+    # row of the inserted or removed delivery in the planned delivery route
+    position: int
+    # change of the route length, negative for removals
+    cost: float
+
+
+def get_insertion_costs(
+    segments: np.ndarray, location: np.ndarray, metric: DistanceMetric
+) -> np.ndarray:
+    """
+    How much longer the route gets when the location is visited on each segment.
+    Every segment starts where the previous one ends, so the legs to and from
+    the location are computed once per stop, and only once for symmetric metrics
+
+    Args:
+        segments (np.ndarray): m x 4 consecutive segments of a route
+        as (start x, start y, end x, end y)
+        location (np.ndarray): X and Y coordinates of the stop
+        metric (DistanceMetric): gives the leg lengths
+
+    Returns:
+        np.ndarray: m extra lengths
+    """
+    starts = segments[:, :2]
+    ends = segments[:, 2:]
+    stops = np.concatenate([starts, ends[-1:]])
+    points = np.broadcast_to(np.asarray(location), stops.shape)
+    to_location = metric.leg_lengths(stops, points)
+    from_location = (
+        to_location if metric.symmetric else metric.leg_lengths(points, stops)
+    )
+    return to_location[:-1] + from_location[1:] - metric.leg_lengths(starts, ends)
+
+
+def insert_delivery(route: "Route", delivery: StopTable) -> Optional[Splice]:
+    """
+    Inserts one delivery into a planned Route on the segment where it makes the route
+    the least longer, among the segments the van still has room for it on.
+
+    Only the segments before the delivery carry more load. Their capacities are
+    lowered and the segment is split, nothing else is planned again. The capacities
+    only grow along the route, so the delivery fits every segment once it fits
+    the first one. Pickups on the final route before the delivery are checked again,
+    see revalidate_pickups.
+
+    Args:
+        route (Route): route that went through plan_route
+        delivery (StopTable): table holding the one delivery
+
+    Returns:
+        Optional[Splice]: where the delivery was inserted, None if it does not fit
+    """
+    size = float(delivery.sizes[0])
+    capacities = route.segment_capacities
+    # the delivery is loaded at the depot, so it has to fit every segment before it
+    if len(capacities) == 0 or capacities[0] < size:
+        logger.info(f"Delivery {delivery.ids[0]} does not fit into the route")
+        return None
+
+    location = delivery.locations[0]
+    costs = get_insertion_costs(route.route_segments, location, route.metric)
+    segment_index = int(np.argmin(costs))
+    position = segment_index + 1
+
+    if len(route.final_route):
+        final_position = int(get_planned_rows(route.final_route)[position])
+        route.final_route = route.final_route.insert(final_position, delivery)
+
+    segments = route.route_segments
+    start_xy = segments[segment_index, :2]
+    end_xy = segments[segment_index, 2:]
+    route.route_segments = np.concatenate(
+        [
+            segments[:segment_index],
+            [
+                np.concatenate([start_xy, location]),
+                np.concatenate([location, end_xy]),
+            ],
+            segments[position:],
+        ]
+    )
+    route.segment_capacities = np.concatenate(
+        [
+            capacities[:position] - size,
+            capacities[segment_index:position],
+            capacities[position:],
+        ]
+    )
+    route.planned_delivery_route = route.planned_delivery_route.insert(
+        position, delivery
+    )
+    # the delivery is the last chosen one, it is not among the possible deliveries
+    route.delivery_order = np.insert(
+        route.delivery_order, segment_index, len(route.chosen_deliveries)
+    )
+    route.chosen_delivery_indices = np.append(route.chosen_delivery_indices, -1)
+    route.chosen_deliveries = StopTable.concatenate([route.chosen_deliveries, delivery])
+    route.route_capacity_usage += size
+
+    if len(route.final_route):
+        revalidate_pickups(route, final_position)
+
+    logger.info(f"Inserted delivery {delivery.ids[0]} at {position}")
+    return Splice(position=position, cost=float(costs[segment_index]))
+
+
+def remove_delivery(route: "Route", stop_id: int) -> Optional[Splice]:
+    """
+    Removes a delivery from a planned Route by its id and joins its two neighbours.
+
+    The segments before it carry less load afterwards, so their capacities go up
+    and every chosen pickup still fits
+
+    Returns:
+        Optional[Splice]: where the delivery was, None if it is not on the route
+    """
+    planned = route.planned_delivery_route
+    matches = np.flatnonzero(
+        (planned.ids == stop_id) & (planned.kinds == StopKind.DELIVERY)
+    )
+    if len(matches) == 0:
+        return None
+
+    position = int(matches[0])
+    size = float(planned.sizes[position])
+    segments = route.route_segments
+    previous_xy = segments[position - 1, :2]
+    next_xy = segments[position, 2:]
+    cost = -float(
+        get_insertion_costs(
+            np.concatenate([previous_xy, next_xy]).reshape(1, 4),
+            planned.locations[position],
+            route.metric,
+        )[0]
+    )
+
+    route.route_segments = np.concatenate(
+        [
+            segments[: position - 1],
+            [np.concatenate([previous_xy, next_xy])],
+            segments[position + 1 :],
+        ]
+    )
+    capacities = route.segment_capacities
+    route.segment_capacities = np.concatenate(
+        [capacities[: position - 1] + size, capacities[position:]]
+    )
+    route.planned_delivery_route = planned.delete(position)
+    chosen_row = int(route.delivery_order[position - 1])
+    route.chosen_deliveries = route.chosen_deliveries.delete(chosen_row)
+    route.chosen_delivery_indices = np.delete(route.chosen_delivery_indices, chosen_row)
+    order = np.delete(route.delivery_order, position - 1)
+    route.delivery_order = order - (order > chosen_row)
+    route.route_capacity_usage -= size
+
+    if len(route.final_route):
+        final = route.final_route
+        is_delivery = (final.ids == stop_id) & (final.kinds == StopKind.DELIVERY)
+        route.final_route = final.delete(int(np.flatnonzero(is_delivery)[0]))
+
+    logger.info(f"Removed delivery {stop_id} from {position}")
+    return Splice(position=position, cost=cost)
+
+
+def revalidate_pickups(route: "Route", end: int):
+    """
+    Drops chosen pickups until the van is not overloaded on any leg of the final route
+    before the row end, the legs after it did not get more load.
+
+    The free capacities are computed once. The overloaded legs are walked in order
+    and the latest pickup before a leg is dropped until the leg fits, which frees
+    its size on every later leg as well. The dropped pickups are removed at once
+    """
+    final_route = route.final_route
+    free_capacities = get_free_capacities(
+        final_route.take(slice(0, end + 1)),
+        route.get_van_capacity() - route.route_capacity_usage,
+    )
+    overloaded = np.flatnonzero(free_capacities < 0).tolist()
+    if not overloaded:
+        return
+
+    pickup_rows = np.flatnonzero(
+        final_route.kinds[: overloaded[-1] + 1] == StopKind.PICKUP
+    ).tolist()
+    passed_rows: List[int] = []
+    dropped_rows: List[int] = []
+    freed = 0.0
+    for leg in overloaded:
+        while pickup_rows and pickup_rows[0] <= leg:
+            passed_rows.append(pickup_rows.pop(0))
+        while free_capacities[leg] + freed < 0 and passed_rows:
+            dropped_rows.append(passed_rows.pop())
+            freed += float(final_route.sizes[dropped_rows[-1]])
+
+    dropped_ids = set(final_route.ids[dropped_rows].tolist())
+    is_kept = np.ones(len(final_route), dtype=bool)
+    is_kept[dropped_rows] = False
+    route.final_route = final_route.take(is_kept)
+    route.chosen_pickup_stops = [
+        stop for stop in route.chosen_pickup_stops if stop.stop_id not in dropped_ids
+    ]
+    route.chosen_pickup_stop = (
+        route.chosen_pickup_stops[0] if route.chosen_pickup_stops else None
+    )
+    logger.info(f"Dropped pickups {sorted(dropped_ids)}, they do not fit anymore")
+    if not route.chosen_pickup_stops:
+        route.final_route = StopTable.empty()
+
+
+def get_free_capacities(route: StopTable, start_capacity: float) -> np.ndarray:
+    """
+    Free capacity of the van on every leg of a route, deliveries free
+    and pickups take room at their stop
+
+    Returns:
+        np.ndarray: len(route) - 1 capacities, the first one for the leg from the first stop
+    """
+    sizes = route.sizes[1:-1]
+    kinds = route.kinds[1:-1]
+    changes = np.where(
+        kinds == StopKind.PICKUP, -sizes, np.where(kinds == StopKind.DELIVERY, sizes, 0)
+    )
+    return start_capacity + np.concatenate([[0.0], np.cumsum(changes)])
+
+
+def get_planned_rows(final_route: StopTable) -> np.ndarray:
+    """
+    Row of every stop of the planned delivery route in the final route
+    """
+    return np.flatnonzero(final_route.kinds != StopKind.PICKUP)
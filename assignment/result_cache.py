@@ -0,0 +1,238 @@
+import contextlib
+import json
+import logging
+import os
+import zipfile
+from typing import TYPE_CHECKING, Dict, Iterator, Optional
+
+import numpy as np
+
+from assignment import constants
+from assignment.distance_cache import (
+    evict_least_recently_used,
+    get_key,
+    touch,
+    write_atomically,
+)
+from assignment.stops import StopTable
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover - not on POSIX
+    fcntl = None
+
+if TYPE_CHECKING:
+    from assignment.routes import Route
+
+logger = logging.getLogger(__name__)
+
+RESULT_FILE_SUFFIX = ".npz"
+LOCK_FILE_SUFFIX = ".lock"
+
+# Stop tables of a planned Route kept in a result, the chosen pickups in the order
+# they were chosen
+RESULT_TABLES = (
+    "chosen_deliveries",
+    "planned_delivery_route",
+    "final_route",
+    "chosen_pickup_stops",
+)
+
+STOP_TABLE_COLUMNS = ("locations", "sizes", "kinds", "ids")
+
+
+class ResultCache:
+    """
+    Keeps the results of whole planning runs as .npz files in a directory, so planning
+    the same stops with the same parameters again only reads the result.
+
+    Every result is keyed by a hash of the stops, the planning parameters and
+    constants.PLANNING_ALGORITHM_VERSION, see get_run_key. Files are written atomically
+    and a run that misses holds a lock on its key while it plans, so other processes
+    planning the same run wait for its result instead of planning it again.
+    Once the directory grows over max_bytes, the least recently used results are removed.
+    Their empty lock files stay, see lock, use clear to remove them.
+
+    Args:
+        cache_dir (str): directory of the results, created if missing
+        max_bytes (int, optional): size limit of the directory.
+        Defaults to constants.RESULT_CACHE_MAX_BYTES.
+    """
+
+    def __init__(self, cache_dir: str, max_bytes: Optional[int] = None):
+        self.cache_dir = cache_dir
+        self.max_bytes = (
+            constants.RESULT_CACHE_MAX_BYTES if max_bytes is None else max_bytes
+        )
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def get(self, key: str) -> Optional[Dict[str, np.ndarray]]:
+        """
+        Arrays of the result with the key, None if it is not cached
+        """
+        path = self.get_path(key)
+        try:
+            with np.load(path) as result_file:
+                result = {name: result_file[name] for name in result_file.files}
+        except (FileNotFoundError, ValueError, zipfile.BadZipFile):
+            # missing, evicted by another process or not a complete file
+            return None
+
+        touch(path)
+        return result
+
+    def put(self, key: str, result: Dict[str, np.ndarray]):
+        """
+        Stores the arrays of a result, then evicts old results.
+        Results larger than the whole cache are not stored
+        """
+        if sum(array.nbytes for array in result.values()) > self.max_bytes:
+            logger.info(f"Not caching result {key}, it is larger than the cache")
+            return
+
+        path = self.get_path(key)
+        write_atomically(path, lambda result_file: np.savez(result_file, **result))
+        evict_least_recently_used(
+            self.cache_dir, RESULT_FILE_SUFFIX, self.max_bytes, keep=path
+        )
+
+    @contextlib.contextmanager
+    def lock(self, key: str) -> Iterator[None]:
+        """
+        Holds an exclusive lock on the key across processes, without fcntl it does nothing.
+        The lock files are kept, removing one could let two processes lock the same key.
+        So the directory keeps one empty lock file for every key that was ever planned,
+        also after its result was evicted, until clear removes them
+        """
+        if fcntl is None:
+            yield
+            return
+
+        with open(
+            os.path.join(self.cache_dir, key + LOCK_FILE_SUFFIX), "a"
+        ) as lock_file:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                yield
+            finally:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def plan(self, route: "Route") -> bool:
+        """
+        Sets the results of the route from the cache, or plans it with route.plan_stages
+        and stores the results. Reading and writing the cache are measured as the
+        read_result_cache and write_result_cache stages of route.instrumentation
+
+        Returns:
+            bool: True if the result came from the cache
+        """
+        instrumentation = route.instrumentation
+        with contextlib.ExitStack() as stack:
+            with instrumentation.stage("read_result_cache"):
+                key = get_run_key(route)
+                result = self.get(key)
+                if result is None:
+                    stack.enter_context(self.lock(key))
+                    # another process may have planned it while this one waited
+                    result = self.get(key)
+                if result is not None:
+                    set_route_results(route, result)
+                    self.hits += 1
+                    instrumentation.count("result_cache_hits")
+                else:
+                    self.misses += 1
+                    instrumentation.count("result_cache_misses")
+
+            if result is not None:
+                logger.info(f"Took the planned route from the result cache {key}")
+                return True
+
+            route.plan_stages()
+            with instrumentation.stage("write_result_cache"):
+                self.put(key, get_route_results(route))
+            return False
+
+    def clear(self):
+        """
+        Removes every result and lock file
+        """
+        for file_name in os.listdir(self.cache_dir):
+            if file_name.endswith((RESULT_FILE_SUFFIX, LOCK_FILE_SUFFIX)):
+                with contextlib.suppress(FileNotFoundError):
+                    os.unlink(os.path.join(self.cache_dir, file_name))
+        logger.info(f"Cleared the result cache {self.cache_dir}")
+
+    def get_path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key + RESULT_FILE_SUFFIX)
+
+    def get_stats(self) -> Dict[str, int]:
+        return {"result_cache_hits": self.hits, "result_cache_misses": self.misses}
+
+
+def get_run_key(route: "Route") -> str:
+    """
+    Hash of the loaded stops of the route, every parameter that changes
+    the planned route and the version of the planning algorithm
+    """
+    parameters = {
+        "version": constants.PLANNING_ALGORITHM_VERSION,
+        **route.config.to_dict(),
+        "improve_time_budget": route.improve_time_budget,
+        "max_pickups": route.max_pickups,
+        "multi_start_time_budget": route.multi_start_time_budget,
+        "metric": route.metric.key,
+    }
+    arrays = [
+        getattr(stops, column)
+        for stops in (route.possible_delivery_stops, route.pickup_stops)
+        for column in STOP_TABLE_COLUMNS
+    ]
+    return get_key(arrays, parameters=json.dumps(parameters, sort_keys=True))
+
+
+def get_route_results(route: "Route") -> Dict[str, np.ndarray]:
+    """
+    Arrays with everything plan_route sets on a Route
+    """
+    tables = {name: getattr(route, name) for name in RESULT_TABLES}
+    tables["chosen_pickup_stops"] = StopTable.from_stops(route.chosen_pickup_stops)
+
+    result = {
+        f"{name}_{column}": getattr(table, column)
+        for name, table in tables.items()
+        for column in STOP_TABLE_COLUMNS
+    }
+    result["route_capacity_usage"] = np.array(route.route_capacity_usage)
+    result["segment_capacities"] = route.segment_capacities
+    result["route_segments"] = route.route_segments
+    result["depot_location"] = np.array(route.depot_location, dtype=np.int64)
+    result["chosen_delivery_indices"] = route.chosen_delivery_indices
+    result["delivery_order"] = route.delivery_order
+    return result
+
+
+def set_route_results(route: "Route", result: Dict[str, np.ndarray]):
+    """
+    Sets the arrays from get_route_results back on a Route
+    """
+    for name in RESULT_TABLES:
+        setattr(
+            route,
+            name,
+            StopTable(
+                **{column: result[f"{name}_{column}"] for column in STOP_TABLE_COLUMNS}
+            ),
+        )
+    route.chosen_pickup_stops = list(route.chosen_pickup_stops)
+    route.chosen_pickup_stop = (
+        route.chosen_pickup_stops[0] if route.chosen_pickup_stops else None
+    )
+    route.route_capacity_usage = float(result["route_capacity_usage"])
+    route.segment_capacities = result["segment_capacities"]
+    route.route_segments = result["route_segments"]
+    route.depot_location = tuple(result["depot_location"].tolist())
+    route.chosen_delivery_indices = result["chosen_delivery_indices"]
+    route.delivery_order = result["delivery_order"]
@@ -1,176 +1,483 @@
 import logging
+import time
 import numpy as np
-from typing import List, Tuple
-from assignment.stops import RouteStop
+from typing import Dict, List, Optional, Tuple, Union
+from assignment.checkpoints import StageCheckpoints
+from assignment.config import RoutingConfig
+from assignment.distance_cache import DistanceCache
+from assignment.incremental import IncrementalRoute
+from assignment.instrumentation import (
+    NULL_INSTRUMENTATION,
+    Instrumentation,
+    NullInstrumentation,
+)
+from assignment.metrics import SQUARED_EUCLIDEAN, DistanceMetric
+from assignment.multistart import multi_start_nearest_neighbour_order
+from assignment.result_cache import ResultCache
+from assignment.selection import select_smallest_fitting
+from assignment.spatial import nearest_neighbour_order_from_matrix
+from assignment.stops import RouteStop, StopKind, StopTable
 from assignment.utils import generate_stops
-from assignment import constants
+from assignment import constants, export, improvement, loaders, repair
 
 logger = logging.getLogger(__name__)
 
 
 class Route:
-    def __init__(self, n_deliveries: int, n_pickups: int):
+    # Stages run by plan_route, in order
+    PLANNING_STAGES = (
+        "choose_most_fitting_stops",
+        "create_route",
+        "improve_route",
+        "get_route_segments",
+        "calculate_route_segment_capacities",
+        "add_pickup_stop_to_route",
+    )
+    # Stages run by run, every one can be checkpointed, see checkpoints.StageCheckpoints
+    RUN_STAGES = ("load_all_stops", *PLANNING_STAGES)
+
+    def __init__(
+        self,
+        n_deliveries: int,
+        n_pickups: int,
+        seed: int = 42,
+        van_capacity: Optional[float] = None,
+        max_coordinate: int = 1000,
+        instrumentation: Optional[Instrumentation] = None,
+        improve_time_budget: float = 0.0,
+        distance_cache: Optional[DistanceCache] = None,
+        max_pickups: int = 1,
+        delivery_stops_path: Optional[str] = None,
+        pickup_stops_path: Optional[str] = None,
+        stop_columns: Optional[Dict[str, str]] = None,
+        result_cache: Optional[ResultCache] = None,
+        compact: bool = False,
+        multi_start_time_budget: float = 0.0,
+        multi_start_workers: int = 1,
+        metric: Optional[DistanceMetric] = None,
+        config: Optional[RoutingConfig] = None,
+        checkpoints: Optional[StageCheckpoints] = None,
+    ):
         self.n_deliveries = n_deliveries
         self.n_pickups = n_pickups
+        self.seed = seed
+        self.max_coordinate = max_coordinate
+        self.instrumentation: Union[Instrumentation, NullInstrumentation] = (
+            instrumentation or NULL_INSTRUMENTATION
+        )
+        # van and depots, a given van_capacity replaces the one of the config
+        self.config = config or RoutingConfig()
+        if van_capacity is not None:
+            self.config = RoutingConfig.create(van_capacity, self.config.depots)
+        self.improve_time_budget = improve_time_budget
+        self.distance_cache = distance_cache
+        self.max_pickups = max_pickups
+        # stops are read from these files instead of being generated, see loaders.load_stops
+        self.delivery_stops_path = delivery_stops_path
+        self.pickup_stops_path = pickup_stops_path
+        self.stop_columns = stop_columns
+        self.result_cache = result_cache
+        # loaded stops are kept with compact dtypes, see StopTable.to_compact
+        self.compact = compact
+        self.multi_start_time_budget = multi_start_time_budget
+        self.multi_start_workers = multi_start_workers
+        # distances the route is planned with, see metrics.get_metric
+        self.metric = metric or SQUARED_EUCLIDEAN
+        # run writes the output of every stage here and can resume from it
+        self.checkpoints = checkpoints
+
+        self.possible_delivery_stops = StopTable.empty()
+        self.chosen_deliveries = StopTable.empty()
+        # rows of the chosen deliveries in self.possible_delivery_stops
+        self.chosen_delivery_indices = np.zeros(0, dtype=np.int64)
+        self.pickup_stops = StopTable.empty()
+
+        self.planned_delivery_route = StopTable.empty()
+        # rows of self.chosen_deliveries in the order of the planned route,
+        # deliveries added by insert_delivery are not among the possible ones
+        self.delivery_order = np.zeros(0, dtype=np.int64)
+        # depot of self.config the route starts and ends at, see choose_depot
+        self.depot_location: Tuple[int, int] = self.config.depot_location
+
+        self.chosen_pickup_stop: Optional[RouteStop] = None
+        self.chosen_pickup_stops: List[RouteStop] = []
 
-        self.possible_delivery_stops: List[RouteStop] = []
-        self.chosen_deliveries: List[RouteStop] = []
-        self.pickup_stops: List[RouteStop] = []
+        self.route_capacity_usage = 0
+        self.segment_capacities = np.zeros(0, dtype=np.float64)
+        self.route_segments = np.zeros((0, 4), dtype=np.int64)
 
-        self.planned_delivery_route: List[RouteStop] = []
+        self.final_route = StopTable.empty()
 
-        self.chosen_pickup_stop = None
+    @classmethod
+    def from_stops(
+        cls, delivery_stops: StopTable, pickup_stops: StopTable, **kwargs
+    ) -> "Route":
+        """
+        Creates a route for stops that are already loaded, plan it with plan_route
+        """
+        route = cls(
+            n_deliveries=len(delivery_stops), n_pickups=len(pickup_stops), **kwargs
+        )
+        route.possible_delivery_stops = delivery_stops
+        route.pickup_stops = pickup_stops
+        return route
+
+    def run(
+        self,
+        plot_output: Optional[str] = None,
+        show_plot: bool = True,
+        route_output: Optional[str] = None,
+        resume_from: Optional[str] = None,
+    ):
+        """
+        Loads the stops, plans the route, exports and shows it.
+        With checkpoints every stage writes its output, and the run skips the result
+        cache and can resume from any stage, see checkpoints.StageCheckpoints
 
-        self.route_capacity_usage = 0
-        self.segment_capacities: List[float] = []
-        self.route_segments: List[Tuple] = []
+        Args:
+            plot_output (str, optional): writes the plot to this image file instead
+            of showing it, the format follows the extension
+            show_plot (bool, optional): shows the plot in a window when there is
+            no plot_output. Defaults to True.
+            route_output (str, optional): exports the route to this file, JSON lines
+            for .jsonl files and a binary route file otherwise, see export
+            resume_from (str, optional): one of RUN_STAGES, the stages before it
+            are read from self.checkpoints
+
+        Raises:
+            ValueError: when resuming without checkpoints, or from checkpoints
+            that do not match this route
+        """
+        if self.checkpoints is not None:
+            self.checkpoints.run(self, resume_from)
+        elif resume_from is not None:
+            raise ValueError(f"Cannot resume from {resume_from} without checkpoints")
+        else:
+            self.run_stage("load_all_stops")
+            self.plan_route()
+        if route_output:
+            with self.instrumentation.stage("export_route"):
+                self.export_route(route_output)
+
+        route = self.get_result_route()
+        if plot_output:
+            from assignment.plotting import save_route_plot
+
+            save_route_plot(route, plot_output)
+        elif show_plot:
+            # Not productionizing the the plotting but in case you wanna see it, it is here
+            from assignment.plotting import plot_route
+
+            plot_route(route)
+
+    def get_result_route(self) -> StopTable:
+        """
+        Final route with the pickups, the planned delivery route if no pickup fits
+        """
+        if len(self.final_route):
+            return self.final_route
+        return self.planned_delivery_route
 
-        self.final_route: List[RouteStop] = []
+    def export_route(self, path: str):
+        """
+        Writes the planned route to a .jsonl file with export.RouteStreamWriter
+        or to a binary route file with export.write_route
+        """
+        if path.endswith(".jsonl"):
+            with export.RouteStreamWriter(path) as writer:
+                writer.write(self)
+        else:
+            export.write_route(self, path)
+        logger.info(f"Exported the route to {path}")
+
+    def insert_delivery(self, delivery: StopTable) -> Optional[repair.Splice]:
+        """
+        Adds a late delivery to the planned route without planning it again,
+        see repair.insert_delivery. Measured as the repair_route stage
+        """
+        with self.instrumentation.stage("repair_route"):
+            return repair.insert_delivery(self, delivery)
 
-    def run(self):
-        self.load_all_stops()
-        self.choose_most_fitting_stops()
-        self.create_route()
-        self.get_route_segments()
-        self.calculate_route_segment_capacities()
-        self.add_pickup_stop_to_route()
+    def remove_delivery(self, stop_id: int) -> Optional[repair.Splice]:
+        """
+        Takes a cancelled delivery off the planned route without planning it again,
+        see repair.remove_delivery. Measured as the repair_route stage
+        """
+        with self.instrumentation.stage("repair_route"):
+            return repair.remove_delivery(self, stop_id)
 
-        # Not productionizing the the plotting but in case you wanna see it, it is here
-        from assignment.plotting import plot_route
+    def plan_route(self):
+        """
+        Plans the route for the loaded stops, with a result cache
+        a run that was planned before is read from the cache instead
+        """
+        if self.result_cache is None:
+            self.plan_stages()
+            return
 
-        plot_route(self.final_route)
+        self.result_cache.plan(self)
+
+    def plan_stages(self):
+        """
+        Runs all the planning stages on the loaded stops
+        """
+        for stage in self.PLANNING_STAGES:
+            self.run_stage(stage)
+
+    def run_stage(self, stage: str):
+        """
+        Runs one stage method, measured by self.instrumentation
+        """
+        with self.instrumentation.stage(stage):
+            if self.distance_cache is None:
+                getattr(self, stage)()
+                return
+
+            stats_before = self.distance_cache.get_stats()
+            getattr(self, stage)()
+            for name, value in self.distance_cache.get_stats().items():
+                if value != stats_before[name]:
+                    self.instrumentation.count(name, value - stats_before[name])
 
     def load_all_stops(self):
         """
         Gets delivery and pickup stops from somewhere
-        In this case it generates them but you get the point
+        Reads them from the stop files if there are any, generates them otherwise
         """
         self.get_possible_delivery_stops()
         self.get_pickup_stops()
+        if self.compact:
+            self.use_compact_dtypes()
 
-    def get_possible_delivery_stops(self):
+    def use_compact_dtypes(self):
+        """
+        Converts the loaded stops to compact dtypes, see StopTable.to_compact,
+        and reports the memory saved as the compact_bytes_saved counter
         """
-        Generates delivery stops and saves them as classes
-        in self.possible_delivery_stops.append(delivery_stop)
+        bytes_before = self.possible_delivery_stops.nbytes + self.pickup_stops.nbytes
+        self.possible_delivery_stops = self.possible_delivery_stops.to_compact()
+        self.pickup_stops = self.pickup_stops.to_compact()
+        bytes_saved = bytes_before - (
+            self.possible_delivery_stops.nbytes + self.pickup_stops.nbytes
+        )
 
-        It would be nice to keep the nd array for later
-        but I feel like it is cheating so I throw it away
-        Right now it is ok to store it in arrays but the customer stop would have more info
-        so that is why I chose classes
+        self.instrumentation.count("compact_bytes_saved", bytes_saved)
+        logger.info(f"Compact dtypes saved {bytes_saved / 2**20:.2f} MiB of stops")
+
+    def get_possible_delivery_stops(self):
         """
-        stops = generate_stops(n=self.n_deliveries)
+        Generates delivery stops, or reads them from self.delivery_stops_path,
+        and saves them as a StopTable in self.possible_delivery_stops
 
-        for stop in stops:
-            delivery_stop = RouteStop(
-                x=int(stop[0]),
-                y=int(stop[1]),
-                size=stop[2],
-                is_pickup=False,
-                is_depot=False,
+        The stops are kept in columns, RouteStop objects are only built
+        when somebody asks for a single stop
+        """
+        if self.delivery_stops_path:
+            self.possible_delivery_stops = loaders.load_stops(
+                self.delivery_stops_path, StopKind.DELIVERY, columns=self.stop_columns
             )
-            self.possible_delivery_stops.append(delivery_stop)
+            self.n_deliveries = len(self.possible_delivery_stops)
+            return
+
+        stops = generate_stops(
+            n=self.n_deliveries, max_coordinate=self.max_coordinate, seed=self.seed
+        )
+        self.possible_delivery_stops = StopTable.from_array(
+            stops, kind=StopKind.DELIVERY
+        )
 
     def get_pickup_stops(self):
         """
-        Generates delivery stops and saves them as classes
-        in self.possible_delivery_stops.append(delivery_stop)
+        Generates pickup stops, or reads them from self.pickup_stops_path,
+        and saves them as a StopTable in self.pickup_stops
         """
-        stops = generate_stops(n=self.n_pickups)
-
-        for stop in stops:
-            pickup_stop = RouteStop(
-                x=int(stop[0]),
-                y=int(stop[1]),
-                size=stop[2],
-                is_pickup=True,
-                is_depot=False,
+        if self.pickup_stops_path:
+            self.pickup_stops = loaders.load_stops(
+                self.pickup_stops_path, StopKind.PICKUP, columns=self.stop_columns
             )
-            self.pickup_stops.append(pickup_stop)
+            self.n_pickups = len(self.pickup_stops)
+            return
+
+        stops = generate_stops(
+            n=self.n_pickups, max_coordinate=self.max_coordinate, seed=self.seed
+        )
+        self.pickup_stops = StopTable.from_array(stops, kind=StopKind.PICKUP)
 
     def choose_most_fitting_stops(self):
         """
         Selects as many of the smallest stops as it would fit the van capacity constraints
         Saves the stops self.chosen_deliveries and capacity used in self.route_capacity_usage
-        """
-        sorted_sizes_with_indices = self.sort_stops_by_size()
-
-        total_selected_size = 0
-        for stop in sorted_sizes_with_indices:
-            stop_index = stop[0]
-            stop_size = stop[1]
 
-            if total_selected_size + stop_size <= constants.VAN_CAPACITY:
-                total_selected_size += stop_size
-                self.chosen_deliveries.append(self.possible_delivery_stops[stop_index])
-            else:
-                break
+        It does not sort on distance, even if size is the same, the lower index goes first.
+        Only the smallest stops are sorted, see selection.select_smallest_fitting
+        """
+        selection = select_smallest_fitting(
+            self.possible_delivery_stops.sizes, self.get_van_capacity()
+        )
 
-        self.route_capacity_usage = total_selected_size
+        self.chosen_delivery_indices = selection.indices
+        self.chosen_deliveries = self.possible_delivery_stops.take(selection.indices)
+        self.route_capacity_usage = selection.total_size
+        self.instrumentation.count("candidates_examined", selection.n_examined)
 
         logger.info(f"Selected {len(self.chosen_deliveries)} smallest orders")
 
-    def sort_stops_by_size(self) -> List:
+    def get_van_capacity(self) -> float:
         """
-        Sorts delivery stops by their size and returns the sizes and indices
-        It does not sort on distance, even if size is the same
+        Capacity of the van of self.config
+        """
+        return self.config.van_capacity
 
-        Returns:
-            List: List of tuples with indices and sizes
+    def choose_depot(self):
         """
-        all_sizes = [
-            customer_stop.size for customer_stop in self.possible_delivery_stops
-        ]
-        indices = list(range(len(all_sizes)))
-        sorted_sizes_with_indices = [
-            (i, size) for size, i in sorted(zip(all_sizes, indices))
-        ]
-        return sorted_sizes_with_indices
+        Chooses the depot of self.config with the smallest total distance
+        to the chosen deliveries and saves it in self.depot_location.
+        With a single depot it is always that one
+        """
+        depots = self.config.get_depot_locations()
+        if len(depots) == 1 or len(self.chosen_deliveries) == 0:
+            self.depot_location = self.config.depot_location
+            return
+
+        total_distances = self.metric.many_to_many(
+            depots, self.chosen_deliveries.locations
+        ).sum(axis=1)
+        self.depot_location = self.config.depots[int(np.argmin(total_distances))]
+        logger.info(f"Starting from the depot at {self.depot_location}")
 
     def create_route(self):
         """
         Creates a route based on the nearest stop. Adds depot at the beginning and the end
-        Saves route in self.planned_delivery_route
-        """
-        self.add_depot_stop_to_route()
-        previous_stop_xy = constants.DEPOT_LOCATION
-        stops_left = self.chosen_deliveries.copy()
+        Saves route in self.planned_delivery_route, the depot is chosen with choose_depot
 
-        for _ in range(len(self.chosen_deliveries)):
-            distances = [
-                self.calculate_distance_between_stops(
-                    previous_stop_xy=previous_stop_xy, next_stop_xy=stop.get_location()
-                )
-                for stop in stops_left
+        The closest stops are found by self.metric, with the default metric in a grid
+        index, see spatial.nearest_neighbour_order. Small routes planned with the default
+        metric and a distance cache read them from the cached distance matrix.
+        With a multi start time budget the shortest of several nearest neighbour tours
+        is kept, see multistart.multi_start_nearest_neighbour_order
+        """
+        self.choose_depot()
+        locations = self.chosen_deliveries.locations
+        counters: Dict[str, int] = {}
+        if self.multi_start_time_budget > 0:
+            order = multi_start_nearest_neighbour_order(
+                locations,
+                self.depot_location,
+                self.multi_start_time_budget,
+                max_workers=self.multi_start_workers,
+                seed=self.seed,
+                counters=counters,
+                metric=self.metric,
+            )
+        elif (
+            self.uses_default_metric()
+            and self.distance_cache
+            and self.distance_cache.use_dense(len(locations) + 1)
+        ):
+            squared_distances = self.distance_cache.squared_distances(
+                np.concatenate([[self.depot_location], locations])
+            )
+            order = nearest_neighbour_order_from_matrix(squared_distances)
+        else:
+            order = self.metric.nearest_neighbour_order(
+                locations, self.depot_location, counters
+            )
+        for name, value in counters.items():
+            self.instrumentation.count(name, value)
+
+        self.delivery_order = np.asarray(order, dtype=np.int64)
+        self.planned_delivery_route = StopTable.concatenate(
+            [
+                self.get_depot_stop(),
+                self.chosen_deliveries.take(order),
+                self.get_depot_stop(),
             ]
+        )
+
+    def improve_route(self):
+        """
+        Shortens self.planned_delivery_route with 2-opt and Or-opt moves
+        for at most self.improve_time_budget seconds, see improvement.TourImprover.
+        Does nothing without a time budget
 
-            closest_stop_index = distances.index(min(distances))
-            stop_to_plan = stops_left[closest_stop_index]
+        Other metrics than the default one give the improver their distance matrix,
+        routes of asymmetric metrics or too many stops for a dense matrix are kept.
+        The time budget covers computing those distances and neighbours as well
+        """
+        if self.improve_time_budget <= 0:
+            return
+        deadline = time.perf_counter() + self.improve_time_budget
 
-            self.planned_delivery_route.append(stop_to_plan)
+        # The depot stays first, the closing depot is implied by the closed tour
+        route_stops = self.planned_delivery_route.take(
+            np.arange(len(self.planned_delivery_route) - 1)
+        )
+        neighbours = None
+        distances = None
+        if not self.uses_default_metric():
+            if (
+                not self.metric.symmetric
+                or len(route_stops) > constants.DENSE_DISTANCE_MAX_STOPS
+            ):
+                logger.info(f"Not improving routes of the {self.metric.name} metric")
+                return
+            distances = self.metric.many_to_many(
+                route_stops.locations, route_stops.locations
+            )
+        elif self.distance_cache is not None:
+            neighbours = self.distance_cache.nearest_neighbours(
+                route_stops.locations, improvement.N_NEIGHBOURS
+            )
 
-            previous_stop_xy = stop_to_plan.get_location()
-            stops_left.pop(closest_stop_index)
-        self.add_depot_stop_to_route()
+        counters: Dict[str, int] = {}
+        order = improvement.improve_route(
+            route_stops.locations,
+            self.improve_time_budget,
+            neighbours=neighbours,
+            counters=counters,
+            distances=distances,
+            deadline=deadline,
+        )
+        for name, value in counters.items():
+            self.instrumentation.count(name, value)
+
+        # the order starts at the depot, row 0 of the route. Routes that were
+        # not made by create_route have no delivery order to follow
+        if len(self.delivery_order) == len(order) - 1:
+            self.delivery_order = self.delivery_order[np.asarray(order[1:]) - 1]
+        self.planned_delivery_route = StopTable.concatenate(
+            [route_stops.take(order), self.get_depot_stop()]
+        )
 
     def add_depot_stop_to_route(self):
         """
         Adds depot to a route
         """
-        depot_stop = RouteStop(
-            x=constants.DEPOT_LOCATION[0],
-            y=constants.DEPOT_LOCATION[1],
-            is_pickup=False,
-            is_depot=True,
-            size=0,
+        self.planned_delivery_route = StopTable.concatenate(
+            [self.planned_delivery_route, self.get_depot_stop()]
         )
-        self.planned_delivery_route.append(depot_stop)
+
+    def get_depot_stop(self) -> StopTable:
+        """
+        Creates a table holding only the depot of the route
+        """
+        return StopTable.depot(self.depot_location)
+
+    def uses_default_metric(self) -> bool:
+        """
+        Whether the route is planned with squared euclidean distances,
+        the only ones the distance cache keeps
+        """
+        return self.metric.key == SQUARED_EUCLIDEAN.key
 
     @staticmethod
     def calculate_distance_between_stops(
         previous_stop_xy: Tuple[int, int], next_stop_xy: Tuple[int, int]
     ) -> int:
         """
-        Calculates the squared distance between two stops
+        Calculates the squared distance between two stops.
+        Works element-wise when the coordinates are arrays.
+        The planning computes all its distances at once with Route.metric instead
 
         Args:
             previous_stop_xy (Tuple[int, int]): the X and Y coordinates of the previous stop
@@ -187,24 +494,21 @@ class Route:
     def get_route_segments(self):
         """
         Gets route segments from the routes and saves it in self.route_segments
+        Each row is (start x, start y, end x, end y)
         """
-        self.route_segments = [
-            (stop.x, stop.y, next_stop.x, next_stop.y)
-            for stop, next_stop in zip(
-                self.planned_delivery_route, self.planned_delivery_route[1:]
-            )
-        ]
+        locations = self.planned_delivery_route.locations
+        self.route_segments = np.concatenate([locations[:-1], locations[1:]], axis=1)
 
     def calculate_route_segment_capacities(self):
         """
         Calculates the route capacity at each segment - after the starting stop
         and saves in self.segment_capacities
         """
-        capacity = 50 - self.route_capacity_usage
-        self.segment_capacities.append(capacity)
-        for chosen_delivery in self.planned_delivery_route[1:-1]:
-            capacity += chosen_delivery.size
-            self.segment_capacities.append(capacity)
+        capacity = self.get_van_capacity() - self.route_capacity_usage
+        delivered_sizes = self.planned_delivery_route.sizes[1:-1]
+        self.segment_capacities = np.cumsum(
+            np.concatenate([[capacity], delivered_sizes])
+        )
 
     def add_pickup_stop_to_route(self):
         """
@@ -217,61 +521,90 @@ class Route:
         otherwise it checks the next one
 
         Final route is saved in self.final_route and chosen stop in self.chosen_pickup_stop
+
+        Routes allowed more than one pickup insert them with add_pickup_stops_to_route
         """
+        if self.max_pickups > 1:
+            self.add_pickup_stops_to_route()
+            return
+
         closest_distances = self.calculate_pickup_stop_distances_to_nearest_segment()
 
-        sizes = np.array([stop.size for stop in self.pickup_stops])
+        sizes = self.pickup_stops.sizes
         best_pickup_stops = np.lexsort((sizes, closest_distances[:, 0]))
 
         for best_stop_index in best_pickup_stops:
-            stop_size = self.pickup_stops[best_stop_index].size
-            segment_index = closest_distances[best_stop_index, 1]
+            self.instrumentation.count("candidates_examined")
+            stop_size = sizes[best_stop_index]
+            segment_index = int(closest_distances[best_stop_index, 1])
 
             if stop_size <= self.segment_capacities[segment_index]:
                 self.chosen_pickup_stop = self.pickup_stops[best_stop_index]
-                self.final_route = self.planned_delivery_route.copy()
-                self.final_route.insert(segment_index, self.chosen_pickup_stop)
+                self.chosen_pickup_stops = [self.chosen_pickup_stop]
+                self.final_route = self.planned_delivery_route.insert(
+                    segment_index, self.pickup_stops.take([best_stop_index])
+                )
 
                 logger.info(
                     f"Pickup stop with location {self.chosen_pickup_stop.get_location()} was chosen"
                 )
                 break
 
-    def calculate_pickup_stop_distances_to_nearest_segment(self) -> np.array:
-        """_summary_
-            It calculates the squared distance between the stop and the delivery route
-        Returns:
-            np.array: array of tuples containing the squared distances between each
-            pickup stops and the index of the closest index to the stop
+    def add_pickup_stops_to_route(self):
         """
-        n_pickups = len(self.pickup_stops)
-        pickup_stops = [stop.get_location() for stop in self.pickup_stops]
-
-        closest_distances = np.zeros((n_pickups, 2), dtype=int)
-
-        route_segments = np.array(self.route_segments).T
-
-        x_diffs = route_segments[2, :] - route_segments[0, :]
-        y_diffs = route_segments[3, :] - route_segments[1, :]
+        Adds up to self.max_pickups pickup stops to the delivery route, always the one
+        closest to the route that still fits into the van, see IncrementalRoute.add_pickups.
+        Every pickup is inserted between the stops of its closest segment.
 
-        segment_lengths_squared = x_diffs**2 + y_diffs**2
-        x_diffs_sq = x_diffs / segment_lengths_squared
-        y_diffs_sq = y_diffs / segment_lengths_squared
-
-        for i, pickup_stop_location in enumerate(pickup_stops):
-            stop_x_diff = pickup_stop_location[0] - route_segments[0]
-            stop_y_diff = pickup_stop_location[1] - route_segments[1]
+        Final route is saved in self.final_route and the chosen stops, in the order
+        they were chosen, in self.chosen_pickup_stops
+        """
+        incremental_route = IncrementalRoute.from_route(self)
+        counters: Dict[str, int] = {}
+        insertions = incremental_route.add_pickups(
+            self.pickup_stops, self.max_pickups, counters=counters
+        )
+        for name, value in counters.items():
+            self.instrumentation.count(name, value)
 
-            u = stop_x_diff * x_diffs_sq + stop_y_diff * y_diffs_sq
-            u = np.clip(u, 0, 1)
+        self.chosen_pickup_stops = [self.pickup_stops[index] for index, _ in insertions]
+        self.chosen_pickup_stop = (
+            self.chosen_pickup_stops[0] if self.chosen_pickup_stops else None
+        )
+        self.final_route = incremental_route.route
 
-            distance_squared = (stop_x_diff - u * x_diffs) ** 2 + (
-                stop_y_diff - u * y_diffs
-            ) ** 2
+        logger.info(f"{len(self.chosen_pickup_stops)} pickup stops were chosen")
 
-            min_distance = min(distance_squared)
-            segment_index = np.where(distance_squared == min_distance)[0][-1]
+    def calculate_pickup_stop_distances_to_nearest_segment(self) -> np.array:
+        """
+        It calculates the distance between each pickup stop and the delivery route,
+        squared with the default metric and the detour through the stop with the others,
+        see metrics.DistanceMetric.segment_distances.
+        All pickups and segments are processed at once in memory bounded tiles,
+        see spatial.nearest_segments. With the default metric and a distance cache
+        the result is reused when the same pickups are matched against the same route again
 
-            closest_distances[i] = [min_distance, segment_index]
+        Returns:
+            np.array: array of tuples containing the distances between each
+            pickup stops and the index of the closest index to the stop. The distances
+            are integers with the default metric and floats with the others
+        """
+        self.instrumentation.count(
+            "distance_evaluations", len(self.pickup_stops) * len(self.route_segments)
+        )
+        if self.distance_cache is not None and self.uses_default_metric():
+            min_distances, segment_indices = self.distance_cache.nearest_segments(
+                self.pickup_stops.locations, self.route_segments
+            )
+        else:
+            min_distances, segment_indices = self.metric.nearest_segments(
+                self.pickup_stops.locations,
+                self.route_segments,
+                max_tile_bytes=constants.SEGMENT_KERNEL_MAX_BYTES,
+            )
 
-        return closest_distances
+        if self.uses_default_metric():
+            # truncated to integers like the integer array the pickups were always
+            # ranked on, distances to points inside a segment lose their fraction
+            min_distances = min_distances.astype(int)
+        return np.column_stack([min_distances, segment_indices])
@@ -0,0 +1,100 @@
+import math
+from typing import List, Sequence
+
+
+class MinSegmentTree:
+    """
+    Array of numbers with range additions and range minimum queries in O(log n).
+
+    Additions to a whole node are kept in `pending` and not pushed to the children,
+    `minimum` of a node is the minimum of its range including its own pending addition
+    but without the pending additions of its ancestors.
+
+    Args:
+        values (Sequence[float]): initial values
+    """
+
+    def __init__(self, values: Sequence[float]):
+        self.n_values = len(values)
+        self.size = 1
+        while self.size < self.n_values:
+            self.size *= 2
+
+        self.minimum: List[float] = [math.inf] * (2 * self.size)
+        self.pending: List[float] = [0.0] * (2 * self.size)
+        for index, value in enumerate(values):
+            self.minimum[self.size + index] = float(value)
+        for node in range(self.size - 1, 0, -1):
+            self.minimum[node] = min(self.minimum[2 * node], self.minimum[2 * node + 1])
+
+    def __len__(self) -> int:
+        return self.n_values
+
+    def add(self, start: int, stop: int, value: float):
+        """
+        Adds the value to the elements start..stop - 1
+        """
+        if start < stop:
+            self._add(start, stop, value, 1, 0, self.size)
+
+    def _add(self, start: int, stop: int, value: float, node: int, low: int, high: int):
+        if stop <= low or high <= start:
+            return
+        if start <= low and high <= stop:
+            self.minimum[node] += value
+            self.pending[node] += value
+            return
+
+        middle = (low + high) // 2
+        self._add(start, stop, value, 2 * node, low, middle)
+        self._add(start, stop, value, 2 * node + 1, middle, high)
+        self.minimum[node] = (
+            min(self.minimum[2 * node], self.minimum[2 * node + 1]) + self.pending[node]
+        )
+
+    def min(self, start: int = 0, stop: int = None) -> float:
+        """
+        Minimum of the elements start..stop - 1, infinity for an empty range
+        """
+        if stop is None:
+            stop = self.n_values
+        if start >= stop:
+            return math.inf
+        return self._min(start, stop, 1, 0, self.size)
+
+    def _min(self, start: int, stop: int, node: int, low: int, high: int) -> float:
+        if stop <= low or high <= start:
+            return math.inf
+        if start <= low and high <= stop:
+            return self.minimum[node]
+
+        middle = (low + high) // 2
+        return (
+            min(
+                self._min(start, stop, 2 * node, low, middle),
+                self._min(start, stop, 2 * node + 1, middle, high),
+            )
+            + self.pending[node]
+        )
+
+    def get(self, index: int) -> float:
+        return self.min(index, index + 1)
+
+    def find_last_below(self, threshold: float) -> int:
+        """
+        Index of the last element smaller than the threshold, -1 if there is none.
+        Walks down from the root into the right child whenever it holds such an element
+        """
+        if self.minimum[1] >= threshold:
+            return -1
+
+        node = 1
+        ancestors_pending = 0.0
+        while node < self.size:
+            ancestors_pending += self.pending[node]
+            right = 2 * node + 1
+            if self.minimum[right] + ancestors_pending < threshold:
+                node = right
+            else:
+                node = 2 * node
+        return node - self.size
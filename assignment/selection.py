@@ -0,0 +1,132 @@
+from typing import Iterable, NamedTuple, Tuple
+
+import numpy as np
+
+# Number of smallest stops looked at first, doubled until the van is full
+INITIAL_CANDIDATES = 64
+
+
+class Selection(NamedTuple):
+    """
+    Stops chosen by the smallest first selection
+    """
+
+    # indices of the chosen stops, smallest first and lower index first on equal sizes
+    indices: np.ndarray
+    # sum of their sizes, added up in the order of the indices
+    total_size: float
+    # number of stops the greedy looked at, the chosen ones and the first that did not fit
+    n_examined: int
+
+
+def select_smallest_fitting(sizes: np.ndarray, capacity: float) -> Selection:
+    """
+    Takes the smallest stops one by one until the next one does not fit
+    into the capacity anymore. Equal sizes go lower index first.
+
+    Only the smallest stops are sorted: np.partition finds the k-th smallest size,
+    all the stops up to that size are candidates, so ties keep their index order,
+    and a cumulative sum of the sorted candidates finds where the capacity runs out.
+    k doubles until the capacity runs out within the candidates.
+
+    Args:
+        sizes (np.ndarray): size of every stop
+        capacity (float): capacity to fill
+
+    Returns:
+        Selection: the chosen stops
+    """
+    return _select_examined(_as_float_sizes(sizes), capacity)[1]
+
+
+def _select_examined(
+    sizes: np.ndarray, capacity: float
+) -> Tuple[np.ndarray, Selection]:
+    """
+    select_smallest_fitting that also returns the indices of the examined stops
+    in the order they were examined
+    """
+    n_stops = len(sizes)
+
+    n_candidates = min(INITIAL_CANDIDATES, n_stops)
+    while True:
+        if n_candidates < n_stops:
+            kth_size = np.partition(sizes, n_candidates - 1)[n_candidates - 1]
+            candidates = np.flatnonzero(sizes <= kth_size)
+        else:
+            candidates = np.arange(n_stops)
+
+        candidates = candidates[np.argsort(sizes[candidates], kind="stable")]
+        selection = _take_fitting_prefix(candidates, sizes[candidates], capacity)
+        if selection.n_examined > len(selection.indices) or len(candidates) == n_stops:
+            return candidates[: selection.n_examined], selection
+
+        n_candidates = min(2 * len(candidates), n_stops)
+
+
+def select_smallest_fitting_from_chunks(
+    size_chunks: Iterable[np.ndarray], capacity: float
+) -> Selection:
+    """
+    Same selection as select_smallest_fitting for stops that come in chunks,
+    the indices count across the chunks.
+
+    Only the stops the greedy would look at among the stops seen so far are kept.
+    A later stop can only push the others further back, so none of the dropped stops
+    can be chosen anymore. This only holds for sizes that are not negative.
+
+    Args:
+        size_chunks (Iterable[np.ndarray]): sizes of the stops, chunk by chunk
+        capacity (float): capacity to fill
+
+    Returns:
+        Selection: the chosen stops
+    """
+    kept_indices = np.zeros(0, dtype=np.int64)
+    kept_sizes = np.zeros(0, dtype=np.float64)
+    n_seen = 0
+    selection = Selection(kept_indices, 0.0, 0)
+    for chunk in size_chunks:
+        chunk = _as_float_sizes(chunk)
+        if (chunk < 0).any():
+            raise ValueError("Streaming selection needs sizes that are not negative")
+
+        chunk_kept, _ = _select_examined(chunk, capacity)
+        indices = np.concatenate([kept_indices, n_seen + chunk_kept])
+        sizes = np.concatenate([kept_sizes, chunk[chunk_kept].astype(np.float64)])
+        n_seen += len(chunk)
+
+        order = np.lexsort((indices, sizes))
+        selection = _take_fitting_prefix(indices[order], sizes[order], capacity)
+        n_kept = selection.n_examined
+        kept_indices = indices[order][:n_kept]
+        kept_sizes = sizes[order][:n_kept]
+
+    return selection
+
+
+def _take_fitting_prefix(
+    sorted_indices: np.ndarray, sorted_sizes: np.ndarray, capacity: float
+) -> Selection:
+    """
+    Longest prefix of the sorted stops that fits, like adding them up one by one
+    """
+    totals = np.cumsum(sorted_sizes, dtype=np.float64)
+    too_large = totals > capacity
+    n_selected = int(np.argmax(too_large)) if too_large.any() else len(totals)
+
+    return Selection(
+        indices=sorted_indices[:n_selected],
+        total_size=float(totals[n_selected - 1]) if n_selected else 0.0,
+        n_examined=min(n_selected + 1, len(sorted_indices)),
+    )
+
+
+def _as_float_sizes(sizes: np.ndarray) -> np.ndarray:
+    """
+    float32 sizes stay float32 so compact stops are not copied, the sums are float64
+    """
+    sizes = np.asarray(sizes)
+    if sizes.dtype == np.float32:
+        return sizes
+    return sizes.astype(np.float64, copy=False)
@@ -0,0 +1,360 @@
+import asyncio
+import functools
+import json
+import logging
+import multiprocessing
+import sys
+from concurrent.futures import ProcessPoolExecutor
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+
+from assignment import constants
+from assignment.batch import run_scenario, warm_up_worker
+from assignment.config import RoutingConfig
+from assignment.routes import Route
+from assignment.stops import StopTable
+
+logger = logging.getLogger(__name__)
+
+# Requests arriving within this many seconds of the first one are planned together
+BATCH_WINDOW_SECONDS = 0.01
+
+MAX_BATCH_SIZE = 64
+
+# Stop sets every worker keeps loaded between batches
+STOP_CACHE_SIZE = 16
+
+REQUEST_DEFAULTS = {
+    "n_deliveries": 1000,
+    "n_pickups": 100,
+    "seed": 42,
+    "van_capacity": constants.VAN_CAPACITY,
+    "depots": (constants.DEPOT_LOCATION,),
+}
+
+# Request keys that decide the stops, requests with equal ones share loaded stops
+STOP_KEYS = ("n_deliveries", "n_pickups", "seed")
+
+
+def parse_request(line: bytes) -> Dict:
+    """
+    Turns one line of the protocol into a scenario for batch.run_scenario.
+
+    Every line is a JSON object with any of n_deliveries, n_pickups, seed,
+    van_capacity and depots, a list of X and Y pairs. Missing ones get
+    the run-assignment defaults. An optional id is sent back with the response
+    as "scenario".
+
+    Example:
+        {"id": "morning", "n_deliveries": 5000, "seed": 7, "depots": [[0, 0], [9, 9]]}
+
+    Raises:
+        ValueError: if the line is not such an object
+    """
+    request = json.loads(line)
+    if not isinstance(request, dict):
+        raise ValueError("A request has to be a JSON object")
+
+    unknown_keys = set(request) - set(REQUEST_DEFAULTS) - {"id"}
+    if unknown_keys:
+        raise ValueError(f"Unknown request keys {sorted(unknown_keys)}")
+
+    scenario = {"scenario": request.get("id")}
+    for key, default in REQUEST_DEFAULTS.items():
+        value = request.get(key, default)
+        if key == "depots":
+            scenario[key] = parse_depots(value) if key in request else default
+            continue
+        if not isinstance(value, (int, float)) or isinstance(value, bool) or value < 0:
+            raise ValueError(f"{key} has to be a number that is not negative")
+        scenario[key] = value
+    for key in ("n_deliveries", "n_pickups", "seed"):
+        if not isinstance(scenario[key], int):
+            raise ValueError(f"{key} has to be an integer")
+
+    return scenario
+
+
+def parse_depots(value) -> Tuple[Tuple[int, int], ...]:
+    """
+    Depots of a request as hashable pairs, checked by RoutingConfig.create
+
+    Raises:
+        ValueError: if the value is not a list of [X, Y] integer pairs
+    """
+    if not isinstance(value, list) or not all(
+        isinstance(depot, list) for depot in value
+    ):
+        raise ValueError("depots has to be a list of [X, Y] pairs")
+    return RoutingConfig.create(depots=value).depots
+
+
+@functools.lru_cache(maxsize=STOP_CACHE_SIZE)
+def load_stops(
+    n_deliveries: int, n_pickups: int, seed: int
+) -> Tuple[StopTable, StopTable]:
+    """
+    Delivery and pickup stops of a planning request, cached in the worker process
+    so repeated requests for the same stops skip loading them
+    """
+    route = Route(n_deliveries=n_deliveries, n_pickups=n_pickups, seed=seed)
+    route.load_all_stops()
+    return route.possible_delivery_stops, route.pickup_stops
+
+
+def plan_batch(scenarios: List[Dict]) -> List[Dict]:
+    """
+    Plans a batch of requests in a worker process. Requests for the same stops
+    share the loaded stops and equal requests are only planned once.
+    A request that fails gets a record with an "error" instead of failing the batch
+
+    Returns:
+        List[Dict]: a result record per scenario, in the same order
+    """
+    records_by_request: Dict[Tuple, Dict] = {}
+    records = []
+    for scenario in scenarios:
+        request_key = tuple(scenario[key] for key in REQUEST_DEFAULTS)
+        if request_key not in records_by_request:
+            try:
+                delivery_stops, pickup_stops = load_stops(
+                    *(scenario[key] for key in STOP_KEYS)
+                )
+                records_by_request[request_key] = run_scenario(
+                    scenario, delivery_stops, pickup_stops
+                )
+            except Exception as error:
+                logger.exception(f"Request {scenario['scenario']} failed")
+                records_by_request[request_key] = {"error": str(error)}
+
+        records.append(
+            {**records_by_request[request_key], "scenario": scenario["scenario"]}
+        )
+
+    return records
+
+
+def split_batch(scenarios: List[Dict]) -> List[List[int]]:
+    """
+    Groups the scenarios of a batch by their stops, every group is planned
+    by plan_batch in its own worker
+
+    Returns:
+        List[List[int]]: positions of the scenarios of every group, in the order
+        of their first scenario
+    """
+    groups: Dict[Tuple, List[int]] = {}
+    for position, scenario in enumerate(scenarios):
+        stops_key = tuple(scenario[key] for key in STOP_KEYS)
+        groups.setdefault(stops_key, []).append(position)
+    return list(groups.values())
+
+
+class PlanningServer:
+    """
+    Answers planning requests with a pool of warm worker processes.
+
+    Requests are read as JSON lines, see parse_request, and every response is one
+    JSON line with the batch.RECORD_FIELDS of the planned route, or the request id
+    under "scenario" and an "error". Responses are written as soon as they are
+    ready, so they can come back in a different order than the requests.
+
+    Requests that arrive within batch_window seconds form a batch. The requests
+    of a batch for the same stops are sent to a worker together, see split_batch,
+    so a burst of requests for different stops is planned by all the workers.
+    The event loop only parses and batches, all the planning happens in the workers.
+
+    Args:
+        max_workers (int, optional): number of worker processes. Defaults to the CPU count.
+        batch_window (float, optional): seconds to wait for more requests for a batch.
+        Defaults to BATCH_WINDOW_SECONDS.
+        max_batch_size (int, optional): largest number of requests in one batch.
+        Defaults to MAX_BATCH_SIZE.
+    """
+
+    def __init__(
+        self,
+        max_workers: Optional[int] = None,
+        batch_window: float = BATCH_WINDOW_SECONDS,
+        max_batch_size: int = MAX_BATCH_SIZE,
+    ):
+        self.max_workers = max_workers
+        self.batch_window = batch_window
+        self.max_batch_size = max_batch_size
+
+        self.executor: Optional[ProcessPoolExecutor] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._batcher: Optional[asyncio.Task] = None
+        self._running_batches = set()
+
+    async def __aenter__(self) -> "PlanningServer":
+        # Forked workers would inherit the open connections and keep them from closing,
+        # so they are spawned and started before the first request arrives
+        self.executor = ProcessPoolExecutor(
+            max_workers=self.max_workers,
+            initializer=warm_up_worker,
+            mp_context=multiprocessing.get_context("spawn"),
+        )
+        await asyncio.get_running_loop().run_in_executor(self.executor, int)
+        self._queue = asyncio.Queue()
+        self._batcher = asyncio.create_task(self.batch_requests())
+        return self
+
+    async def __aexit__(self, *exc_info):
+        self._batcher.cancel()
+        if self._running_batches:
+            await asyncio.gather(*self._running_batches, return_exceptions=True)
+        self.executor.shutdown()
+
+    async def plan(self, scenario: Dict) -> Dict:
+        """
+        Queues one scenario for the next batch and waits for its record
+        """
+        record = asyncio.get_running_loop().create_future()
+        await self._queue.put((scenario, record))
+        return await record
+
+    async def batch_requests(self):
+        """
+        Collects queued requests into batches and starts planning every batch
+        """
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            task = asyncio.create_task(self.run_batch(batch))
+            self._running_batches.add(task)
+            task.add_done_callback(self._running_batches.discard)
+
+    async def run_batch(self, batch: List[Tuple[Dict, asyncio.Future]]):
+        """
+        Plans every group of the batch in its own worker
+        """
+        groups = split_batch([scenario for scenario, _ in batch])
+        logger.info(
+            f"Planning a batch of {len(batch)} requests in {len(groups)} groups"
+        )
+        await asyncio.gather(
+            *(
+                self.run_group([batch[position] for position in group])
+                for group in groups
+            )
+        )
+
+    async def run_group(self, group: List[Tuple[Dict, asyncio.Future]]):
+        """
+        Plans requests for the same stops in one worker and sets their records
+        """
+        scenarios = [scenario for scenario, _ in group]
+        try:
+            records = await asyncio.get_running_loop().run_in_executor(
+                self.executor, plan_batch, scenarios
+            )
+        except Exception as error:
+            logger.exception("Batch failed")
+            records = [
+                {"scenario": scenario["scenario"], "error": str(error)}
+                for scenario in scenarios
+            ]
+
+        for (_, record_future), record in zip(group, records):
+            if not record_future.done():
+                record_future.set_result(record)
+
+    async def answer(self, line: bytes, write_line: Callable[[bytes], Awaitable[None]]):
+        """
+        Plans the request on the line and writes the response
+        """
+        try:
+            scenario = parse_request(line)
+        except ValueError as error:
+            record = {"scenario": None, "error": str(error)}
+        else:
+            record = await self.plan(scenario)
+        await write_line(json.dumps(record).encode() + b"\n")
+
+    async def serve_lines(
+        self,
+        read_line: Callable[[], Awaitable[bytes]],
+        write_line: Callable[[bytes], Awaitable[None]],
+    ):
+        """
+        Answers requests from read_line until it returns an empty line,
+        then waits for the open requests
+        """
+        answers = set()
+        while True:
+            line = await read_line()
+            if not line:
+                break
+            if not line.strip():
+                continue
+            answer = asyncio.create_task(self.answer(line, write_line))
+            answers.add(answer)
+            answer.add_done_callback(answers.discard)
+
+        if answers:
+            await asyncio.gather(*answers)
+
+    async def handle_connection(
+        self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter
+    ):
+        async def write_line(line: bytes):
+            writer.write(line)
+            await writer.drain()
+
+        try:
+            await self.serve_lines(reader.readline, write_line)
+        finally:
+            writer.close()
+
+    async def serve_socket(self, path: str):
+        """
+        Serves every connection to a Unix domain socket at the path until cancelled
+        """
+        server = await asyncio.start_unix_server(self.handle_connection, path=path)
+        logger.info(f"Serving planning requests on {path}")
+        async with server:
+            await server.serve_forever()
+
+    async def serve_stdio(self):
+        """
+        Serves requests from stdin until it is closed, responses go to stdout.
+        Reading happens in a thread so the event loop never waits on stdin
+        """
+        loop = asyncio.get_running_loop()
+
+        async def read_line() -> bytes:
+            return await loop.run_in_executor(None, sys.stdin.buffer.readline)
+
+        async def write_line(line: bytes):
+            sys.stdout.buffer.write(line)
+            sys.stdout.buffer.flush()
+
+        logger.info("Serving planning requests on stdin")
+        await self.serve_lines(read_line, write_line)
+
+
+async def serve(
+    socket_path: Optional[str] = None,
+    max_workers: Optional[int] = None,
+    batch_window: float = BATCH_WINDOW_SECONDS,
+):
+    """
+    Runs a PlanningServer on a Unix domain socket, or on stdin and stdout without one
+    """
+    async with PlanningServer(
+        max_workers=max_workers, batch_window=batch_window
+    ) as server:
+        if socket_path:
+            await server.serve_socket(socket_path)
+        else:
+            await server.serve_stdio()
@@ -0,0 +1,557 @@
+import logging
+import math
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+from assignment import constants
+
+logger = logging.getLogger(__name__)
+
+# Average number of stops per grid cell the index aims for
+POINTS_PER_CELL = 2
+
+# Rebuild the grid once fewer than this fraction of the cells would hold a stop
+MIN_OCCUPANCY = 0.25
+
+
+class UniformGrid:
+    """
+    Uniform grid over integer stop locations used for exact nearest neighbour queries.
+    Stops can be removed, the grid is rebuilt with coarser cells once it gets too sparse
+    so the ring search never has to walk through large empty areas.
+
+    Distances are squared euclidean and ties are broken by the lower stop index,
+    the same way a linear scan with argmin would do it.
+    """
+
+    def __init__(self, locations: np.ndarray):
+        self.xs: List[int] = locations[:, 0].tolist()
+        self.ys: List[int] = locations[:, 1].tolist()
+        self.alive = np.ones(len(locations), dtype=bool)
+        self.n_alive = len(locations)
+        self.n_distance_evaluations = 0
+
+        self.x0 = 0
+        self.y0 = 0
+        self.cell_size = 1
+        self.nx = 0
+        self.ny = 0
+        self.cells: List[List[int]] = []
+
+        self._build(np.asarray(locations, dtype=np.int64))
+
+    def _build(self, locations: np.ndarray):
+        """
+        Puts the alive stops into cells sized so there are about POINTS_PER_CELL stops per cell
+        """
+        indices = np.flatnonzero(self.alive)
+        if len(indices) == 0:
+            self.nx = self.ny = 0
+            self.cells = []
+            return
+
+        alive_locations = locations[indices]
+        x0, y0 = alive_locations.min(axis=0)
+        x1, y1 = alive_locations.max(axis=0)
+        area = float(x1 - x0 + 1) * float(y1 - y0 + 1)
+
+        self.x0 = int(x0)
+        self.y0 = int(y0)
+        self.cell_size = max(
+            1, math.ceil(math.sqrt(area * POINTS_PER_CELL / len(indices)))
+        )
+        self.nx = int(x1 - x0) // self.cell_size + 1
+        self.ny = int(y1 - y0) // self.cell_size + 1
+
+        cell_x = (alive_locations[:, 0] - x0) // self.cell_size
+        cell_y = (alive_locations[:, 1] - y0) // self.cell_size
+        cell_ids = cell_x * self.ny + cell_y
+
+        # stable sort keeps the stop indices ascending inside every cell
+        order = np.argsort(cell_ids, kind="stable")
+        sorted_indices = indices[order].tolist()
+        bounds = np.searchsorted(
+            cell_ids[order], np.arange(self.nx * self.ny + 1)
+        ).tolist()
+
+        self.cells = [
+            sorted_indices[start:stop] for start, stop in zip(bounds, bounds[1:])
+        ]
+
+    def remove(self, index: int):
+        """
+        Removes a stop from the index
+        """
+        cell_x = (self.xs[index] - self.x0) // self.cell_size
+        cell_y = (self.ys[index] - self.y0) // self.cell_size
+        self.cells[cell_x * self.ny + cell_y].remove(index)
+        self.alive[index] = False
+        self.n_alive -= 1
+
+        n_cells = self.nx * self.ny
+        if n_cells > 1 and self.n_alive * POINTS_PER_CELL < n_cells * MIN_OCCUPANCY:
+            locations = np.column_stack([self.xs, self.ys])
+            self._build(locations)
+
+    def nearest(self, x: int, y: int) -> Tuple[int, int]:
+        """
+        Finds the closest alive stop to the given location
+
+        Args:
+            x (int): X coordinate of the query
+            y (int): Y coordinate of the query
+
+        Returns:
+            Tuple[int, int]: index of the closest stop and the squared distance to it,
+            (-1, -1) if there is no stop left
+        """
+        if self.n_alive == 0:
+            return -1, -1
+
+        xs = self.xs
+        ys = self.ys
+        cells = self.cells
+        nx = self.nx
+        ny = self.ny
+        cell_size = self.cell_size
+        x0 = self.x0
+        y0 = self.y0
+
+        cx = min(max((x - x0) // cell_size, 0), nx - 1)
+        cy = min(max((y - y0) // cell_size, 0), ny - 1)
+
+        best_distance = -1
+        best_index = -1
+        n_evaluations = 0
+        ring = 0
+        while True:
+            x_low = cx - ring
+            x_high = cx + ring
+            y_low = cy - ring
+            y_high = cy + ring
+
+            if ring == 0:
+                ring_cells = (cells[cx * ny + cy],)
+            else:
+                y_from = y_low if y_low > 0 else 0
+                y_to = y_high if y_high < ny else ny - 1
+                x_from = x_low + 1 if x_low >= 0 else 0
+                x_to = x_high - 1 if x_high <= nx else nx - 1
+                ring_cells = []
+                # cells are stored column by column, a column is a contiguous slice
+                # and a row is a slice with step ny
+                for column in (x_low, x_high):
+                    if 0 <= column < nx:
+                        start = column * ny + y_from
+                        stop = column * ny + y_to + 1
+                        ring_cells += cells[start:stop]
+                for row in (y_low, y_high):
+                    if 0 <= row < ny and x_from <= x_to:
+                        start = x_from * ny + row
+                        stop = x_to * ny + row + 1
+                        ring_cells += cells[start:stop:ny]
+
+            for cell in ring_cells:
+                n_evaluations += len(cell)
+                for index in cell:
+                    dx = xs[index] - x
+                    dy = ys[index] - y
+                    distance = dx * dx + dy * dy
+                    if (
+                        best_index < 0
+                        or distance < best_distance
+                        or (distance == best_distance and index < best_index)
+                    ):
+                        best_distance = distance
+                        best_index = index
+
+            # Stops outside of the searched square are at least `gap` away along one axis
+            gap = -1
+            if x_low > 0:
+                gap = x - x0 - x_low * cell_size
+            if x_high < nx - 1:
+                side_gap = x0 + (x_high + 1) * cell_size - x
+                if gap < 0 or side_gap < gap:
+                    gap = side_gap
+            if y_low > 0:
+                side_gap = y - y0 - y_low * cell_size
+                if gap < 0 or side_gap < gap:
+                    gap = side_gap
+            if y_high < ny - 1:
+                side_gap = y0 + (y_high + 1) * cell_size - y
+                if gap < 0 or side_gap < gap:
+                    gap = side_gap
+
+            if gap < 0:
+                # the whole grid has been searched
+                break
+            if best_index >= 0 and best_distance < gap * gap:
+                break
+            ring += 1
+
+        self.n_distance_evaluations += n_evaluations
+        return best_index, best_distance
+
+
+def nearest_neighbour_order(
+    locations: np.ndarray,
+    start_location: Tuple[int, int],
+    counters: Optional[Dict[str, int]] = None,
+) -> np.ndarray:
+    """
+    Orders the stops by always going to the closest stop not visited yet,
+    starting from the start location. When two stops are equally far
+    the one with the lower index goes first.
+
+    Args:
+        locations (np.ndarray): n x 2 integer coordinates of the stops
+        start_location (Tuple[int, int]): X and Y coordinates of the starting point
+        counters (Dict[str, int], optional): gets the number of distance evaluations added
+        under "distance_evaluations"
+
+    Returns:
+        np.ndarray: indices of the stops in the visiting order
+    """
+    n_stops = len(locations)
+    order = np.zeros(n_stops, dtype=np.int64)
+    if n_stops == 0:
+        return order
+
+    grid = UniformGrid(locations)
+    x, y = int(start_location[0]), int(start_location[1])
+    for step in range(n_stops):
+        index, _ = grid.nearest(x, y)
+        order[step] = index
+        grid.remove(index)
+        x = grid.xs[index]
+        y = grid.ys[index]
+
+    if counters is not None:
+        counters["distance_evaluations"] = (
+            counters.get("distance_evaluations", 0) + grid.n_distance_evaluations
+        )
+    return order
+
+
+def squared_distance_matrix(locations: np.ndarray) -> np.ndarray:
+    """
+    Squared distances between all pairs of the locations, as an n x n int64 matrix
+    """
+    locations = np.asarray(locations, dtype=np.int64)
+    # squared in place, so only two n x n temporaries exist at a time
+    squared = locations[:, 0, None] - locations[None, :, 0]
+    squared *= squared
+    y_diffs = locations[:, 1, None] - locations[None, :, 1]
+    y_diffs *= y_diffs
+    squared += y_diffs
+    return squared
+
+
+def nearest_neighbour_order_from_matrix(squared_distances: np.ndarray) -> np.ndarray:
+    """
+    Same ordering as nearest_neighbour_order, but with the distances looked up
+    in a precomputed matrix. Row and column 0 belong to the starting point,
+    the rows are only read so the matrix can be memory mapped.
+
+    Args:
+        squared_distances (np.ndarray): (n + 1) x (n + 1) squared distances,
+        the starting point first
+
+    Returns:
+        np.ndarray: indices of the stops in the visiting order, 0 is the first stop
+    """
+    n_stops = len(squared_distances) - 1
+    order = np.zeros(max(n_stops, 0), dtype=np.int64)
+    visited = np.zeros(n_stops + 1, dtype=bool)
+    visited[0] = True
+
+    current = 0
+    unreachable = np.iinfo(np.int64).max
+    for step in range(n_stops):
+        # argmin returns the first minimum, so ties go to the lower index
+        distances = np.where(visited, unreachable, squared_distances[current])
+        current = int(np.argmin(distances))
+        visited[current] = True
+        order[step] = current - 1
+
+    return order
+
+
+# Bytes of float64 temporaries the segment kernel keeps per (stop, segment) pair
+_SEGMENT_KERNEL_BYTES_PER_PAIR = 4 * 8
+
+
+def nearest_segments(
+    locations: np.ndarray,
+    segments: np.ndarray,
+    max_tile_bytes: int = constants.SEGMENT_KERNEL_MAX_BYTES,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Finds the closest segment for every stop. The stops x segments distances are computed
+    in 2-D tiles so the temporaries never take more than max_tile_bytes.
+    Zero-length segments are treated as a single point.
+    When several segments are equally close, the one with the highest index wins.
+
+    Args:
+        locations (np.ndarray): n x 2 coordinates of the stops
+        segments (np.ndarray): m x 4 segments as (start x, start y, end x, end y)
+        max_tile_bytes (int, optional): memory ceiling for one tile.
+        Defaults to constants.SEGMENT_KERNEL_MAX_BYTES.
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: the squared distance to the closest segment
+        and the index of that segment for every stop
+    """
+    n_stops = len(locations)
+    n_segments = len(segments)
+    min_distances = np.full(n_stops, np.inf)
+    closest_segments = np.zeros(n_stops, dtype=np.int64)
+    if n_stops == 0 or n_segments == 0:
+        return min_distances, closest_segments
+
+    segments = np.asarray(segments, dtype=np.float64)
+    # the stops are converted to float64 tile by tile, so compact or large stop arrays
+    # are never copied as a whole
+    locations = np.asarray(locations)
+
+    x_diffs = segments[:, 2] - segments[:, 0]
+    y_diffs = segments[:, 3] - segments[:, 1]
+    segment_lengths_squared = x_diffs**2 + y_diffs**2
+    # zero-length segments have zero diffs, so their projection is always the start point
+    segment_lengths_squared[segment_lengths_squared == 0] = 1
+    x_diffs_sq = x_diffs / segment_lengths_squared
+    y_diffs_sq = y_diffs / segment_lengths_squared
+
+    max_pairs = max(1, max_tile_bytes // _SEGMENT_KERNEL_BYTES_PER_PAIR)
+    segment_tile = min(n_segments, max_pairs)
+    stop_tile = max(1, max_pairs // segment_tile)
+
+    for stop_start in range(0, n_stops, stop_tile):
+        stop_slice = slice(stop_start, stop_start + stop_tile)
+        stop_x = locations[stop_slice, 0, None].astype(np.float64)
+        stop_y = locations[stop_slice, 1, None].astype(np.float64)
+        best_distances = min_distances[stop_slice]
+        best_segments = closest_segments[stop_slice]
+
+        for segment_start in range(0, n_segments, segment_tile):
+            tile = slice(segment_start, segment_start + segment_tile)
+
+            stop_x_diff = stop_x - segments[tile, 0]
+            stop_y_diff = stop_y - segments[tile, 1]
+
+            u = stop_x_diff * x_diffs_sq[tile]
+            temp = stop_y_diff * y_diffs_sq[tile]
+            u += temp
+            np.clip(u, 0, 1, out=u)
+
+            np.multiply(u, x_diffs[tile], out=temp)
+            stop_x_diff -= temp
+            stop_x_diff *= stop_x_diff
+            np.multiply(u, y_diffs[tile], out=temp)
+            stop_y_diff -= temp
+            stop_y_diff *= stop_y_diff
+            distance_squared = stop_x_diff
+            distance_squared += stop_y_diff
+
+            # argmin on the reversed columns gives the last index of the minimum
+            n_tile_segments = distance_squared.shape[1]
+            last_min = (
+                n_tile_segments - 1 - np.argmin(distance_squared[:, ::-1], axis=1)
+            )
+            tile_min = distance_squared[np.arange(len(last_min)), last_min]
+
+            # later tiles have higher segment indices so they win the ties
+            better = tile_min <= best_distances
+            best_distances[better] = tile_min[better]
+            best_segments[better] = last_min[better] + segment_start
+
+    return min_distances, closest_segments
+
+
+def calculate_route_length(locations: np.ndarray) -> float:
+    """
+    Euclidean length of a route going through the locations in order
+
+    Args:
+        locations (np.ndarray): n x 2 coordinates of the stops on the route
+
+    Returns:
+        float: the length of the route
+    """
+    steps = np.diff(np.asarray(locations, dtype=np.float64), axis=0)
+    return float(np.sqrt((steps**2).sum(axis=1)).sum())
+
+
+def k_nearest_neighbours(
+    locations: np.ndarray,
+    k: int,
+    max_tile_bytes: int = constants.SEGMENT_KERNEL_MAX_BYTES,
+    deadline: Optional[float] = None,
+) -> Optional[np.ndarray]:
+    """
+    Finds the k closest other stops of every stop, closest first, ties by the lower index.
+
+    The stops are bucketed into a grid with about k / 2 stops per cell. Every stop first
+    looks at the 3 x 3 cells around it, stops whose k-th neighbour could be outside of
+    the searched cells are searched again with a larger window. All the candidate pairs
+    of a block of stops are evaluated at once, blocks are sized by max_tile_bytes.
+
+    Args:
+        locations (np.ndarray): n x 2 coordinates of the stops
+        k (int): number of neighbours, capped at n - 1
+        max_tile_bytes (int, optional): memory ceiling for the candidate pairs of one block.
+        Defaults to constants.SEGMENT_KERNEL_MAX_BYTES.
+        deadline (float, optional): time.perf_counter time to give up at,
+        checked between blocks
+
+    Returns:
+        Optional[np.ndarray]: n x k indices of the neighbours,
+        None if the deadline passed first
+    """
+    n_stops = len(locations)
+    k = min(k, n_stops - 1)
+    neighbours = np.zeros((n_stops, max(k, 0)), dtype=np.int64)
+    if k <= 0:
+        return neighbours
+
+    locations = np.asarray(locations, dtype=np.float64)
+    xs = locations[:, 0]
+    ys = locations[:, 1]
+    x0, y0 = locations.min(axis=0)
+    x1, y1 = locations.max(axis=0)
+    area = (x1 - x0 + 1) * (y1 - y0 + 1)
+    cell_size = max(1.0, math.sqrt(area * max(k / 2, 1) / n_stops))
+    nx = int((x1 - x0) // cell_size) + 1
+    ny = int((y1 - y0) // cell_size) + 1
+
+    cell_x = ((xs - x0) // cell_size).astype(np.int64)
+    cell_y = ((ys - y0) // cell_size).astype(np.int64)
+    cells = cell_x * ny + cell_y
+    by_cell = np.argsort(cells, kind="stable")
+    cell_counts = np.bincount(cells, minlength=nx * ny)
+    cell_starts = np.concatenate([[0], np.cumsum(cell_counts)[:-1]])
+
+    # distance, index, owner, rank and a few temporaries per candidate pair
+    bytes_per_pair = 6 * 8
+    pending = np.arange(n_stops)
+    radius = 1
+    while len(pending) > 0:
+        window = np.arange(-radius, radius + 1)
+        offset_x = np.repeat(window, len(window))
+        offset_y = np.tile(window, len(window))
+        pairs_per_stop = len(offset_x) * max(k / 2, 1) * 2
+        block = max(1, int(max_tile_bytes // (bytes_per_pair * pairs_per_stop)))
+        window_covers_grid = radius >= max(nx, ny)
+
+        not_done = []
+        for block_start in range(0, len(pending), block):
+            if deadline is not None and time.perf_counter() >= deadline:
+                return None
+            block_end = block_start + block
+            stops = pending[block_start:block_end]
+            found, kth_distances = _window_neighbours(
+                stops,
+                k,
+                xs,
+                ys,
+                cell_x[stops, None] + offset_x,
+                cell_y[stops, None] + offset_y,
+                nx,
+                ny,
+                by_cell,
+                cell_starts,
+                cell_counts,
+                neighbours,
+            )
+
+            # stops outside of the window are at least `gap` away along one axis
+            gap = np.minimum.reduce(
+                [
+                    np.where(
+                        cell_x[stops] - radius > 0,
+                        xs[stops] - x0 - (cell_x[stops] - radius) * cell_size,
+                        np.inf,
+                    ),
+                    np.where(
+                        cell_x[stops] + radius < nx - 1,
+                        x0 + (cell_x[stops] + radius + 1) * cell_size - xs[stops],
+                        np.inf,
+                    ),
+                    np.where(
+                        cell_y[stops] - radius > 0,
+                        ys[stops] - y0 - (cell_y[stops] - radius) * cell_size,
+                        np.inf,
+                    ),
+                    np.where(
+                        cell_y[stops] + radius < ny - 1,
+                        y0 + (cell_y[stops] + radius + 1) * cell_size - ys[stops],
+                        np.inf,
+                    ),
+                ]
+            )
+            exact = (found == k) & (kth_distances < gap**2)
+            if not window_covers_grid:
+                not_done.append(stops[~exact])
+
+        pending = np.concatenate(not_done) if not_done else pending[:0]
+        radius *= 2
+
+    return neighbours
+
+
+def _window_neighbours(
+    stops: np.ndarray,
+    k: int,
+    xs: np.ndarray,
+    ys: np.ndarray,
+    window_x: np.ndarray,
+    window_y: np.ndarray,
+    nx: int,
+    ny: int,
+    by_cell: np.ndarray,
+    cell_starts: np.ndarray,
+    cell_counts: np.ndarray,
+    neighbours: np.ndarray,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Writes the k closest stops among the window cells of every stop into neighbours
+
+    Returns:
+        Tuple[np.ndarray, np.ndarray]: number of neighbours found (at most k) and the squared
+        distance of the k-th one (inf when fewer were found) for every stop
+    """
+    valid = (window_x >= 0) & (window_x < nx) & (window_y >= 0) & (window_y < ny)
+    window_cells = np.where(valid, window_x * ny + window_y, 0)
+    counts = np.where(valid, cell_counts[window_cells], 0).ravel()
+    starts = cell_starts[window_cells].ravel()
+
+    # every (stop, window cell) expands into the stops of the cell
+    owners = np.repeat(np.repeat(np.arange(len(stops)), window_x.shape[1]), counts)
+    pair_ends = np.cumsum(counts)
+    within_cell = np.arange(pair_ends[-1] if len(pair_ends) else 0) - np.repeat(
+        pair_ends - counts, counts
+    )
+    candidates = by_cell[np.repeat(starts, counts) + within_cell]
+
+    not_self = candidates != stops[owners]
+    owners = owners[not_self]
+    candidates = candidates[not_self]
+    x_diffs = xs[stops[owners]] - xs[candidates]
+    y_diffs = ys[stops[owners]] - ys[candidates]
+    distances = x_diffs * x_diffs + y_diffs * y_diffs
+
+    ordered = np.lexsort((candidates, distances, owners))
+    owners = owners[ordered]
+    owner_starts = np.searchsorted(owners, np.arange(len(stops)))
+    ranks = np.arange(len(owners)) - owner_starts[owners]
+    keep = ranks < k
+
+    neighbours[stops[owners[keep]], ranks[keep]] = candidates[ordered][keep]
+    found = np.minimum(np.bincount(owners, minlength=len(stops)), k)
+    kth_distances = np.full(len(stops), np.inf)
+    is_kth = ranks == k - 1
+    kth_distances[owners[is_kth]] = distances[ordered][is_kth]
+
+    return found, kth_distances
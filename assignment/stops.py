@@ -1,13 +1,284 @@
-from typing import Tuple
+from enum import IntEnum
+from typing import Iterable, Iterator, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+# Compact tables keep their coordinates in the first of these that holds them
+COMPACT_COORDINATE_DTYPES = (np.int16, np.int32)
+COMPACT_SIZE_DTYPE = np.float32
+
+# Squared distances up to this are exact in the float64 and int64 accumulators
+# of the distance kernels
+MAX_EXACT_SQUARED_DISTANCE = 2**53
+
+
+class StopKind(IntEnum):
+    DELIVERY = 0
+    PICKUP = 1
+    DEPOT = 2
 
 
 class RouteStop:
-    def __init__(self, x: int, y: int, size: float, is_pickup: bool, is_depot: bool):
+    def __init__(
+        self,
+        x: int,
+        y: int,
+        size: float,
+        is_pickup: bool,
+        is_depot: bool,
+        stop_id: int = -1,
+    ):
         self.x = x
         self.y = y
         self.size = size
         self.is_pickup = is_pickup
         self.is_depot = is_depot
+        self.stop_id = stop_id
 
     def get_location(self) -> Tuple[int, int]:
         return self.x, self.y
+
+
+class StopTable:
+    """
+    Struct-of-arrays storage for stops. Every column has one row per stop:
+    locations (n x 2 coordinates), sizes, kinds (StopKind values) and ids.
+    The id of a stop is its row in the array it was loaded from, depots have id -1.
+
+    RouteStop objects are only built when a single stop is requested,
+    e.g. by indexing with an integer or iterating over the table.
+    """
+
+    def __init__(
+        self,
+        locations: np.ndarray,
+        sizes: np.ndarray,
+        kinds: np.ndarray,
+        ids: np.ndarray,
+    ):
+        self.locations = locations
+        self.sizes = sizes
+        self.kinds = kinds
+        self.ids = ids
+
+    @classmethod
+    def from_array(
+        cls,
+        stops: np.ndarray,
+        kind: StopKind,
+        ids: Optional[np.ndarray] = None,
+    ) -> "StopTable":
+        """
+        Builds a table from the [x, y, size] array returned by utils.generate_stops
+
+        Args:
+            stops (np.ndarray): Stops per row with [x, y, size]
+            kind (StopKind): Kind of all the stops in the array
+            ids (np.ndarray, optional): Stop ids. Defaults to the row indices.
+
+        Returns:
+            StopTable: table with the stops
+        """
+        n_stops = len(stops)
+        return cls(
+            locations=stops[:, :2].astype(np.int64),
+            sizes=stops[:, 2].astype(np.float64),
+            kinds=np.full(n_stops, kind, dtype=np.int8),
+            ids=np.arange(n_stops, dtype=np.int64) if ids is None else ids,
+        )
+
+    @classmethod
+    def from_stops(cls, stops: Iterable[RouteStop]) -> "StopTable":
+        """
+        Builds a table from RouteStop objects. Stops without an id get their position as id
+        """
+        stops = list(stops)
+        if not stops:
+            return cls.empty()
+
+        kinds = [
+            (
+                StopKind.DEPOT
+                if stop.is_depot
+                else StopKind.PICKUP if stop.is_pickup else StopKind.DELIVERY
+            )
+            for stop in stops
+        ]
+        ids = [
+            stop.stop_id if stop.stop_id >= 0 or stop.is_depot else i
+            for i, stop in enumerate(stops)
+        ]
+        return cls(
+            locations=np.array([stop.get_location() for stop in stops], dtype=np.int64),
+            sizes=np.array([stop.size for stop in stops], dtype=np.float64),
+            kinds=np.array(kinds, dtype=np.int8),
+            ids=np.array(ids, dtype=np.int64),
+        )
+
+    @classmethod
+    def depot(cls, location: Tuple[int, int]) -> "StopTable":
+        """
+        Builds a table with a single depot stop
+        """
+        return cls(
+            locations=np.array([location], dtype=np.int64),
+            sizes=np.zeros(1, dtype=np.float64),
+            kinds=np.full(1, StopKind.DEPOT, dtype=np.int8),
+            ids=np.full(1, -1, dtype=np.int64),
+        )
+
+    @classmethod
+    def empty(cls) -> "StopTable":
+        return cls(
+            locations=np.zeros((0, 2), dtype=np.int64),
+            sizes=np.zeros(0, dtype=np.float64),
+            kinds=np.zeros(0, dtype=np.int8),
+            ids=np.zeros(0, dtype=np.int64),
+        )
+
+    @classmethod
+    def concatenate(cls, tables: Sequence["StopTable"]) -> "StopTable":
+        return cls(
+            locations=np.concatenate([table.locations for table in tables]),
+            sizes=np.concatenate([table.sizes for table in tables]),
+            kinds=np.concatenate([table.kinds for table in tables]),
+            ids=np.concatenate([table.ids for table in tables]),
+        )
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.locations[:, 0]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self.locations[:, 1]
+
+    @property
+    def is_pickup(self) -> np.ndarray:
+        return self.kinds == StopKind.PICKUP
+
+    @property
+    def is_depot(self) -> np.ndarray:
+        return self.kinds == StopKind.DEPOT
+
+    @property
+    def nbytes(self) -> int:
+        return (
+            self.locations.nbytes
+            + self.sizes.nbytes
+            + self.kinds.nbytes
+            + self.ids.nbytes
+        )
+
+    def take(self, indices: Union[np.ndarray, slice, Sequence[int]]) -> "StopTable":
+        """
+        Selects the rows by index array, boolean mask or slice
+        """
+        return StopTable(
+            locations=self.locations[indices],
+            sizes=self.sizes[indices],
+            kinds=self.kinds[indices],
+            ids=self.ids[indices],
+        )
+
+    def insert(self, index: int, stops: "StopTable") -> "StopTable":
+        """
+        Returns a new table with the stops inserted before the given row
+        """
+        return StopTable.concatenate(
+            [self.take(slice(0, index)), stops, self.take(slice(index, None))]
+        )
+
+    def delete(self, index: int) -> "StopTable":
+        """
+        Returns a new table without the given row
+        """
+        return StopTable(
+            locations=np.delete(self.locations, index, axis=0),
+            sizes=np.delete(self.sizes, index),
+            kinds=np.delete(self.kinds, index),
+            ids=np.delete(self.ids, index),
+        )
+
+    def to_compact(self) -> "StopTable":
+        """
+        Copy of the table with int16 or int32 coordinates and float32 sizes, a quarter
+        to a half of the memory of the default int64 and float64 columns.
+        Sizes are rounded to float32. The distance kernels convert the coordinates
+        to their accumulator dtype tile by tile, so they never overflow
+
+        Raises:
+            OverflowError: if the coordinates fit into no compact dtype or are so far apart
+            that their squared distances would not be exact
+        """
+        return StopTable(
+            locations=self.locations.astype(
+                get_compact_coordinate_dtype(self.locations)
+            ),
+            sizes=self.sizes.astype(COMPACT_SIZE_DTYPE),
+            kinds=self.kinds,
+            ids=self.ids,
+        )
+
+    def copy(self) -> "StopTable":
+        return StopTable(
+            locations=self.locations.copy(),
+            sizes=self.sizes.copy(),
+            kinds=self.kinds.copy(),
+            ids=self.ids.copy(),
+        )
+
+    def stop(self, index: int) -> RouteStop:
+        """
+        Builds a RouteStop view of a single row
+        """
+        kind = self.kinds[index]
+        return RouteStop(
+            x=int(self.locations[index, 0]),
+            y=int(self.locations[index, 1]),
+            size=float(self.sizes[index]),
+            is_pickup=bool(kind == StopKind.PICKUP),
+            is_depot=bool(kind == StopKind.DEPOT),
+            stop_id=int(self.ids[index]),
+        )
+
+    def __len__(self) -> int:
+        return len(self.sizes)
+
+    def __getitem__(self, index):
+        if isinstance(index, (int, np.integer)):
+            if index < 0:
+                index += len(self)
+            if not 0 <= index < len(self):
+                raise IndexError(f"Stop index {index} out of range")
+            return self.stop(index)
+        return self.take(index)
+
+    def __iter__(self) -> Iterator[RouteStop]:
+        for i in range(len(self)):
+            yield self.stop(i)
+
+
+def get_compact_coordinate_dtype(locations: np.ndarray) -> np.dtype:
+    """
+    Smallest of COMPACT_COORDINATE_DTYPES holding the coordinates
+
+    Raises:
+        OverflowError: if none holds them or two of the locations are further apart
+        than the distance kernels compute exactly
+    """
+    if len(locations) == 0:
+        return np.dtype(COMPACT_COORDINATE_DTYPES[0])
+
+    low = int(locations.min())
+    high = int(locations.max())
+    if 2 * (high - low) ** 2 > MAX_EXACT_SQUARED_DISTANCE:
+        raise OverflowError(
+            f"Coordinates between {low} and {high} are too far apart"
+            " for exact squared distances"
+        )
+    for dtype in COMPACT_COORDINATE_DTYPES:
+        limits = np.iinfo(dtype)
+        if limits.min <= low and high <= limits.max:
+            return np.dtype(dtype)
+    raise OverflowError(f"Coordinates between {low} and {high} fit no compact dtype")
@@ -1,10 +1,10 @@
 import pytest
-from typing import List, Tuple
-from assignment.stops import RouteStop
+import numpy as np
+from assignment.stops import RouteStop, StopTable
 
 
 @pytest.fixture
-def mock_possible_deliveries() -> List[RouteStop]:
+def mock_possible_deliveries() -> StopTable:
     coordinates = [
         (88, 373),
         (100, 872),
@@ -18,43 +18,45 @@ def mock_possible_deliveries() -> List[RouteStop]:
         (861, 271),
     ]
     sizes = [1.2, 10.6, 9.3, 3.1, 2.8, 3.7, 4.0, 6.2, 5.3, 3.9]
-    possible_deliveries = [
+    possible_deliveries = StopTable.from_stops(
         RouteStop(x=x, y=y, size=size, is_depot=False, is_pickup=False)
         for (x, y), size in zip(coordinates, sizes)
-    ]
+    )
     return possible_deliveries
 
 
 @pytest.fixture
-def mock_chosen_deliveries() -> List[RouteStop]:
+def mock_chosen_deliveries() -> StopTable:
     coordinates = [(1, 2), (0, 2), (1, 3), (0, 1)]
-    possible_deliveries = [
+    possible_deliveries = StopTable.from_stops(
         RouteStop(x=x, y=y, size=2, is_depot=False, is_pickup=False)
         for x, y in coordinates
-    ]
+    )
     return possible_deliveries
 
 
 @pytest.fixture
-def mock_pickup_stops() -> List[RouteStop]:
+def mock_pickup_stops() -> StopTable:
     coordinates = [(2, 4), (3, 4), (2, 3)]
-    pickup_stops = [
+    pickup_stops = StopTable.from_stops(
         RouteStop(x=x, y=y, size=2, is_depot=False, is_pickup=True)
         for x, y in coordinates
-    ]
+    )
     return pickup_stops
 
 
 @pytest.fixture
-def mock_route_segments() -> List[Tuple]:
-    return [(0, 0, 0, 1), (0, 1, 0, 2), (0, 2, 1, 2), (1, 2, 1, 3), (1, 3, 0, 0)]
+def mock_route_segments() -> np.ndarray:
+    return np.array(
+        [(0, 0, 0, 1), (0, 1, 0, 2), (0, 2, 1, 2), (1, 2, 1, 3), (1, 3, 0, 0)]
+    )
 
 
 @pytest.fixture
-def mock_planned_delivery_route() -> List[RouteStop]:
+def mock_planned_delivery_route() -> StopTable:
     coordinates = [(0, 0), (0, 1), (0, 2), (1, 2), (1, 3), (0, 0)]
-    planned_delivery_route = [
+    planned_delivery_route = StopTable.from_stops(
         RouteStop(x=x, y=y, size=2, is_depot=False, is_pickup=False)
         for x, y in coordinates
-    ]
+    )
     return planned_delivery_route
@@ -0,0 +1,92 @@
+import csv
+import json
+import pytest
+from assignment.batch import load_scenarios, run_batch, run_scenario
+
+
+@pytest.fixture
+def mock_scenario_grid(tmp_path) -> str:
+    path = tmp_path / "grid.json"
+    path.write_text(json.dumps({"n_deliveries": [100, 200], "seeds": [1, 2]}))
+    return str(path)
+
+
+def test_load_scenarios(mock_scenario_grid):
+    scenarios = load_scenarios(mock_scenario_grid)
+
+    assert len(scenarios) == 4
+    assert scenarios[1] == {
+        "scenario": 1,
+        "n_deliveries": 100,
+        "n_pickups": 100,
+        "seed": 2,
+        "van_capacity": 50,
+        "depots": ((0, 0),),
+    }
+
+
+def test_load_scenarios_with_depots(tmp_path):
+    path = tmp_path / "grid.json"
+    path.write_text(json.dumps({"depots": [[[0, 0]], [[0, 0], [500, 500]]]}))
+
+    scenarios = load_scenarios(str(path))
+
+    assert [scenario["depots"] for scenario in scenarios] == [
+        ((0, 0),),
+        ((0, 0), (500, 500)),
+    ]
+    record = run_scenario({**scenarios[1], "n_deliveries": 100, "n_pickups": 10})
+    assert record["depots"] == ((0, 0), (500, 500))
+
+    path.write_text(json.dumps({"depots": [[[0, 0.5]]]}))
+    with pytest.raises(ValueError, match="not a pair of integer"):
+        load_scenarios(str(path))
+
+
+def test_run_scenario():
+    scenario = {
+        "scenario": 0,
+        "n_deliveries": 100,
+        "n_pickups": 10,
+        "seed": 1,
+        "van_capacity": 20,
+    }
+    record = run_scenario(scenario)
+
+    assert record["n_chosen_deliveries"] == len(record["chosen_delivery_ids"])
+    assert record["chosen_pickup_x"] is not None
+    assert record["route_length"] > 0
+    assert record["total_seconds"] >= record["plan_seconds"]
+
+
+@pytest.mark.parametrize("extension", ["jsonl", "csv"])
+def test_run_batch(extension, mock_scenario_grid, tmp_path):
+    output_path = str(tmp_path / f"results.{extension}")
+
+    n_failed = run_batch(
+        load_scenarios(mock_scenario_grid), output_path=output_path, max_workers=2
+    )
+
+    with open(output_path) as output_file:
+        if extension == "csv":
+            records = list(csv.DictReader(output_file))
+        else:
+            records = [json.loads(line) for line in output_file]
+    assert n_failed == 0
+    assert sorted(int(record["scenario"]) for record in records) == [0, 1, 2, 3]
+
+
+def test_run_batch_streams_routes(mock_scenario_grid, tmp_path):
+    routes_path = str(tmp_path / "routes.jsonl")
+
+    run_batch(
+        load_scenarios(mock_scenario_grid),
+        output_path=str(tmp_path / "results.jsonl"),
+        max_workers=2,
+        routes_path=routes_path,
+    )
+
+    with open(routes_path) as routes_file:
+        routes = [json.loads(line) for line in routes_file]
+    assert sorted(route["scenario"] for route in routes) == [0, 1, 2, 3]
+    assert all(len(route["x"]) == route["n_stops"] for route in routes)
@@ -0,0 +1,39 @@
+from assignment.bench import (
+    ROUTE_STAGES,
+    find_regressions,
+    format_speedups,
+    load_baseline,
+    run_benchmarks,
+    save_baseline,
+)
+
+
+def test_run_benchmarks(tmp_path):
+    results = run_benchmarks(sizes=[100, 200], repeats=1)
+    path = str(tmp_path / "baseline.json")
+    save_baseline(results, path)
+
+    assert list(results) == ["100", "200"]
+    assert list(results["100"]) == ["generate_stops", *ROUTE_STAGES]
+    assert load_baseline(path) == results
+
+
+def test_find_regressions():
+    baseline = {"100": {"create_route": 0.010, "get_route_segments": 0.0001}}
+    results = {
+        "100": {"create_route": 0.013, "get_route_segments": 0.0005},
+        "1000": {"create_route": 1.0},
+    }
+
+    assert find_regressions(results, baseline, threshold=0.5) == []
+    assert find_regressions(results, baseline, threshold=0.2) == [
+        "n=100 create_route: 10.00ms -> 13.00ms"
+    ]
+
+
+def test_run_benchmarks_compact():
+    results = run_benchmarks(sizes=[100], repeats=1, compact=True)
+
+    lines = format_speedups({"100": {"create_route": 0.002}}, results)
+    assert list(results["100"]) == ["generate_stops", *ROUTE_STAGES]
+    assert len(lines) == 1 and lines[0].startswith("n=100 create_route: 2.00ms -> ")
@@ -0,0 +1,74 @@
+import os
+
+import numpy as np
+import pytest
+from assignment.checkpoints import StageCheckpoints
+from assignment.instrumentation import Instrumentation
+from assignment.routes import Route
+
+
+def _run(checkpoint_dir, resume_from=None, **kwargs):
+    route = Route(
+        n_deliveries=300,
+        n_pickups=30,
+        seed=5,
+        max_pickups=2,
+        improve_time_budget=0.2,
+        checkpoints=StageCheckpoints(str(checkpoint_dir)),
+        instrumentation=Instrumentation(trace_memory=False),
+        **kwargs,
+    )
+    route.run(show_plot=False, resume_from=resume_from)
+    return route
+
+
+@pytest.mark.parametrize("resume_from", Route.RUN_STAGES[1:])
+def test_resuming_from_a_stage_gives_the_same_route(tmp_path, resume_from):
+    planned = _run(tmp_path)
+    assert len(os.listdir(tmp_path)) == len(Route.RUN_STAGES)
+
+    resumed = _run(tmp_path, resume_from=resume_from)
+
+    stages = [stage.name for stage in resumed.instrumentation.report.stages]
+    first_stage = Route.RUN_STAGES.index(resume_from)
+    assert stages[0] == "read_checkpoints"
+    assert [name for name in stages if name in Route.RUN_STAGES] == list(
+        Route.RUN_STAGES[first_stage:]
+    )
+    for name in ["chosen_deliveries", "planned_delivery_route", "final_route"]:
+        np.testing.assert_equal(
+            getattr(resumed, name).locations, getattr(planned, name).locations
+        )
+    np.testing.assert_equal(resumed.delivery_order, planned.delivery_order)
+    np.testing.assert_equal(resumed.segment_capacities, planned.segment_capacities)
+    assert [stop.stop_id for stop in resumed.chosen_pickup_stops] == [
+        stop.stop_id for stop in planned.chosen_pickup_stops
+    ]
+
+
+def test_delivery_order_and_indices_describe_the_planned_route(tmp_path):
+    route = _run(tmp_path)
+
+    np.testing.assert_equal(
+        route.possible_delivery_stops.ids[route.chosen_delivery_indices][
+            route.delivery_order
+        ],
+        route.planned_delivery_route.ids[1:-1],
+    )
+
+
+def test_checkpoints_of_other_inputs_are_refused(tmp_path):
+    _run(tmp_path)
+
+    with pytest.raises(ValueError, match="made with other inputs"):
+        _run(tmp_path, resume_from="create_route", van_capacity=40)
+    with pytest.raises(ValueError, match="Unknown stage"):
+        _run(tmp_path, resume_from="plot_route")
+
+    os.remove(tmp_path / "03_improve_route.npz")
+    with pytest.raises(ValueError, match="No readable checkpoint"):
+        _run(tmp_path, resume_from="get_route_segments")
+    with pytest.raises(ValueError, match="without checkpoints"):
+        Route(n_deliveries=10, n_pickups=1).run(
+            show_plot=False, resume_from="create_route"
+        )
@@ -0,0 +1,73 @@
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+import pytest
+from assignment.config import RoutingConfig
+from assignment.fleet import Fleet
+from assignment.routes import Route
+
+
+def _plan(config, seed=3):
+    route = Route(n_deliveries=400, n_pickups=40, seed=seed, config=config)
+    route.load_all_stops()
+    route.plan_route()
+    return route
+
+
+def test_create_checks_the_config():
+    config = RoutingConfig.create(van_capacity=20, depots=[(1, 2), (3.0, 4)])
+
+    assert config == RoutingConfig(van_capacity=20.0, depots=((1, 2), (3, 4)))
+    assert config.depot_location == (1, 2)
+    assert RoutingConfig.create() == RoutingConfig()
+    with pytest.raises(ValueError, match="cannot be negative"):
+        RoutingConfig.create(van_capacity=-1)
+    with pytest.raises(ValueError, match="at least one depot"):
+        RoutingConfig.create(depots=[])
+    with pytest.raises(ValueError, match="not a pair of integer"):
+        RoutingConfig.create(depots=[(1.5, 2)])
+
+
+def test_route_starts_at_the_closest_depot():
+    config = RoutingConfig(depots=((0, 0), (900, 900), (1000, 0)))
+
+    route = _plan(config)
+    total_distances = [
+        ((route.chosen_deliveries.locations - depot) ** 2).sum()
+        for depot in config.depots
+    ]
+
+    assert route.depot_location == config.depots[int(np.argmin(total_distances))]
+    assert route.final_route[0].get_location() == route.depot_location
+    assert route.final_route[-1].get_location() == route.depot_location
+    assert (
+        route.segment_capacities[0] == config.van_capacity - route.route_capacity_usage
+    )
+
+
+def test_routes_with_different_configs_plan_concurrently():
+    configs = [
+        RoutingConfig(van_capacity=capacity, depots=(depot,))
+        for capacity in (20, 50, 120)
+        for depot in ((0, 0), (500, 500))
+    ]
+    expected = [_plan(config).final_route.locations for config in configs]
+
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        routes = list(executor.map(_plan, configs))
+
+    for route, config, locations in zip(routes, configs, expected):
+        assert route.depot_location == config.depot_location
+        np.testing.assert_equal(route.final_route.locations, locations)
+
+
+def test_fleet_vans_start_at_their_depots():
+    config = RoutingConfig(van_capacity=30, depots=((0, 0), (1000, 1000)))
+    fleet = Fleet(
+        n_deliveries=300, n_pickups=30, n_vans=4, max_workers=2, config=config
+    )
+    fleet.run()
+
+    for plan in fleet.van_plans:
+        assert plan.depot_location in config.depots
+        assert plan.final_route[0].get_location() == plan.depot_location
@@ -0,0 +1,88 @@
+import os
+from unittest import mock
+
+import numpy as np
+from assignment.distance_cache import DistanceCache
+from assignment.routes import Route
+from assignment.spatial import (
+    nearest_neighbour_order,
+    nearest_neighbour_order_from_matrix,
+    squared_distance_matrix,
+)
+
+
+def test_squared_distances_are_loaded_from_the_cache(tmp_path):
+    locations = np.random.RandomState(1).randint(0, 100, size=(50, 2))
+    cache = DistanceCache(str(tmp_path))
+
+    computed = cache.squared_distances(locations)
+    loaded = cache.squared_distances(locations)
+
+    assert (cache.hits, cache.misses) == (1, 1)
+    assert isinstance(loaded, np.memmap)
+    np.testing.assert_equal(loaded, computed)
+    np.testing.assert_equal(computed, squared_distance_matrix(locations))
+
+
+def test_cache_hit_survives_a_concurrent_eviction(tmp_path):
+    locations = np.random.RandomState(1).randint(0, 100, size=(20, 2))
+    cache = DistanceCache(str(tmp_path))
+    computed = cache.squared_distances(locations)
+
+    # another process evicts the file right after it was mapped
+    with mock.patch("os.utime", side_effect=FileNotFoundError):
+        loaded = cache.squared_distances(locations)
+
+    assert cache.hits == 1
+    np.testing.assert_equal(loaded, computed)
+
+
+def test_least_recently_used_files_are_evicted(tmp_path):
+    random_state = np.random.RandomState(2)
+    stop_sets = [random_state.randint(0, 100, size=(30, 2)) for _ in range(3)]
+    entry_bytes = squared_distance_matrix(stop_sets[0]).nbytes
+    cache = DistanceCache(str(tmp_path), max_bytes=int(2.5 * entry_bytes))
+
+    cache.squared_distances(stop_sets[0])
+    cache.squared_distances(stop_sets[1])
+    first_path = cache.get_path("dense", [stop_sets[0]])
+    os.utime(cache.get_path("dense", [stop_sets[1]]), (0, 0))
+    cache.squared_distances(stop_sets[2])
+
+    assert sorted(os.listdir(tmp_path)) == sorted(
+        [
+            os.path.basename(first_path),
+            os.path.basename(cache.get_path("dense", [stop_sets[2]])),
+        ]
+    )
+
+
+def test_nearest_neighbour_order_from_matrix_matches_grid_order():
+    random_state = np.random.RandomState(4)
+    for max_coordinate in [5, 1000]:
+        locations = random_state.randint(0, max_coordinate, size=(200, 2))
+        with_start = np.concatenate([[(0, 0)], locations])
+
+        output = nearest_neighbour_order_from_matrix(
+            squared_distance_matrix(with_start)
+        )
+
+        np.testing.assert_equal(output, nearest_neighbour_order(locations, (0, 0)))
+
+
+def test_route_with_distance_cache_plans_the_same_route(tmp_path):
+    uncached = Route(n_deliveries=300, n_pickups=30)
+    uncached.load_all_stops()
+    uncached.plan_route()
+
+    for _ in range(2):
+        cached = Route(
+            n_deliveries=300, n_pickups=30, distance_cache=DistanceCache(str(tmp_path))
+        )
+        cached.load_all_stops()
+        cached.plan_route()
+
+        np.testing.assert_equal(
+            cached.final_route.locations, uncached.final_route.locations
+        )
+    assert cached.distance_cache.misses == 0
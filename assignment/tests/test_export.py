@@ -0,0 +1,102 @@
+import json
+
+import numpy as np
+import pytest
+from assignment.export import (
+    ARRAY_ALIGNMENT,
+    RouteStreamWriter,
+    calculate_load_profile,
+    read_route,
+    write_route,
+)
+from assignment.routes import Route
+from assignment.stops import StopKind
+
+
+@pytest.fixture
+def planned_route() -> Route:
+    route = Route(n_deliveries=200, n_pickups=20, seed=7, max_pickups=3)
+    route.load_all_stops()
+    route.plan_route()
+    return route
+
+
+def test_write_route_is_mapped_back(planned_route, tmp_path):
+    path = str(tmp_path / "route.bin")
+
+    write_route(planned_route, path, metadata={"scenario": "morning"})
+    route_file = read_route(path)
+
+    final_route = planned_route.final_route
+    assert isinstance(route_file.locations, np.memmap)
+    np.testing.assert_equal(route_file.locations, final_route.locations)
+    np.testing.assert_equal(route_file.ids, final_route.ids)
+    np.testing.assert_equal(route_file.kinds, final_route.kinds)
+    np.testing.assert_equal(route_file.sizes, final_route.sizes)
+    assert len(route_file.loads) == len(final_route) - 1
+    assert route_file.metadata["scenario"] == "morning"
+    assert route_file.metadata["n_stops"] == len(final_route)
+    assert route_file.metadata["chosen_pickup_ids"] == [
+        stop.stop_id for stop in planned_route.chosen_pickup_stops
+    ]
+    with open(path, "rb") as route_file_bytes:
+        header = json.loads(route_file_bytes.read()[16 : 16 + _header_length(path)])
+    assert all(
+        array["offset"] % ARRAY_ALIGNMENT == 0 for array in header["arrays"].values()
+    )
+
+
+def _header_length(path):
+    with open(path, "rb") as route_file:
+        return int.from_bytes(route_file.read(16)[12:16], "little")
+
+
+def test_write_route_without_stops(tmp_path):
+    path = str(tmp_path / "route.bin")
+    route = Route(n_deliveries=0, n_pickups=0)
+
+    write_route(route, path)
+
+    assert len(read_route(path).to_stop_table()) == 0
+
+
+def test_read_route_rejects_other_files(tmp_path):
+    path = tmp_path / "route.bin"
+    path.write_bytes(b"not a route file at all")
+
+    with pytest.raises(ValueError, match="not a route file"):
+        read_route(str(path))
+
+
+def test_calculate_load_profile_matches_segment_capacities():
+    route = Route(n_deliveries=100, n_pickups=10, seed=3)
+    route.load_all_stops()
+    route.plan_route()
+
+    loads = calculate_load_profile(
+        route.planned_delivery_route, route.route_capacity_usage
+    )
+
+    np.testing.assert_allclose(
+        loads, route.get_van_capacity() - route.segment_capacities, atol=1e-9
+    )
+    final_loads = calculate_load_profile(route.final_route, route.route_capacity_usage)
+    pickup_index = int(np.flatnonzero(route.final_route.kinds == StopKind.PICKUP)[0])
+    assert final_loads[pickup_index] == pytest.approx(
+        final_loads[pickup_index - 1] + route.chosen_pickup_stop.size
+    )
+
+
+def test_route_stream_writer(planned_route, tmp_path):
+    path = str(tmp_path / "routes.jsonl")
+
+    with RouteStreamWriter(path) as writer:
+        writer.write(planned_route, metadata={"scenario": 0})
+        writer.write(planned_route, metadata={"scenario": 1})
+
+    with open(path) as routes_file:
+        lines = [json.loads(line) for line in routes_file]
+    assert [line["scenario"] for line in lines] == [0, 1]
+    assert lines[0]["x"] == planned_route.final_route.x.tolist()
+    assert lines[0]["ids"] == planned_route.final_route.ids.tolist()
+    assert len(lines[0]["loads"]) == len(planned_route.final_route) - 1
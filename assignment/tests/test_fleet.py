@@ -0,0 +1,49 @@
+import numpy as np
+import pytest
+from assignment.fleet import Fleet
+from assignment.stops import StopKind
+
+
+@pytest.fixture
+def mock_fleet() -> Fleet:
+    fleet = Fleet(n_deliveries=300, n_pickups=30, n_vans=3, max_workers=2)
+    fleet.load_all_stops()
+    return fleet
+
+
+def test_assign_stops_to_vans(mock_fleet):
+    mock_fleet.assign_stops_to_vans()
+
+    all_deliveries = np.concatenate(mock_fleet.van_deliveries)
+    all_pickups = np.concatenate(mock_fleet.van_pickups)
+
+    assert len(mock_fleet.van_deliveries) == 3
+    assert len(np.unique(all_deliveries)) == len(all_deliveries)
+    assert sorted(all_pickups) == list(range(30))
+    for deliveries in mock_fleet.van_deliveries:
+        assert (
+            mock_fleet.delivery_stops.sizes[deliveries].sum()
+            <= mock_fleet.config.van_capacity
+        )
+
+
+def test_plan_van_routes(mock_fleet):
+    mock_fleet.assign_stops_to_vans()
+    mock_fleet.plan_van_routes()
+
+    for plan, deliveries in zip(mock_fleet.van_plans, mock_fleet.van_deliveries):
+        route = plan.final_route
+        route_deliveries = route.ids[route.kinds == StopKind.DELIVERY]
+
+        assert route[0].is_depot and route[-1].is_depot
+        assert sorted(route_deliveries) == sorted(deliveries)
+        np.testing.assert_equal(
+            route.locations[1:-1][route.kinds[1:-1] == StopKind.DELIVERY],
+            mock_fleet.delivery_stops.locations[route_deliveries],
+        )
+
+
+@pytest.mark.parametrize("n_vans", [0, -1])
+def test_fleet_needs_a_van(n_vans):
+    with pytest.raises(ValueError, match="at least one van"):
+        Fleet(n_deliveries=10, n_pickups=1, n_vans=n_vans)
@@ -0,0 +1,73 @@
+import time
+
+import numpy as np
+import pytest
+from assignment.improvement import improve_route
+from assignment.spatial import calculate_route_length, k_nearest_neighbours
+
+
+def _closed_length(locations, order):
+    tour = locations[order]
+    return calculate_route_length(np.concatenate([tour, tour[:1]]))
+
+
+@pytest.mark.parametrize("n_stops", [1, 3, 10, 200])
+def test_improve_route_keeps_depot_first_and_visits_every_stop(n_stops):
+    locations = np.random.RandomState(3).randint(0, 100, size=(n_stops, 2))
+
+    order = improve_route(locations, time_budget=1.0)
+
+    assert order[0] == 0
+    assert sorted(order.tolist()) == list(range(n_stops))
+
+
+def test_improve_route_never_makes_the_route_longer():
+    random_state = np.random.RandomState(5)
+    for _ in range(20):
+        locations = random_state.randint(0, 50, size=(random_state.randint(4, 150), 2))
+
+        order = improve_route(locations, time_budget=1.0)
+
+        assert _closed_length(locations, order) <= _closed_length(
+            locations, np.arange(len(locations))
+        )
+
+
+def test_improve_route_untangles_crossing_edges():
+    locations = np.array([(0, 0), (10, 10), (10, 0), (0, 10)])
+    counters = {}
+
+    order = improve_route(locations, time_budget=1.0, counters=counters)
+
+    assert _closed_length(locations, order) == pytest.approx(40)
+    assert counters["moves_applied"] >= 1
+
+
+def test_k_nearest_neighbours_matches_brute_force():
+    random_state = np.random.RandomState(11)
+    for _ in range(20):
+        n_stops = random_state.randint(2, 300)
+        locations = random_state.randint(
+            0, random_state.choice([5, 1000]), size=(n_stops, 2)
+        )
+        k = random_state.randint(1, 10)
+
+        output = k_nearest_neighbours(locations, k)
+
+        squared = ((locations[:, None, :] - locations[None, :, :]) ** 2).sum(-1)
+        squared = squared.astype(float)
+        np.fill_diagonal(squared, np.inf)
+        candidates = np.broadcast_to(np.arange(n_stops), squared.shape)
+        expected = np.lexsort((candidates, squared), axis=1)[:, : min(k, n_stops - 1)]
+        np.testing.assert_equal(output, expected)
+
+
+def test_improve_route_budget_covers_finding_neighbours():
+    locations = np.random.RandomState(1).randint(0, 1_000_000, size=(100_000, 2))
+
+    start = time.perf_counter()
+    order = improve_route(locations, 0.01)
+
+    # finding the neighbours alone takes longer than a second
+    assert time.perf_counter() - start < 0.5
+    np.testing.assert_equal(np.sort(order), np.arange(len(locations)))
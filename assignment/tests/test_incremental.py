@@ -0,0 +1,124 @@
+import numpy as np
+import pytest
+from assignment.incremental import IncrementalRoute
+from assignment.routes import Route
+from assignment.spatial import nearest_segments
+from assignment.stops import RouteStop, StopKind, StopTable
+
+
+def _pickup(x, y, size):
+    return StopTable.from_stops(
+        [RouteStop(x=x, y=y, size=size, is_pickup=True, is_depot=False)]
+    )
+
+
+@pytest.fixture
+def incremental_route(mock_planned_delivery_route) -> IncrementalRoute:
+    # the van leaves the depot with 1 free unit and every delivery frees 2 more
+    return IncrementalRoute(mock_planned_delivery_route, np.array([1, 3, 5, 7, 9]))
+
+
+def test_add_pickup_inserts_between_the_segment_stops(incremental_route):
+    # equally close to the segments 2 and 3, the later one wins
+    insertion = incremental_route.add_pickup(_pickup(2, 1, 1))
+
+    assert insertion.segment_index == 3
+    assert incremental_route.route[4].get_location() == (2, 1)
+    np.testing.assert_equal(incremental_route.segment_capacities, [1, 3, 5, 7, 6, 8])
+
+
+def test_add_pickup_skips_segments_without_capacity(incremental_route):
+    # lies on segment 0, but only the segments from 2 on have 4 free units
+    insertion = incremental_route.add_pickup(_pickup(0, 1, 4))
+
+    assert insertion.segment_index == 4
+
+
+def test_add_pickup_returns_none_when_nothing_fits(incremental_route):
+    assert incremental_route.add_pickup(_pickup(0, 0, 10)) is None
+    assert len(incremental_route) == 6
+
+
+def test_add_pickup_matches_brute_force():
+    route = Route(n_deliveries=500, n_pickups=100, van_capacity=500)
+    route.load_all_stops()
+    for stage in Route.PLANNING_STAGES[:-1]:
+        route.run_stage(stage)
+    incremental_route = IncrementalRoute.from_route(route)
+    sizes = np.random.RandomState(0).randint(1, 10, len(route.pickup_stops))
+
+    for index in range(len(route.pickup_stops)):
+        pickup = route.pickup_stops.take([index])
+        pickup.sizes[:] = sizes[index]
+        capacities = incremental_route.segment_capacities
+        suffix_min = np.minimum.accumulate(capacities[::-1])[::-1]
+        feasible = np.flatnonzero(suffix_min >= sizes[index])
+        distances, _ = nearest_segments(
+            pickup.locations, incremental_route.segments[feasible], max_tile_bytes=2**20
+        )
+
+        insertion = incremental_route.add_pickup(pickup)
+
+        if len(feasible) == 0:
+            assert insertion is None
+        else:
+            assert insertion.distance == pytest.approx(distances[0])
+    assert (incremental_route.segment_capacities >= 0).all()
+    assert (incremental_route.route.kinds == StopKind.PICKUP).any()
+
+
+def _insert_greedily(incremental_route, pickups, max_pickups):
+    inserted = []
+    for _ in range(max_pickups):
+        best = None
+        for index in set(range(len(pickups))) - {index for index, _ in inserted}:
+            insertion = incremental_route.find_best_insertion(
+                pickups.locations[index], pickups.sizes[index]
+            )
+            # the default metric ranks on truncated distances
+            key = insertion and (int(insertion.distance), pickups.sizes[index], index)
+            if insertion is not None and (best is None or key < best[0]):
+                best = (key, insertion)
+        if best is None:
+            break
+        index = best[0][2]
+        incremental_route.insert_pickup(best[1].segment_index, pickups.take([index]))
+        inserted.append((index, best[1].segment_index))
+    return inserted
+
+
+@pytest.mark.parametrize("seed", [0, 1, 2])
+def test_add_pickups_matches_repeated_best_insertion(seed):
+    route = Route(
+        n_deliveries=300,
+        n_pickups=60,
+        van_capacity=150,
+        max_coordinate=100000,
+        seed=seed,
+    )
+    route.load_all_stops()
+    for stage in Route.PLANNING_STAGES[:-1]:
+        route.run_stage(stage)
+    route.pickup_stops.sizes[:] = np.random.RandomState(seed).randint(1, 15, 60)
+
+    output = IncrementalRoute.from_route(route).add_pickups(route.pickup_stops, 25)
+
+    expected = _insert_greedily(
+        IncrementalRoute.from_route(route), route.pickup_stops, 25
+    )
+    assert [(index, insertion.segment_index) for index, insertion in output] == expected
+
+
+@pytest.mark.parametrize("seed", [6, 20, 21])
+def test_add_pickups_chooses_the_same_first_pickup_as_one_pickup(seed):
+    first_pickups = []
+    for max_pickups in [1, 2]:
+        route = Route(
+            n_deliveries=300, n_pickups=80, seed=seed, max_pickups=max_pickups
+        )
+        route.load_all_stops()
+        for stage in Route.PLANNING_STAGES:
+            route.run_stage(stage)
+        first_pickups.append(route.chosen_pickup_stop.stop_id)
+
+    assert first_pickups[0] == first_pickups[1]
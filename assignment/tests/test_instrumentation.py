@@ -0,0 +1,44 @@
+import json
+from assignment.instrumentation import NULL_INSTRUMENTATION, Instrumentation
+from assignment.routes import Route
+
+
+def test_instrumentation_stage_and_counters():
+    instrumentation = Instrumentation()
+
+    with instrumentation.stage("outer"):
+        instrumentation.count("candidates_examined", 2)
+        instrumentation.count("candidates_examined")
+        _ = [0] * 100_000
+    instrumentation.count("ignored_outside_stage")
+
+    stage = instrumentation.report.get_stage("outer")
+    assert stage.counters == {"candidates_examined": 3}
+    assert stage.wall_seconds > 0
+    assert stage.peak_memory_bytes >= 800_000
+
+
+def test_route_plan_report(tmp_path):
+    received_stages = []
+    instrumentation = Instrumentation(
+        trace_memory=False, callback=lambda stage: received_stages.append(stage.name)
+    )
+    route = Route(n_deliveries=100, n_pickups=10, instrumentation=instrumentation)
+    route.run_stage("load_all_stops")
+    route.plan_route()
+
+    report_path = tmp_path / "report.json"
+    instrumentation.write_json(str(report_path))
+    report = json.loads(report_path.read_text())
+
+    assert received_stages == ["load_all_stops", *Route.PLANNING_STAGES]
+    assert [stage["name"] for stage in report["stages"]] == received_stages
+    assert report["stages"][2]["counters"]["distance_evaluations"] > 0
+    assert report["stages"][0]["peak_memory_bytes"] is None
+
+
+def test_null_instrumentation():
+    with NULL_INSTRUMENTATION.stage("anything"):
+        NULL_INSTRUMENTATION.count("anything")
+
+    assert not NULL_INSTRUMENTATION.enabled
@@ -0,0 +1,131 @@
+import numpy as np
+import pytest
+from assignment.loaders import load_stops
+from assignment.routes import Route
+from assignment.stops import StopKind
+from assignment.utils import generate_stops
+
+
+@pytest.fixture
+def stops():
+    return generate_stops(n=50, max_coordinate=1000, seed=3)
+
+
+def _write_csv(path, header, rows):
+    lines = [",".join(header)] + [",".join(str(value) for value in row) for row in rows]
+    path.write_text("\n".join(lines) + "\n")
+
+
+def _assert_loaded(table, stops, kind=StopKind.DELIVERY):
+    np.testing.assert_equal(table.locations, stops[:, :2].astype(np.int64))
+    np.testing.assert_equal(table.sizes, stops[:, 2])
+    np.testing.assert_equal(table.ids, np.arange(len(stops)))
+    assert (table.kinds == kind).all()
+
+
+@pytest.mark.parametrize("chunk_size", [7, 1000])
+def test_load_stops_csv(tmp_path, stops, chunk_size):
+    path = tmp_path / "stops.csv"
+    _write_csv(path, ["x", "y", "size"], stops)
+
+    table = load_stops(str(path), StopKind.DELIVERY, chunk_size=chunk_size)
+
+    _assert_loaded(table, stops)
+
+
+def test_load_stops_npy_array(tmp_path, stops):
+    path = tmp_path / "stops.npy"
+    np.save(path, stops)
+
+    table = load_stops(str(path), StopKind.PICKUP, chunk_size=7)
+
+    _assert_loaded(table, stops, kind=StopKind.PICKUP)
+
+
+def test_load_stops_npy_structured_with_ids(tmp_path, stops):
+    array = np.zeros(
+        len(stops), dtype=[("id", "i8"), ("lon", "i4"), ("lat", "i4"), ("size", "f4")]
+    )
+    array["id"] = np.arange(len(stops)) + 100
+    array["lon"] = stops[:, 0]
+    array["lat"] = stops[:, 1]
+    array["size"] = stops[:, 2]
+    path = tmp_path / "stops.npy"
+    np.save(path, array)
+
+    table = load_stops(
+        str(path), StopKind.DELIVERY, columns={"x": "lon", "y": "lat"}, chunk_size=7
+    )
+
+    np.testing.assert_equal(table.ids, np.arange(len(stops)) + 100)
+    np.testing.assert_equal(table.locations, stops[:, :2].astype(np.int64))
+    np.testing.assert_allclose(table.sizes, stops[:, 2].astype(np.float32))
+
+
+def test_load_stops_npz(tmp_path, stops):
+    path = tmp_path / "stops.npz"
+    np.savez(path, x=stops[:, 0], y=stops[:, 1], weight=stops[:, 2])
+
+    table = load_stops(str(path), StopKind.DELIVERY, columns={"size": "weight"})
+
+    _assert_loaded(table, stops)
+
+
+def test_load_stops_parquet(tmp_path, stops):
+    pyarrow = pytest.importorskip("pyarrow")
+    import pyarrow.parquet as parquet
+
+    path = tmp_path / "stops.parquet"
+    parquet.write_table(
+        pyarrow.table({"x": stops[:, 0], "y": stops[:, 1], "size": stops[:, 2]}), path
+    )
+
+    table = load_stops(str(path), StopKind.DELIVERY, chunk_size=7)
+
+    _assert_loaded(table, stops)
+
+
+@pytest.mark.parametrize(
+    "rows, message",
+    [
+        ([[1, 2, 3], [4, 5, -1]], "negative or missing sizes, the first in row 1"),
+        ([[1, 2, 3], [4, 5, ""]], "not a number after row 0"),
+        ([[1, 2.5, 3]], "y that is not an integer in row 0"),
+        ([[1, 2, 3], [4, 5, 6], [1, 2, 7]], "rows 0 and 2 at \\(1, 2\\)"),
+    ],
+)
+def test_load_stops_rejects_invalid_rows(tmp_path, rows, message):
+    path = tmp_path / "stops.csv"
+    _write_csv(path, ["x", "y", "size"], rows)
+
+    with pytest.raises(ValueError, match=message):
+        load_stops(str(path), StopKind.DELIVERY, chunk_size=2)
+
+
+def test_load_stops_rejects_missing_columns_and_formats(tmp_path):
+    path = tmp_path / "stops.csv"
+    _write_csv(path, ["x", "y", "weight"], [[1, 2, 3]])
+    with pytest.raises(ValueError, match="no column size"):
+        load_stops(str(path), StopKind.DELIVERY)
+
+    with pytest.raises(ValueError, match=".json files"):
+        load_stops(str(tmp_path / "stops.json"), StopKind.DELIVERY)
+
+
+def test_route_reads_stop_files(tmp_path, stops):
+    deliveries_path = tmp_path / "deliveries.npy"
+    pickups_path = tmp_path / "pickups.csv"
+    np.save(deliveries_path, stops)
+    _write_csv(pickups_path, ["x", "y", "size"], stops[:5])
+
+    route = Route(
+        n_deliveries=0,
+        n_pickups=0,
+        delivery_stops_path=str(deliveries_path),
+        pickup_stops_path=str(pickups_path),
+    )
+    route.load_all_stops()
+
+    assert route.n_deliveries == 50
+    _assert_loaded(route.possible_delivery_stops, stops)
+    _assert_loaded(route.pickup_stops, stops[:5], kind=StopKind.PICKUP)
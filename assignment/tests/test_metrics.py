@@ -0,0 +1,192 @@
+import math
+
+import numpy as np
+import pytest
+from assignment.metrics import (
+    SQUARED_EUCLIDEAN,
+    DistanceMetric,
+    HaversineMetric,
+    ManhattanMetric,
+    MatrixMetric,
+    get_metric,
+)
+from assignment.routes import Route
+from assignment.spatial import nearest_neighbour_order
+from assignment.stops import StopKind, StopTable
+from assignment.utils import generate_stops
+
+
+@pytest.fixture
+def locations():
+    return generate_stops(n=60, max_coordinate=100, seed=5)[:, :2].astype(np.int64)
+
+
+def _manhattan_matrix(locations):
+    return MatrixMetric(
+        locations, np.abs(locations[:, None, :] - locations[None, :, :]).sum(axis=2)
+    )
+
+
+def test_manhattan_and_haversine_match_scalar_formulas(locations):
+    manhattan = ManhattanMetric()
+    haversine = HaversineMetric(degrees_per_unit=0.01)
+
+    def scalar_haversine(a, b):
+        lon1, lat1, lon2, lat2 = (math.radians(value * 0.01) for value in (*a, *b))
+        half_chord = (
+            math.sin((lat2 - lat1) / 2) ** 2
+            + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+        )
+        return 2 * 6_371_000 * math.asin(math.sqrt(half_chord))
+
+    origins, destinations = locations[:5], locations[5:12]
+    for metric, scalar in [
+        (manhattan, lambda a, b: abs(a[0] - b[0]) + abs(a[1] - b[1])),
+        (haversine, scalar_haversine),
+    ]:
+        expected = [[scalar(a, b) for b in destinations] for a in origins]
+        np.testing.assert_allclose(metric.many_to_many(origins, destinations), expected)
+        np.testing.assert_allclose(
+            metric.paired(origins, destinations[:5]),
+            [expected[i][i] for i in range(5)],
+        )
+        np.testing.assert_allclose(
+            metric.one_to_many(origins[0], destinations), expected[0]
+        )
+
+
+def test_matrix_metric_looks_up_rows(locations):
+    metric = _manhattan_matrix(locations)
+    shuffled = locations[::-1]
+
+    np.testing.assert_equal(
+        metric.many_to_many(shuffled, locations),
+        ManhattanMetric().many_to_many(shuffled, locations),
+    )
+    assert metric.symmetric
+    assert metric.key == _manhattan_matrix(locations).key
+    with pytest.raises(ValueError, match="not in the distance matrix"):
+        metric.paired(np.array([[1000, 1000]]), locations[:1])
+
+
+def test_matrix_metric_reads_npz_files(tmp_path, locations):
+    matrix = np.arange(len(locations) ** 2, dtype=np.float64).reshape(
+        len(locations), -1
+    )
+    path = tmp_path / "matrix.npz"
+    np.savez(path, locations=locations, matrix=matrix)
+
+    metric = get_metric("matrix", matrix_path=str(path))
+
+    assert not metric.symmetric
+    assert metric.paired(locations[2:3], locations[7:8])[0] == matrix[2, 7]
+    with pytest.raises(ValueError, match="needs a distance matrix"):
+        get_metric("matrix")
+    with pytest.raises(ValueError, match="Unknown metric"):
+        get_metric("euclidean")
+
+
+def test_generic_kernels_match_the_default_metric(locations):
+    segments = np.concatenate([locations[:-1], locations[1:]], axis=1)[:20]
+    points = locations[20:]
+
+    # the generic kernels only need many_to_many and paired
+    order = DistanceMetric.nearest_neighbour_order(SQUARED_EUCLIDEAN, locations, (0, 0))
+    np.testing.assert_equal(order, nearest_neighbour_order(locations, (0, 0)))
+
+    metric = ManhattanMetric()
+    distances, indices = metric.nearest_segments(points, segments, max_tile_bytes=1)
+    detours = np.array(
+        [
+            [
+                metric.paired(segment[None, :2], point[None])[0]
+                + metric.paired(point[None], segment[None, 2:])[0]
+                - metric.paired(segment[None, :2], segment[None, 2:])[0]
+                for segment in segments
+            ]
+            for point in points
+        ]
+    )
+    np.testing.assert_equal(distances, detours.min(axis=1))
+    # ties go to the highest index
+    np.testing.assert_equal(
+        indices, len(segments) - 1 - np.argmin(detours[:, ::-1], axis=1)
+    )
+
+
+@pytest.mark.parametrize("max_pickups", [1, 3])
+def test_route_plans_with_a_matrix_metric(max_pickups):
+    stops = generate_stops(n=80, max_coordinate=200, seed=2)
+    locations = np.concatenate([[[0, 0]], stops[:, :2].astype(np.int64)])
+    routes = []
+    for metric in [ManhattanMetric(), _manhattan_matrix(locations)]:
+        route = Route.from_stops(
+            StopTable.from_array(stops[:60], kind=StopKind.DELIVERY),
+            StopTable.from_array(stops[60:], kind=StopKind.PICKUP),
+            van_capacity=150,
+            max_pickups=max_pickups,
+            improve_time_budget=1.0,
+            metric=metric,
+        )
+        route.plan_stages()
+        routes.append(route)
+
+    np.testing.assert_equal(
+        routes[0].final_route.locations, routes[1].final_route.locations
+    )
+    assert len(routes[0].chosen_pickup_stops) >= 1
+
+
+def test_route_improves_tours_of_symmetric_metrics_only(locations):
+    metric = ManhattanMetric()
+    stops = np.column_stack([locations, np.ones(len(locations))])
+    lengths = []
+    for improve_time_budget in [0.0, 1.0]:
+        route = Route.from_stops(
+            StopTable.from_array(stops, kind=StopKind.DELIVERY),
+            StopTable.empty(),
+            improve_time_budget=improve_time_budget,
+            metric=metric,
+        )
+        route.choose_most_fitting_stops()
+        route.create_route()
+        route.improve_route()
+        lengths.append(metric.route_length(route.planned_delivery_route.locations))
+
+    assert lengths[1] < lengths[0]
+
+    asymmetric = MatrixMetric(
+        np.concatenate([[[0, 0]], locations]),
+        np.triu(np.ones((len(locations) + 1, len(locations) + 1))),
+    )
+    route.metric = asymmetric
+    planned = route.planned_delivery_route.locations
+    route.improve_route()
+    np.testing.assert_equal(route.planned_delivery_route.locations, planned)
+
+
+def test_single_pickup_ranks_fractional_matrix_distances():
+    stops = generate_stops(n=120, max_coordinate=1000, seed=4)
+    locations = np.concatenate([[[0, 0]], stops[:, :2].astype(np.int64)])
+    # euclidean distances in thousands, every detour is below one
+    hours = MatrixMetric(
+        locations,
+        np.linalg.norm(locations[:, None, :] - locations[None, :, :], axis=2) / 1000,
+    )
+    routes = []
+    for max_pickups in [1, 2]:
+        route = Route.from_stops(
+            StopTable.from_array(stops[:100], kind=StopKind.DELIVERY),
+            StopTable.from_array(stops[100:], kind=StopKind.PICKUP),
+            van_capacity=150,
+            max_pickups=max_pickups,
+            metric=hours,
+        )
+        route.plan_stages()
+        routes.append(route)
+
+    distances = routes[0].calculate_pickup_stop_distances_to_nearest_segment()
+    assert 0 < distances[:, 0].min() < 1
+    assert (
+        routes[0].chosen_pickup_stop.stop_id == routes[1].chosen_pickup_stops[0].stop_id
+    )
@@ -0,0 +1,89 @@
+from unittest import mock
+
+import numpy as np
+import pytest
+from assignment.metrics import ManhattanMetric
+from assignment.multistart import (
+    build_worker_tour,
+    get_tour_length,
+    init_tour_worker,
+    multi_start_nearest_neighbour_order,
+    randomized_nearest_neighbour_order,
+)
+from assignment.routes import Route
+from assignment.spatial import nearest_neighbour_order
+from assignment.utils import generate_stops
+
+
+@pytest.fixture
+def locations():
+    return generate_stops(n=300, seed=1)[:, :2].astype(np.int64)
+
+
+def test_randomized_nearest_neighbour_order_is_seeded(locations):
+    order = randomized_nearest_neighbour_order(locations, (0, 0), seed=1, start_index=3)
+
+    assert sorted(order.tolist()) == list(range(len(locations)))
+    np.testing.assert_equal(
+        order,
+        randomized_nearest_neighbour_order(locations, (0, 0), seed=1, start_index=3),
+    )
+    assert not np.array_equal(
+        order,
+        randomized_nearest_neighbour_order(locations, (0, 0), seed=1, start_index=4),
+    )
+
+
+def test_worker_tours_only_need_the_seed_and_start_index(locations):
+    metric = ManhattanMetric()
+    init_tour_worker(locations, (5, 5), metric)
+
+    np.testing.assert_equal(
+        build_worker_tour(seed=2, start_index=6),
+        randomized_nearest_neighbour_order(locations, (5, 5), 2, 6, metric),
+    )
+
+
+@pytest.mark.parametrize("max_workers", [1, 2])
+def test_multi_start_keeps_the_shortest_tour(locations, max_workers):
+    counters = {}
+    with mock.patch("assignment.multistart.MAX_STARTS", 8):
+        order = multi_start_nearest_neighbour_order(
+            locations, (0, 0), 60.0, max_workers=max_workers, counters=counters
+        )
+
+    lengths = [
+        get_tour_length(locations, (0, 0), nearest_neighbour_order(locations, (0, 0)))
+    ] + [
+        get_tour_length(
+            locations,
+            (0, 0),
+            randomized_nearest_neighbour_order(locations, (0, 0), 0, start_index),
+        )
+        for start_index in range(1, 8)
+    ]
+    assert counters == {"construction_starts": 8}
+    assert get_tour_length(locations, (0, 0), order) == min(lengths)
+
+
+def test_route_create_route_with_multi_start():
+    lengths = []
+    for budget in [0.0, 0.2]:
+        route = Route(
+            n_deliveries=3000,
+            n_pickups=10,
+            multi_start_time_budget=budget,
+            van_capacity=1000,
+        )
+        route.load_all_stops()
+        route.choose_most_fitting_stops()
+        route.create_route()
+        lengths.append(
+            get_tour_length(
+                route.planned_delivery_route.locations,
+                (0, 0),
+                np.arange(len(route.planned_delivery_route)),
+            )
+        )
+
+    assert lengths[1] <= lengths[0]
@@ -0,0 +1,41 @@
+from unittest import mock
+
+import numpy as np
+import pytest
+from assignment.plotting import decimate_route, save_route_plot
+from assignment.routes import Route
+from assignment.stops import StopKind, StopTable
+
+
+@pytest.mark.parametrize("extension,header", [("png", b"\x89PNG"), ("svg", b"<?xml")])
+def test_save_route_plot_writes_the_format_of_the_extension(
+    extension, header, tmp_path, mock_planned_delivery_route, mock_pickup_stops
+):
+    path = tmp_path / f"route.{extension}"
+
+    save_route_plot(mock_planned_delivery_route, str(path), mock_pickup_stops)
+
+    assert path.read_bytes().startswith(header)
+
+
+def test_decimate_route_keeps_depots_and_pickups():
+    locations = np.arange(200).reshape(100, 2)
+    kinds = np.full(100, StopKind.DELIVERY, dtype=np.int8)
+    kinds[[0, -1]] = StopKind.DEPOT
+    kinds[51] = StopKind.PICKUP
+    route = StopTable(locations, np.ones(100), kinds, np.arange(100))
+
+    output = decimate_route(route, max_stops=10)
+
+    assert len(output) == 12
+    assert set(output.ids[output.kinds != StopKind.DELIVERY]) == {0, 51, 99}
+
+
+@mock.patch("assignment.plotting.plot_route")
+def test_run_writes_the_plot_without_showing_it(mock_plot_route, tmp_path):
+    path = tmp_path / "route.png"
+
+    Route(n_deliveries=100, n_pickups=10).run(plot_output=str(path))
+
+    assert path.exists()
+    mock_plot_route.assert_not_called()
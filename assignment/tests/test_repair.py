@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+from assignment.repair import get_free_capacities
+from assignment.routes import Route
+from assignment.stops import RouteStop, StopKind, StopTable
+
+
+def _delivery(x, y, size, stop_id):
+    return StopTable(
+        locations=np.array([[x, y]]),
+        sizes=np.array([size], dtype=np.float64),
+        kinds=np.array([StopKind.DELIVERY], dtype=np.int8),
+        ids=np.array([stop_id]),
+    )
+
+
+@pytest.fixture
+def planned_route() -> Route:
+    route = Route(
+        n_deliveries=400, n_pickups=40, seed=3, van_capacity=200, max_pickups=3
+    )
+    route.load_all_stops()
+    route.plan_route()
+    return route
+
+
+def _assert_consistent(route):
+    segments = route.route_segments
+    capacities = route.segment_capacities
+    route.get_route_segments()
+    route.calculate_route_segment_capacities()
+
+    np.testing.assert_equal(segments, route.route_segments)
+    np.testing.assert_allclose(capacities, route.segment_capacities)
+    result_route = route.get_result_route()
+    np.testing.assert_equal(
+        result_route.ids[result_route.kinds != StopKind.PICKUP],
+        route.planned_delivery_route.ids,
+    )
+    np.testing.assert_equal(
+        route.chosen_deliveries.ids[route.delivery_order],
+        route.planned_delivery_route.ids[1:-1],
+    )
+    assert len(route.chosen_delivery_indices) == len(route.chosen_deliveries)
+    assert route.route_capacity_usage == pytest.approx(
+        route.chosen_deliveries.sizes.sum()
+    )
+    free_capacities = get_free_capacities(
+        result_route, route.get_van_capacity() - route.route_capacity_usage
+    )
+    assert free_capacities.min() >= -1e-9
+
+
+def test_remove_delivery(planned_route):
+    stop_id = int(planned_route.planned_delivery_route.ids[10])
+    length = planned_route.metric.route_length(
+        planned_route.planned_delivery_route.locations
+    )
+    n_final = len(planned_route.final_route)
+
+    splice = planned_route.remove_delivery(stop_id)
+
+    assert splice.position == 10
+    assert stop_id not in planned_route.planned_delivery_route.ids
+    assert len(planned_route.final_route) == n_final - 1
+    assert len(planned_route.chosen_pickup_stops) == 3
+    assert planned_route.metric.route_length(
+        planned_route.planned_delivery_route.locations
+    ) == pytest.approx(length + splice.cost)
+    _assert_consistent(planned_route)
+    assert planned_route.remove_delivery(stop_id) is None
+
+
+def test_insert_delivery_at_the_cheapest_place(planned_route):
+    planned = planned_route.planned_delivery_route
+    delivery = _delivery(500, 500, 1.0, 10_000)
+    lengths = [
+        planned_route.metric.route_length(planned.insert(position, delivery).locations)
+        for position in range(1, len(planned))
+    ]
+
+    splice = planned_route.insert_delivery(delivery)
+
+    assert splice.position == 1 + int(np.argmin(lengths))
+    assert planned_route.metric.route_length(
+        planned_route.planned_delivery_route.locations
+    ) == pytest.approx(min(lengths))
+    _assert_consistent(planned_route)
+
+
+def test_insert_delivery_that_does_not_fit(planned_route):
+    planned = planned_route.planned_delivery_route
+
+    assert planned_route.insert_delivery(_delivery(500, 500, 1000.0, 10_000)) is None
+    assert planned_route.planned_delivery_route is planned
+
+
+def test_insert_delivery_drops_pickups_that_do_not_fit_anymore():
+    deliveries = StopTable.from_stops(
+        RouteStop(x=0, y=y, size=2, is_pickup=False, is_depot=False) for y in (1, 2)
+    )
+    pickups = StopTable.from_stops(
+        [RouteStop(x=1, y=2, size=9, is_pickup=True, is_depot=False)]
+    )
+    route = Route.from_stops(deliveries, pickups, van_capacity=10, max_pickups=2)
+    route.plan_route()
+    assert len(route.chosen_pickup_stops) == 1
+
+    splice = route.insert_delivery(_delivery(1, 1, 2.0, 10_000))
+
+    assert splice is not None
+    assert route.chosen_pickup_stops == []
+    assert route.chosen_pickup_stop is None
+    assert len(route.final_route) == 0
+    _assert_consistent(route)
+
+
+def test_insert_delivery_drops_only_the_pickups_it_has_to():
+    deliveries = StopTable.from_stops(
+        RouteStop(x=0, y=y, size=2, is_pickup=False, is_depot=False) for y in (1, 2)
+    )
+    pickups = StopTable.from_stops(
+        RouteStop(x=1, y=y, size=3, is_pickup=True, is_depot=False) for y in (1, 2)
+    )
+    route = Route.from_stops(deliveries, pickups, van_capacity=10, max_pickups=2)
+    route.plan_route()
+    assert len(route.chosen_pickup_stops) == 2
+
+    route.insert_delivery(_delivery(1, 0, 6.0, 10_000))
+
+    assert len(route.chosen_pickup_stops) == 1
+    assert route.chosen_pickup_stop == route.chosen_pickup_stops[0]
+    assert route.final_route.is_pickup.sum() == 1
+    _assert_consistent(route)
@@ -0,0 +1,83 @@
+import os
+from unittest import mock
+
+import numpy as np
+import pytest
+from assignment.config import RoutingConfig
+from assignment.result_cache import ResultCache, get_run_key
+from assignment.routes import Route
+
+
+def _plan(cache, **kwargs):
+    route = Route(n_deliveries=300, n_pickups=30, seed=5, result_cache=cache, **kwargs)
+    route.load_all_stops()
+    route.plan_route()
+    return route
+
+
+@pytest.mark.parametrize("max_pickups", [1, 3])
+def test_result_cache_hit_restores_the_route(tmp_path, max_pickups):
+    planned = _plan(ResultCache(str(tmp_path)), max_pickups=max_pickups)
+
+    cache = ResultCache(str(tmp_path))
+    with mock.patch.object(Route, "plan_stages") as mock_plan_stages:
+        cached = _plan(cache, max_pickups=max_pickups)
+
+    mock_plan_stages.assert_not_called()
+    assert cache.get_stats() == {"result_cache_hits": 1, "result_cache_misses": 0}
+    for name in ["chosen_deliveries", "planned_delivery_route", "final_route"]:
+        np.testing.assert_equal(
+            getattr(cached, name).locations, getattr(planned, name).locations
+        )
+        np.testing.assert_equal(getattr(cached, name).ids, getattr(planned, name).ids)
+    np.testing.assert_equal(cached.segment_capacities, planned.segment_capacities)
+    assert cached.route_capacity_usage == planned.route_capacity_usage
+    assert [stop.stop_id for stop in cached.chosen_pickup_stops] == [
+        stop.stop_id for stop in planned.chosen_pickup_stops
+    ]
+    assert cached.chosen_pickup_stop.get_location() == (
+        planned.chosen_pickup_stop.get_location()
+    )
+
+
+def test_get_run_key_changes_with_the_inputs():
+    route = Route(n_deliveries=100, n_pickups=10, seed=1)
+    route.load_all_stops()
+    key = get_run_key(route)
+
+    assert get_run_key(route) == key
+    default_config = route.config
+    route.config = RoutingConfig(van_capacity=40)
+    assert get_run_key(route) != key
+    route.config = RoutingConfig(depots=((0, 0), (500, 500)))
+    assert get_run_key(route) != key
+    route.config = default_config
+    route.pickup_stops.sizes[0] += 1
+    assert get_run_key(route) != key
+    route.pickup_stops.sizes[0] -= 1
+    with mock.patch("assignment.constants.PLANNING_ALGORITHM_VERSION", 0):
+        assert get_run_key(route) != key
+
+
+def test_result_cache_evicts_and_clears(tmp_path):
+    cache = ResultCache(str(tmp_path), max_bytes=3000)
+    cache.put("old", {"values": np.zeros(200)})
+    os.utime(cache.get_path("old"), (0, 0))
+    cache.put("new", {"values": np.ones(200)})
+
+    assert cache.get("old") is None
+    np.testing.assert_equal(cache.get("new")["values"], np.ones(200))
+
+    cache.clear()
+    assert cache.get("new") is None
+
+
+def test_result_cache_hit_survives_a_concurrent_eviction(tmp_path):
+    cache = ResultCache(str(tmp_path))
+    cache.put("key", {"values": np.arange(3)})
+
+    # another process evicts the result right after it was read
+    with mock.patch("os.utime", side_effect=FileNotFoundError):
+        result = cache.get("key")
+
+    np.testing.assert_equal(result["values"], np.arange(3))
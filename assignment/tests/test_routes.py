@@ -1,6 +1,7 @@
 from unittest import mock
 import pytest
 import numpy as np
+from assignment.config import RoutingConfig
 from assignment.routes import Route
 
 
@@ -57,8 +58,8 @@ def test_get_pickup_stops(mock_route):
     assert not first_stop.is_depot
 
 
-@mock.patch("assignment.constants.VAN_CAPACITY", 4.5)
 def test_choose_most_fitting_stops(mock_route, mock_possible_deliveries):
+    mock_route.config = RoutingConfig(van_capacity=4.5)
     mock_route.possible_delivery_stops = mock_possible_deliveries.copy()
     mock_route.choose_most_fitting_stops()
 
@@ -95,7 +96,7 @@ def test_get_route_segments(mock_route, mock_chosen_deliveries, mock_route_segme
     mock_route.create_route()
     mock_route.get_route_segments()
 
-    assert mock_route.route_segments == mock_route_segments
+    np.testing.assert_equal(mock_route.route_segments, mock_route_segments)
 
 
 def test_calculate_segment_capacities(mock_route, mock_chosen_deliveries):
@@ -105,7 +106,7 @@ def test_calculate_segment_capacities(mock_route, mock_chosen_deliveries):
     mock_route.calculate_route_segment_capacities()
 
     expected_output = [42, 44, 46, 48, 50]
-    assert expected_output == mock_route.segment_capacities
+    np.testing.assert_equal(mock_route.segment_capacities, expected_output)
 
 
 def test_calculate_pickup_stop_distances_to_nearest_segment(
@@ -126,7 +127,7 @@ def test_calculate_pickup_stop_distances_to_nearest_segment(
 def test_add_pickup_stop_to_route(
     mock_distances, mock_route, mock_pickup_stops, mock_planned_delivery_route
 ):
-    mock_pickup_stops[2].size = 5
+    mock_pickup_stops.sizes[2] = 5
     mock_distances.return_value = np.array([[2, 4], [5, 4], [1, 4]])
     mock_route.pickup_stops = mock_pickup_stops
     mock_route.segment_capacities = [0, 1, 2, 3, 4]
@@ -136,3 +137,62 @@ def test_add_pickup_stop_to_route(
 
     assert mock_route.chosen_pickup_stop.get_location() == (2, 4)
     assert mock_route.final_route[4].get_location() == (2, 4)
+
+
+def test_improve_route_keeps_the_ends_and_stops(
+    mock_route, mock_planned_delivery_route
+):
+    mock_route.planned_delivery_route = mock_planned_delivery_route.copy()
+    mock_route.improve_time_budget = 1.0
+
+    mock_route.improve_route()
+
+    locations = mock_route.planned_delivery_route.locations
+    assert locations[0].tolist() == [0, 0] and locations[-1].tolist() == [0, 0]
+    assert sorted(map(tuple, locations[1:-1].tolist())) == [
+        (0, 1),
+        (0, 2),
+        (1, 2),
+        (1, 3),
+    ]
+
+
+def test_add_pickup_stop_to_route_inserts_up_to_max_pickups():
+    route = Route(n_deliveries=200, n_pickups=50, van_capacity=200, max_pickups=5)
+    route.load_all_stops()
+    route.plan_route()
+
+    assert len(route.chosen_pickup_stops) == 5
+    assert route.chosen_pickup_stop == route.chosen_pickup_stops[0]
+    assert route.final_route.is_pickup.sum() == 5
+    assert len(route.final_route) == len(route.planned_delivery_route) + 5
+
+
+@pytest.mark.parametrize("max_pickups", [1, 4])
+def test_compact_route_plans_the_same_route(max_pickups):
+    routes = []
+    for compact in [False, True]:
+        route = Route(
+            n_deliveries=2000, n_pickups=500, compact=compact, max_pickups=max_pickups
+        )
+        route.load_all_stops()
+        route.plan_route()
+        routes.append(route)
+
+    default_route, compact_route = routes
+    assert compact_route.possible_delivery_stops.locations.dtype == np.int16
+    assert compact_route.pickup_stops.sizes.dtype == np.float32
+    np.testing.assert_equal(
+        compact_route.final_route.ids, default_route.final_route.ids
+    )
+
+
+def test_use_compact_dtypes_guards_against_overflow(mock_route):
+    mock_route.load_all_stops()
+    mock_route.pickup_stops.locations[0] = [70_000, 1]
+    mock_route.use_compact_dtypes()
+    assert mock_route.pickup_stops.locations.dtype == np.int32
+
+    mock_route.pickup_stops.locations[0] = [2**27, 1]
+    with pytest.raises(OverflowError, match="too far apart"):
+        mock_route.use_compact_dtypes()
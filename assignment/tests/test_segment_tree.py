@@ -0,0 +1,33 @@
+import math
+
+import numpy as np
+from assignment.segment_tree import MinSegmentTree
+
+
+def test_min_segment_tree_matches_array():
+    random_state = np.random.RandomState(0)
+    for _ in range(50):
+        n_values = random_state.randint(1, 40)
+        values = random_state.randint(-20, 20, n_values).astype(float)
+        tree = MinSegmentTree(values)
+
+        for _ in range(30):
+            start, stop = sorted(random_state.randint(0, n_values + 1, 2))
+            value = random_state.randint(-5, 6)
+            tree.add(start, stop, value)
+            values[start:stop] += value
+
+            start, stop = sorted(random_state.randint(0, n_values + 1, 2))
+            expected_min = values[start:stop].min() if stop > start else math.inf
+            assert tree.min(start, stop) == expected_min
+
+            threshold = random_state.randint(-20, 20)
+            below = np.flatnonzero(values < threshold)
+            assert tree.find_last_below(threshold) == (below[-1] if len(below) else -1)
+
+
+def test_find_last_below_without_smaller_values():
+    tree = MinSegmentTree([3, 1, 2])
+
+    assert tree.find_last_below(1) == -1
+    assert tree.find_last_below(2) == 1
@@ -0,0 +1,58 @@
+import numpy as np
+import pytest
+from assignment.selection import (
+    select_smallest_fitting,
+    select_smallest_fitting_from_chunks,
+)
+
+
+def _select_one_by_one(sizes, capacity):
+    sorted_indices = np.argsort(sizes, kind="stable")
+    total_size = 0
+    n_selected = 0
+    for index in sorted_indices:
+        if total_size + sizes[index] > capacity:
+            break
+        total_size += sizes[index]
+        n_selected += 1
+    return sorted_indices[:n_selected], total_size
+
+
+@pytest.mark.parametrize("capacity", [0, 5, 50, 1e9])
+def test_select_smallest_fitting_matches_greedy(capacity):
+    random_state = np.random.RandomState(0)
+    for max_size in [3, 50]:
+        sizes = random_state.randint(0, max_size, 500).astype(float)
+
+        selection = select_smallest_fitting(sizes, capacity)
+
+        expected_indices, expected_total = _select_one_by_one(sizes, capacity)
+        np.testing.assert_equal(selection.indices, expected_indices)
+        assert selection.total_size == expected_total
+
+
+def test_select_smallest_fitting_keeps_index_order_on_ties():
+    sizes = np.array([2.0, 1.0, 2.0, 1.0, 2.0])
+
+    selection = select_smallest_fitting(sizes, 5)
+
+    np.testing.assert_equal(selection.indices, [1, 3, 0])
+    assert selection.n_examined == 4
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 100, 1000])
+def test_select_smallest_fitting_from_chunks_matches_in_memory(chunk_size):
+    sizes = np.random.RandomState(1).random_sample(1000) * 10 + 1
+    chunks = (sizes[start : start + chunk_size] for start in range(0, 1000, chunk_size))
+
+    output = select_smallest_fitting_from_chunks(chunks, 50)
+
+    expected = select_smallest_fitting(sizes, 50)
+    np.testing.assert_equal(output.indices, expected.indices)
+    assert output.total_size == expected.total_size
+    assert output.n_examined == expected.n_examined
+
+
+def test_select_smallest_fitting_from_chunks_rejects_negative_sizes():
+    with pytest.raises(ValueError):
+        select_smallest_fitting_from_chunks([np.array([1.0, -1.0])], 5)
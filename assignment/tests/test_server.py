@@ -0,0 +1,93 @@
+import asyncio
+import json
+
+import pytest
+from assignment.server import PlanningServer, parse_request, plan_batch, split_batch
+
+
+def test_parse_request_fills_defaults():
+    scenario = parse_request(b'{"id": "a", "n_deliveries": 10}')
+
+    assert scenario == {
+        "scenario": "a",
+        "n_deliveries": 10,
+        "n_pickups": 100,
+        "seed": 42,
+        "van_capacity": 50,
+        "depots": ((0, 0),),
+    }
+
+
+@pytest.mark.parametrize(
+    "line",
+    [
+        b"[1]",
+        b'{"n_vans": 2}',
+        b'{"seed": 1.5}',
+        b'{"n_pickups": -1}',
+        b"{",
+        b'{"depots": [1, 2]}',
+        b'{"depots": [[1, 2.5]]}',
+        b'{"depots": []}',
+        b'{"id": 1, "depots": [[null, 1]]}',
+        b'{"depots": [[[1], 1]]}',
+        b'{"depots": [[true, false]]}',
+        b'{"depots": [[1, "2"]]}',
+    ],
+)
+def test_parse_request_rejects_invalid_requests(line):
+    with pytest.raises(ValueError):
+        parse_request(line)
+
+
+def test_plan_batch_answers_every_request():
+    scenarios = [
+        parse_request(b'{"id": 1, "n_deliveries": 100, "n_pickups": 10}'),
+        parse_request(b'{"id": 2, "n_deliveries": 100, "n_pickups": 10}'),
+        parse_request(b'{"id": 3, "n_deliveries": 2000000, "n_pickups": 10}'),
+        parse_request(
+            b'{"id": 4, "n_deliveries": 100, "n_pickups": 10, "depots": [[900, 900]]}'
+        ),
+    ]
+
+    records = plan_batch(scenarios)
+
+    assert [record["scenario"] for record in records] == [1, 2, 3, 4]
+    assert records[0]["chosen_delivery_ids"] == records[1]["chosen_delivery_ids"]
+    assert "error" in records[2]
+    assert records[3]["depots"] == ((900, 900),)
+    assert records[3]["route_length"] != records[0]["route_length"]
+
+
+def test_split_batch_groups_requests_for_the_same_stops():
+    scenarios = [
+        parse_request(line)
+        for line in [
+            b'{"seed": 1}',
+            b'{"seed": 2}',
+            b'{"seed": 1, "van_capacity": 30}',
+            b'{"n_deliveries": 10}',
+        ]
+    ]
+
+    assert split_batch(scenarios) == [[0, 2], [1], [3]]
+
+
+def test_planning_server_answers_lines():
+    lines = [b'{"id": 1, "n_deliveries": 100, "n_pickups": 10}\n', b"nope\n", b""]
+    responses = []
+
+    async def read_line():
+        return lines.pop(0)
+
+    async def write_line(line):
+        responses.append(json.loads(line))
+
+    async def serve():
+        async with PlanningServer(max_workers=1) as server:
+            await server.serve_lines(read_line, write_line)
+
+    asyncio.run(serve())
+
+    assert sorted(str(response["scenario"]) for response in responses) == ["1", "None"]
+    assert any(response.get("n_chosen_deliveries") for response in responses)
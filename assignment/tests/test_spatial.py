@@ -0,0 +1,72 @@
+import numpy as np
+import pytest
+from assignment.spatial import UniformGrid, nearest_neighbour_order, nearest_segments
+
+
+def _brute_force_order(locations, start_location):
+    stops_left = list(range(len(locations)))
+    previous_xy = start_location
+    order = []
+    for _ in range(len(locations)):
+        distances = [
+            (locations[i][0] - previous_xy[0]) ** 2
+            + (locations[i][1] - previous_xy[1]) ** 2
+            for i in stops_left
+        ]
+        closest = distances.index(min(distances))
+        order.append(stops_left[closest])
+        previous_xy = locations[stops_left[closest]]
+        stops_left.pop(closest)
+    return order
+
+
+@pytest.mark.parametrize("max_coordinate", [5, 30, 1000])
+def test_nearest_neighbour_order_matches_linear_scan(max_coordinate):
+    random_state = np.random.RandomState(7)
+    for _ in range(20):
+        n_stops = random_state.randint(1, 200)
+        locations = random_state.randint(0, max_coordinate, size=(n_stops, 2))
+
+        output = nearest_neighbour_order(locations, (0, 0))
+
+        assert list(output) == _brute_force_order(locations.tolist(), (0, 0))
+
+
+def test_nearest_neighbour_order_ties_go_to_lower_index():
+    locations = np.array([(3, 3), (0, 1), (1, 0)])
+
+    output = nearest_neighbour_order(locations, (0, 0))
+
+    np.testing.assert_equal(output, [1, 2, 0])
+
+
+def test_uniform_grid_nearest_after_remove():
+    grid = UniformGrid(np.array([(1, 1), (5, 5), (9, 9)]))
+    grid.remove(1)
+
+    assert grid.nearest(6, 6) == (2, 18)
+    assert grid.n_alive == 2
+
+
+@pytest.mark.parametrize("max_tile_bytes", [32, 256, 2**20])
+def test_nearest_segments_tiles_give_the_same_result(
+    max_tile_bytes, mock_pickup_stops, mock_route_segments
+):
+    distances, segment_indices = nearest_segments(
+        mock_pickup_stops.locations,
+        mock_route_segments,
+        max_tile_bytes=max_tile_bytes,
+    )
+
+    np.testing.assert_equal(distances, [2, 5, 1])
+    np.testing.assert_equal(segment_indices, [4, 4, 4])
+
+
+def test_nearest_segments_zero_length_segment():
+    segments = np.array([(0, 0, 0, 0), (0, 0, 4, 0), (4, 0, 4, 0)])
+    locations = np.array([(-3, 4), (6, 0), (2, 1)])
+
+    distances, segment_indices = nearest_segments(locations, segments)
+
+    np.testing.assert_equal(distances, [25, 4, 1])
+    np.testing.assert_equal(segment_indices, [1, 2, 1])
@@ -0,0 +1,71 @@
+import numpy as np
+import pytest
+from assignment.utils import generate_stops, generate_stops_parallel, iter_stops
+
+
+@pytest.mark.parametrize("n, max_coordinate", [(100, 1000), (90, 11), (100, 11)])
+def test_generate_stops_are_distinct(n, max_coordinate):
+    stops = generate_stops(n=n, max_coordinate=max_coordinate)
+
+    assert stops.shape == (n, 3)
+    assert len(np.unique(stops[:, :2], axis=0)) == n
+    assert stops[:, :2].min() >= 1
+    assert stops[:, :2].max() < max_coordinate
+
+
+def test_generate_stops_is_reproducible():
+    np.testing.assert_equal(generate_stops(n=50, seed=3), generate_stops(n=50, seed=3))
+
+
+def test_generate_stops_legacy():
+    output = generate_stops(n=4, max_coordinate=4, seed=42, legacy=True)
+
+    np.testing.assert_equal(output[:, :2], [(1, 1), (3, 1), (3, 2), (3, 3)])
+    np.testing.assert_allclose(
+        output[:, 2], [2.55994520, 1.58083612, 9.66176146, 7.01115012]
+    )
+
+
+def test_generate_stops_too_many():
+    with pytest.raises(ValueError):
+        generate_stops(n=10, max_coordinate=4)
+
+
+@pytest.mark.parametrize("n, max_coordinate", [(1000, 100), (1000, 40)])
+def test_iter_stops_are_distinct_across_chunks(n, max_coordinate):
+    chunks = list(iter_stops(n=n, chunk_size=300, max_coordinate=max_coordinate))
+    stops = np.concatenate(chunks)
+
+    assert [len(chunk) for chunk in chunks] == [300, 300, 300, 100]
+    assert len(np.unique(stops[:, :2], axis=0)) == n
+
+
+@pytest.mark.parametrize("n, max_coordinate", [(3000, 1000), (3000, 60)])
+def test_generate_stops_parallel_does_not_depend_on_workers(
+    tmp_path, n, max_coordinate
+):
+    stops = generate_stops_parallel(
+        n=n, max_coordinate=max_coordinate, seed=4, block_size=700
+    )
+    output_path = str(tmp_path / "stops.npy")
+    parallel_stops = generate_stops_parallel(
+        n=n,
+        max_coordinate=max_coordinate,
+        seed=4,
+        block_size=700,
+        max_workers=2,
+        output_path=output_path,
+    )
+
+    assert stops.shape == (n, 3)
+    assert len(np.unique(stops[:, :2], axis=0)) == n
+    assert stops[:, :2].min() >= 1
+    assert stops[:, :2].max() < max_coordinate
+    np.testing.assert_equal(parallel_stops, stops)
+    np.testing.assert_equal(np.load(output_path), stops)
+    assert not np.array_equal(
+        generate_stops_parallel(
+            n=n, max_coordinate=max_coordinate, seed=5, block_size=700
+        ),
+        stops,
+    )
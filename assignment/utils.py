@@ -1,9 +1,21 @@
 import numpy as np
 import logging
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterator, List, Optional, Tuple, Union
 
+from assignment.parallel import SharedArrayDescriptor, SharedArrays, attach_arrays
 
 logger = logging.getLogger(__name__)
 
+# Above this fraction of occupied plane cells a permutation is cheaper than rejection sampling
+DENSE_PLANE_FRACTION = 0.25
+
+# Extra candidates drawn per rejection sampling round to make up for the duplicates
+REJECTION_OVERSAMPLING = 1.1
+
+# Stops drawn per block by generate_stops_parallel, every block has its own random stream
+GENERATION_BLOCK_SIZE = 1_000_000
+
 
 def generate_stops(
     n: int = 1000,
@@ -12,8 +24,11 @@ def generate_stops(
     min_size: int = 1,
     max_size: int = 10,
     seed: int = 42,
+    legacy: bool = False,
 ) -> np.ndarray:
     """Generates stops location including their size, making sure there are no two stop
+    with the same location. The locations are drawn as distinct cells of the plane in one go,
+    with rejection sampling for sparse planes and a permutation for dense ones.
 
     Args:
         n (int, optional): Number of stops to generate. Defaults to 1000.
@@ -24,6 +39,9 @@ def generate_stops(
         min_size (int, optional): Minimum package size. Defaults to 1.
         max_size (int, optional): Maxixmum package size. Defaults to 10.
         seed (int, optional): Le seed. Defaults to 42.
+        legacy (bool, optional): Reproduces the exact stops of the original generator
+        (sorted unique draws topped up one stop at a time). Slower, only meant for comparing
+        with old results. Defaults to False.
 
     Returns:
         np.ndarary: Stops per row with [x, y, size]
@@ -33,22 +51,344 @@ def generate_stops(
         raise ValueError(f"Cannot generate {n} distinct stops in such a small plane")
 
     random_state = np.random.RandomState(seed)
+    if legacy:
+        return _generate_stops_legacy(
+            random_state, n, min_coordinate, max_coordinate, min_size, max_size
+        )
+
+    span = max_coordinate - min_coordinate
+    cells = _draw_distinct_cells(random_state, n, span**2)
+    random_sizes = random_state.random_sample(size=n) * max_size + min_size
+
+    return _cells_to_stops(cells, random_sizes, min_coordinate, span)
+
+
+def iter_stops(
+    n: int = 1000,
+    chunk_size: int = 100_000,
+    min_coordinate: int = 1,
+    max_coordinate: int = 1000,
+    min_size: int = 1,
+    max_size: int = 10,
+    seed: int = 42,
+) -> Iterator[np.ndarray]:
+    """Generates distinct stops in blocks of at most chunk_size rows, so very large instances
+    never have to be held in memory at once. Locations are distinct across all the blocks.
+    The stops depend on the seed and on the chunk size.
+
+    Sparse planes keep one byte per plane cell to remember the used locations.
+
+    Args:
+        n (int, optional): Number of stops to generate. Defaults to 1000.
+        chunk_size (int, optional): Maximum number of stops per block. Defaults to 100_000.
+        min_coordinate (int, optional): Minimum X and Y coordinate possible. Defaults to 1.
+        max_coordinate (int, optional): Maximum X and Y coordinate. Defaults to 1000.
+        min_size (int, optional): Minimum package size. Defaults to 1.
+        max_size (int, optional): Maxixmum package size. Defaults to 10.
+        seed (int, optional): Le seed. Defaults to 42.
+
+    Yields:
+        np.ndarray: Stops per row with [x, y, size]
+    """
+    span = max_coordinate - min_coordinate
+    n_cells = span**2
+    if n_cells < n:
+        raise ValueError(f"Cannot generate {n} distinct stops in such a small plane")
+
+    random_state = np.random.RandomState(seed)
+    if n >= n_cells * DENSE_PLANE_FRACTION:
+        all_cells = random_state.permutation(n_cells)[:n]
+        used_cells = None
+    else:
+        all_cells = None
+        used_cells = np.zeros(n_cells, dtype=bool)
+
+    for chunk_start in range(0, n, chunk_size):
+        n_chunk = min(chunk_size, n - chunk_start)
+        if all_cells is not None:
+            cells = all_cells[chunk_start:][:n_chunk]
+        else:
+            cells = _draw_distinct_cells(random_state, n_chunk, n_cells, used_cells)
+            used_cells[cells] = True
+        random_sizes = random_state.random_sample(size=n_chunk) * max_size + min_size
+
+        yield _cells_to_stops(cells, random_sizes, min_coordinate, span)
+
+
+def generate_stops_parallel(
+    n: int = 1000,
+    min_coordinate: int = 1,
+    max_coordinate: int = 1000,
+    min_size: int = 1,
+    max_size: int = 10,
+    seed: int = 42,
+    max_workers: int = 1,
+    block_size: int = GENERATION_BLOCK_SIZE,
+    output_path: Optional[str] = None,
+) -> np.ndarray:
+    """Generates distinct stops like generate_stops, in blocks drawn by worker processes.
+
+    The stops are split into blocks of block_size rows and every block gets its own
+    np.random.Generator from SeedSequence(seed).spawn, so the stops only depend on the
+    seed and the block size, never on the number of workers. The workers write their
+    blocks straight into shared memory, or into the memory mapped output file.
+    Locations drawn twice, within a block or across blocks, keep their first row and
+    the later rows get new locations from one more stream, drawn in row order.
+    Dense planes draw all the locations as one permutation of that stream instead.
+
+    Args:
+        n (int, optional): Number of stops to generate. Defaults to 1000.
+        min_coordinate (int, optional): Minimum X and Y coordinate possible. Defaults to 1.
+        max_coordinate (int, optional): Maximum X and Y coordinate. Defaults to 1000.
+        min_size (int, optional): Minimum package size. Defaults to 1.
+        max_size (int, optional): Maxixmum package size. Defaults to 10.
+        seed (int, optional): Le seed. Defaults to 42.
+        max_workers (int, optional): Number of processes, 1 draws the blocks
+        in this process. Defaults to 1.
+        block_size (int, optional): Stops per block. Defaults to GENERATION_BLOCK_SIZE.
+        output_path (str, optional): Writes the stops to this .npy file
+        and returns it memory mapped. Defaults to an array in memory.
+
+    Returns:
+        np.ndarray: Stops per row with [x, y, size]
+    """
+    span = max_coordinate - min_coordinate
+    n_cells = span**2
+    if n_cells < n:
+        raise ValueError(f"Cannot generate {n} distinct stops in such a small plane")
+
+    n_blocks = -(-n // block_size)
+    # one stream per block and the last one for the locations drawn again
+    *block_seeds, location_seed = np.random.SeedSequence(seed).spawn(n_blocks + 1)
+    dense = n >= n_cells * DENSE_PLANE_FRACTION
+    block_args = [
+        (start, min(block_size, n - start), block_seed, n_cells, span)
+        for start, block_seed in zip(range(0, n, block_size), block_seeds)
+    ]
+    draw_args = (min_coordinate, min_size, max_size, not dense)
+
+    if output_path is not None:
+        stops = np.lib.format.open_memmap(
+            output_path, mode="w+", dtype=np.float64, shape=(n, 3)
+        )
+    else:
+        stops = np.zeros((n, 3), dtype=np.float64)
+
+    if max_workers <= 1 or n_blocks <= 1:
+        for args in block_args:
+            _draw_block(stops, *args, *draw_args)
+    elif output_path is not None:
+        stops.flush()
+        _draw_blocks_in_workers(output_path, block_args, draw_args, max_workers)
+    else:
+        with SharedArrays({"stops": stops}) as shared_arrays:
+            _draw_blocks_in_workers(
+                shared_arrays.descriptors["stops"], block_args, draw_args, max_workers
+            )
+            arrays, blocks = attach_arrays(shared_arrays.descriptors)
+            stops[...] = arrays["stops"]
+            del arrays
+            for block in blocks:
+                block.close()
+
+    random_generator = np.random.default_rng(location_seed)
+    if dense:
+        cells = random_generator.permutation(n_cells)[:n]
+        stops[:, 0] = cells // span + min_coordinate
+        stops[:, 1] = cells % span + min_coordinate
+    else:
+        _replace_duplicate_locations(stops, random_generator, min_coordinate, span)
+
+    if output_path is not None:
+        stops.flush()
+    logger.info(f"Generated {n} stops in {n_blocks} blocks")
+
+    return stops
+
+
+def _draw_block(
+    stops: np.ndarray,
+    start: int,
+    length: int,
+    block_seed: np.random.SeedSequence,
+    n_cells: int,
+    span: int,
+    min_coordinate: int,
+    min_size: int,
+    max_size: int,
+    draw_locations: bool,
+):
+    """
+    Draws the rows start to start + length of generate_stops_parallel from the block stream
+    """
+    random_generator = np.random.default_rng(block_seed)
+    rows = stops[start : start + length]
+    if draw_locations:
+        cells = random_generator.integers(0, n_cells, size=length)
+        rows[:, 0] = cells // span + min_coordinate
+        rows[:, 1] = cells % span + min_coordinate
+    rows[:, 2] = random_generator.random(length) * max_size + min_size
+
+
+def _draw_blocks_in_workers(
+    output: Union[str, SharedArrayDescriptor],
+    block_args: List[Tuple],
+    draw_args: Tuple,
+    max_workers: int,
+):
+    """
+    Draws every block in a process pool, see _draw_shared_block
+    """
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [
+            executor.submit(_draw_shared_block, output, *args, *draw_args)
+            for args in block_args
+        ]
+        for future in futures:
+            future.result()
+
+
+def _draw_shared_block(output: Union[str, SharedArrayDescriptor], *args):
+    """
+    Draws a block in a worker process into the output .npy file or shared memory
+    """
+    if isinstance(output, str):
+        stops = np.load(output, mmap_mode="r+")
+        _draw_block(stops, *args)
+        stops.flush()
+        return
+
+    arrays, blocks = attach_arrays({"stops": output})
+    try:
+        _draw_block(arrays["stops"], *args)
+    finally:
+        del arrays
+        for block in blocks:
+            block.close()
+
+
+def _replace_duplicate_locations(
+    stops: np.ndarray,
+    random_generator: np.random.Generator,
+    min_coordinate: int,
+    span: int,
+):
+    """
+    Gives every row whose location appeared in an earlier row a new location
+    that is in no other row
+    """
+    cells = (stops[:, 0].astype(np.int64) - min_coordinate) * span + (
+        stops[:, 1].astype(np.int64) - min_coordinate
+    )
+    # a plain sort finds the few repeated cells, only their rows are looked at again
+    sorted_cells = np.sort(cells)
+    is_repeat = sorted_cells[1:] == sorted_cells[:-1]
+    if not is_repeat.any():
+        return
+    used_cells = sorted_cells[np.concatenate([[True], ~is_repeat])]
+    repeated_cells = np.unique(sorted_cells[1:][is_repeat])
+
+    positions = np.minimum(
+        np.searchsorted(repeated_cells, cells), len(repeated_cells) - 1
+    )
+    candidate_rows = np.flatnonzero(repeated_cells[positions] == cells)
+    is_duplicate = np.ones(len(candidate_rows), dtype=bool)
+    is_duplicate[np.unique(cells[candidate_rows], return_index=True)[1]] = False
+    duplicate_rows = candidate_rows[is_duplicate]
+
+    new_cells = np.zeros(0, dtype=np.int64)
+    while len(new_cells) < len(duplicate_rows):
+        n_missing = len(duplicate_rows) - len(new_cells)
+        candidates = random_generator.integers(
+            0, span**2, size=int(n_missing * REJECTION_OVERSAMPLING) + 1
+        )
+        positions = np.minimum(
+            np.searchsorted(used_cells, candidates), len(used_cells) - 1
+        )
+        candidates = candidates[used_cells[positions] != candidates]
+
+        new_cells = np.concatenate([new_cells, candidates])
+        _, first_occurrence = np.unique(new_cells, return_index=True)
+        new_cells = new_cells[np.sort(first_occurrence)]
+
+    new_cells = new_cells[: len(duplicate_rows)]
+    stops[duplicate_rows, 0] = new_cells // span + min_coordinate
+    stops[duplicate_rows, 1] = new_cells % span + min_coordinate
+    logger.info(f"Drew {len(duplicate_rows)} duplicate locations again")
+
+
+def _draw_distinct_cells(
+    random_state: np.random.RandomState,
+    n: int,
+    n_cells: int,
+    used_cells: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Draws n distinct linear cell indices out of n_cells, skipping the used cells if given.
+    Duplicates keep their first occurrence so the result follows the drawing order.
+    """
+    if used_cells is None and n >= n_cells * DENSE_PLANE_FRACTION:
+        return random_state.permutation(n_cells)[:n]
+
+    cells = np.zeros(0, dtype=np.int64)
+    while len(cells) < n:
+        n_missing = n - len(cells)
+        candidates = random_state.randint(
+            0, n_cells, size=int(n_missing * REJECTION_OVERSAMPLING) + 1
+        )
+        if used_cells is not None:
+            candidates = candidates[~used_cells[candidates]]
+
+        cells = np.concatenate([cells, candidates])
+        _, first_occurrence = np.unique(cells, return_index=True)
+        cells = cells[np.sort(first_occurrence)]
+
+    return cells[:n]
+
+
+def _cells_to_stops(
+    cells: np.ndarray, sizes: np.ndarray, min_coordinate: int, span: int
+) -> np.ndarray:
+    """
+    Turns linear cell indices and sizes into rows of [x, y, size]
+    """
+    return np.column_stack(
+        [cells // span + min_coordinate, cells % span + min_coordinate, sizes]
+    ).astype(np.float64)
+
+
+def _generate_stops_legacy(
+    random_state: np.random.RandomState,
+    n: int,
+    min_coordinate: int,
+    max_coordinate: int,
+    min_size: int,
+    max_size: int,
+) -> np.ndarray:
+    """
+    The original generator: draws n locations, keeps the sorted unique ones
+    and tops them up one location at a time. The used locations are kept in a set
+    so the top up is linear, the random draws are the same as they always were.
+    """
     random_stops = random_state.randint(
         low=min_coordinate, high=max_coordinate, size=(n, 2)
     )
     random_sizes = random_state.random_sample(size=(1, n)) * max_size + min_size
 
     unique_stops = np.unique(random_stops, axis=0)
-    n_missing_stops = n - len(unique_stops)
+    used_locations = set(map(tuple, unique_stops.tolist()))
+    new_stops = []
 
-    while n_missing_stops > 0:
+    while len(used_locations) < n:
         new_stop = random_state.randint(
             low=min_coordinate, high=max_coordinate, size=(1, 2)
         )
-        stop_exists = any(np.array_equal(stop, new_stop[0]) for stop in unique_stops)
-        if not stop_exists:
-            unique_stops = np.concatenate([unique_stops, new_stop])
-            n_missing_stops -= 1
+        location = (int(new_stop[0, 0]), int(new_stop[0, 1]))
+        if location not in used_locations:
+            used_locations.add(location)
+            new_stops.append(new_stop)
+
+    unique_stops = np.concatenate([unique_stops, *new_stops])
 
     stops_with_sizes_transposed = np.concatenate([unique_stops.T, random_sizes])
     stops_with_sizes = stops_with_sizes_transposed.T
@@ -19,6 +19,7 @@ setup(
         "pytest",
         "pre-commit",
     ],
+    extras_require={"parquet": ["pyarrow"]},
     tests_require=["pytest", "pytest-cov", "teamcity-messages"],
     python_requires=">=3.11",
 )